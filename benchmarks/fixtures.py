@@ -0,0 +1,121 @@
+import os
+
+from libs.jinja.template_files import find_templates
+
+
+class StubSecretsClient:
+    """
+    In-memory stand-in of the Secrets Manager client, answering get_secret_value without any network
+    round trip
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_secret_value(self, SecretId, **kwargs):
+        self.calls += 1
+        return {
+            "ARN": f"arn:aws:secretsmanager:us-east-2:123456789012:secret:{SecretId}",
+            "Name": SecretId,
+            "SecretString": f"value-of-{SecretId}",
+        }
+
+
+def generate_values_file(path, num_keys):
+    """
+    Writes a jinja values file whose common section holds num_keys keys
+    :param path: Path of the values file
+    :param num_keys: Number of keys of the common section
+    :return: Path of the values file
+    """
+    with open(path, "w") as f:
+        f.write("common:\n")
+        f.write("  env: {{ env }}\n")
+        f.write("  vpc_id: %%AWS_ENV_VARS_VPC_ID\n")
+        f.write("  tags:\n    key: Name\n    name: bench-{{ env }}\n")
+        f.write("  settings:\n")
+        for index in range(num_keys):
+            f.write(f"    key_{index}: value-{index}-{{{{ env }}}}\n")
+    return path
+
+
+def generate_jinja_templates(directory, num_templates, loop_size, num_includes):
+    """
+    Writes request templates looping over the values and including partial templates
+    :param directory: Directory of the templates
+    :param num_templates: Number of templates
+    :param loop_size: Number of iterations of the loop of every template
+    :param num_includes: Number of partials included by every template
+    :return: List of (template file, output file name)
+    """
+    os.makedirs(directory, exist_ok=True)
+    for index in range(num_includes):
+        with open(os.path.join(directory, f"_partial_{index}.j2"), "w") as f:
+            f.write(f"- Name: partial-{index}\n  Env: {{{{ inputs.env }}}}\n")
+    for index in range(num_templates):
+        with open(os.path.join(directory, f"request_{index}.yaml.jinja2"), "w") as f:
+            f.write(f"{{% for i in range({loop_size}) %}}\n")
+            f.write("- CidrBlock: 10.{{ i % 255 }}.0.0/16\n")
+            f.write("  VpcId: {{ inputs.vpc_id }}\n")
+            f.write("  Value: {{ inputs.settings['key_' ~ (i % 100)] }}\n")
+            f.write("{% endfor %}\n")
+            for include in range(num_includes):
+                f.write(f'{{% include "_partial_{include}.j2" %}}\n')
+    return find_templates([directory])
+
+
+def generate_j2props_fixture(directory, num_secrets, num_plain_keys=100):
+    """
+    Writes a j2props values file and a properties template referencing num_secrets secrets, each
+    one through both the awssecret and awssecretarn filters
+    :param directory: Directory of the fixture files
+    :param num_secrets: Number of secrets referenced by the template
+    :param num_plain_keys: Number of keys rendered without any secret lookup
+    :return: (values file, template file)
+    """
+    os.makedirs(directory, exist_ok=True)
+    values_file = os.path.join(directory, "input.yml")
+    template_file = os.path.join(directory, "application.properties")
+    with open(values_file, "w") as f:
+        f.write("app:\n  secrets:\n")
+        for index in range(num_secrets):
+            f.write(f"    secret_{index}: bench/app/secret-{index}\n")
+        f.write("  plain:\n")
+        for index in range(num_plain_keys):
+            f.write(f"    key_{index}: value-{index}\n")
+    with open(template_file, "w") as f:
+        for index in range(num_secrets):
+            f.write(
+                f"secret.{index}={{{{ app.secrets.secret_{index} | awssecret }}}}\n"
+            )
+            f.write(
+                f"secret.{index}.arn={{{{ app.secrets.secret_{index} | awssecretarn }}}}\n"
+            )
+        for index in range(num_plain_keys):
+            f.write(f"plain.{index}={{{{ app.plain.key_{index} }}}}\n")
+    return values_file, template_file
+
+
+def generate_terraform_tree(directory, num_modules, fan_out=10):
+    """
+    Writes a tree of terraform modules, every module being a directory with a main.tf. A hidden
+    .terraform directory of cached modules is added at every level.
+    :param directory: Root directory of the tree
+    :param num_modules: Number of modules of the tree
+    :param fan_out: Number of sub-modules of every module
+    :return: Root directory of the tree
+    """
+    pending = [directory]
+    created = 0
+    while pending and created < num_modules:
+        module = pending.pop(0)
+        os.makedirs(os.path.join(module, ".terraform", "cached"), exist_ok=True)
+        for path in (module, os.path.join(module, ".terraform", "cached")):
+            with open(os.path.join(path, "main.tf"), "w") as f:
+                f.write("")
+        created += 1
+        pending.extend(
+            os.path.join(module, "modules", f"module_{index}")
+            for index in range(fan_out)
+        )
+    return directory
@@ -0,0 +1,231 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks import fixtures
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+# Metrics compared against the baseline, with the direction of a regression
+HIGHER_IS_WORSE = ["p50_ms", "p99_ms", "peak_rss_kb"]
+LOWER_IS_WORSE = ["throughput_per_s"]
+
+
+# Benchmarks, run in a fresh process each so that the peak RSS is their own
+
+
+def bench_jinja_render(fixture_dir, iterations, scale):
+    from libs.jinja.jinja_utils import JinjaTemplate
+
+    values_file = fixtures.generate_values_file(
+        os.path.join(fixture_dir, "values.yaml"), 5000 * scale
+    )
+    templates = fixtures.generate_jinja_templates(
+        os.path.join(fixture_dir, "templates"),
+        num_templates=12,
+        loop_size=500 * scale,
+        num_includes=5,
+    )
+    jinja_template = JinjaTemplate(values_file, "qa")
+
+    def operation(index):
+        template_file, _ = templates[index % len(templates)]
+        jinja_template.generate_from_template(
+            template_file,
+            "json",
+            print_output=False,
+            dynamic_vars={"AWS_ENV_VARS_VPC_ID": f"vpc-{index % 3}"},
+        )
+
+    return _measure(operation, iterations)
+
+
+def bench_j2props_render(fixture_dir, iterations, scale):
+    from libs.j2props.j2props_utils import J2PropsTemplate
+
+    values_file, template_file = fixtures.generate_j2props_fixture(
+        os.path.join(fixture_dir, "j2props"), num_secrets=300 * scale
+    )
+    j2props_template = J2PropsTemplate()
+    j2props_template._aws_client = fixtures.StubSecretsClient()
+
+    def operation(index):
+        j2props_template.render_from_template(values_file, template_file)
+
+    return _measure(operation, iterations)
+
+
+def bench_module_search(fixture_dir, iterations, scale):
+    from libs.terraform.module_search import module_search
+
+    root = fixtures.generate_terraform_tree(
+        os.path.join(fixture_dir, "terraform"), num_modules=10000 * scale
+    )
+
+    def operation(index):
+        module_search(root)
+
+    return _measure(operation, max(iterations // 10, 3))
+
+
+BENCHMARKS = {
+    "jinja_render": bench_jinja_render,
+    "j2props_render": bench_j2props_render,
+    "module_search": bench_module_search,
+}
+
+
+def _measure(operation, iterations, warmup=3):
+    for index in range(warmup):
+        operation(index)
+    latencies = []
+    start = time.perf_counter()
+    for index in range(iterations):
+        operation_start = time.perf_counter()
+        operation(index)
+        latencies.append(time.perf_counter() - operation_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "throughput_per_s": iterations / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _percentile(sorted_values, percent):
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+def _run_in_child(name, iterations, scale, queue):
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        queue.put(BENCHMARKS[name](fixture_dir, iterations, scale))
+
+
+def run_benchmark(name, iterations, scale):
+    """
+    Runs a benchmark in a fresh interpreter
+    :param name: Name of the benchmark
+    :param iterations: Number of measured operations
+    :param scale: Multiplier of the fixture sizes
+    :return: Dictionary of the measured metrics
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=_run_in_child, args=(name, iterations, scale, queue)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the results with the baseline
+    :param results: Dictionary of the metrics of every benchmark
+    :param baseline: Dictionary of the baseline metrics of every benchmark
+    :param threshold: Relative change of a metric considered as a regression, e.g. 0.25
+    :return: List of the regressions as (benchmark, metric, baseline value, value)
+    """
+    regressions = []
+    for name, metrics in results.items():
+        baseline_metrics = baseline.get(name)
+        if not baseline_metrics:
+            continue
+        for metric in HIGHER_IS_WORSE:
+            if metrics[metric] > baseline_metrics[metric] * (1 + threshold):
+                regressions.append(
+                    (name, metric, baseline_metrics[metric], metrics[metric])
+                )
+        for metric in LOWER_IS_WORSE:
+            if metrics[metric] < baseline_metrics[metric] * (1 - threshold):
+                regressions.append(
+                    (name, metric, baseline_metrics[metric], metrics[metric])
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the jinja and j2props renders and of the module search"
+    )
+    parser.add_argument(
+        "--benchmark",
+        "-b",
+        action="append",
+        choices=list(BENCHMARKS),
+        help="Benchmark to run, all of them by default",
+    )
+    parser.add_argument(
+        "--iterations", "-n", type=int, default=50, help="Measured operations"
+    )
+    parser.add_argument(
+        "--scale", type=int, default=1, help="Multiplier of the fixture sizes"
+    )
+    parser.add_argument(
+        "--output", "-o", type=str, help="Path of the json file of the results"
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=DEFAULT_BASELINE,
+        help="Path of the json file of the baseline results",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Stores the results as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Relative change of a metric considered as a regression",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.benchmark or list(BENCHMARKS):
+        results[name] = run_benchmark(name, args.iterations, args.scale)
+        metrics = results[name]
+        print(
+            f"{name:16} {metrics['throughput_per_s']:10.1f} ops/s "
+            f"p50 {metrics['p50_ms']:9.2f} ms  p99 {metrics['p99_ms']:9.2f} ms  "
+            f"peak RSS {metrics['peak_rss_kb'] / 1024:8.1f} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        return
+    if not os.path.isfile(args.baseline):
+        print(f"No baseline found at {args.baseline}, skipping the comparison")
+        return
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, baseline_value, value in regressions:
+        print(
+            f"REGRESSION {name} {metric}: {baseline_value:.2f} -> {value:.2f}",
+            file=sys.stderr,
+        )
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,30 @@ from libs import get_logger
 from libs.aws_command import AWSCommand
 from libs.j2props_command import J2PropsCommand
 from libs.jinja_command import JinjaCommand
+from libs.profiling import enable_profiling, write_profile
+from libs.serve_command import ServeCommand
 
 logger = get_logger(__name__)
 
 
-def main():
+def create_parser():
     parser = argparse.ArgumentParser(
         description="Automation Helper", add_help=True, prog="magicdust"
     )
+    parser.add_argument(
+        "--server",
+        required=False,
+        type=str,
+        help="Path of the socket of a magicdust serve process to forward the "
+        "jinja and j2props renders to",
+    )
+    parser.add_argument(
+        "--profile",
+        required=False,
+        type=str,
+        help="Path of a Chrome trace-event json file where the timings of the phases of the run "
+        "are written. A summary table is printed on stderr.",
+    )
     command_parsers = parser.add_subparsers(
         dest="command", title="command", help="Sub commands for the main cli"
     )
@@ -25,15 +41,39 @@ def main():
     # Load j2props parser
     J2PropsCommand.create_parser_in(command_parsers)
 
+    # Load serve parser
+    ServeCommand.create_parser_in(command_parsers)
+    return parser
+
+
+def main():
+    parser = create_parser()
     args = parser.parse_args()
-    if args.command == AWSCommand.command:
-        AWSCommand(args, logger)
-    elif args.command == JinjaCommand.command:
-        JinjaCommand(args)
-    elif args.command == J2PropsCommand.command:
-        J2PropsCommand(args)
-    else:
-        parser.print_help()
+    if args.profile:
+        enable_profiling()
+    # The commands exit with sys.exit, so the profile is written on the way out
+    try:
+        if args.server and args.command == JinjaCommand.command:
+            ServeCommand.forward(
+                args.server, JinjaCommand.server_request(args), args.out
+            )
+        elif args.server and args.command == J2PropsCommand.command:
+            ServeCommand.forward(
+                args.server, J2PropsCommand.server_request(args), args.out
+            )
+        elif args.command == AWSCommand.command:
+            AWSCommand(args, logger)
+        elif args.command == JinjaCommand.command:
+            JinjaCommand(args)
+        elif args.command == J2PropsCommand.command:
+            J2PropsCommand(args)
+        elif args.command == ServeCommand.command:
+            ServeCommand(args, logger)
+        else:
+            parser.print_help()
+    finally:
+        if args.profile:
+            write_profile(args.profile)
 
 
 if __name__ == "__main__":
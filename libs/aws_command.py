@@ -1,12 +1,30 @@
 import os
 
-import libs.boto3.ecs_fargate_infra as ecs_fargate
+# Defaults of the shared boto3 clients, kept here so that the parser does not import boto3
+DEFAULT_MAX_POOL_CONNECTIONS = 25
+DEFAULT_RETRY_MODE = "standard"
+RETRY_MODES = ["legacy", "standard", "adaptive"]
+DEFAULT_MAX_PARALLEL = 4
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+INVENTORY_DIR_ENV_VAR = "MAGICDUST_INVENTORY_DIR"
 
 
 class AWSCommand:
     command = "aws"
 
     def __init__(self, args, logger):
+        # The implementation and boto3 are only imported once the command is selected
+        import libs.boto3.ecs_fargate_infra as ecs_fargate
+        from libs.boto3.clients import configure_clients
+        from libs.boto3.fan_out import configure_fan_out
+
+        configure_clients(
+            max_pool_connections=args.max_pool_connections,
+            retry_mode=args.retry_mode,
+            region=args.region,
+            profile=args.aws_profile,
+        )
+        configure_fan_out(args.max_concurrent_requests)
         if args.infra_name == "ecs-fargate":
             if not os.path.exists(args.templates_dir):
                 raise FileNotFoundError(
@@ -18,12 +36,34 @@ class AWSCommand:
             if args.action == "create":
                 logger.info("Will create the infra structure")
                 ecs_fargate.create(
-                    args.values, args.environment_type, args.templates_dir
+                    args.values,
+                    args.environment_type,
+                    args.templates_dir,
+                    args.resume,
+                    args.max_parallel,
+                    args.inventory_dir,
+                    args.inventory_ttl,
                 )
             elif args.action == "destroy":
                 logger.info("Will delete the infrastructure")
                 ecs_fargate.destroy(
-                    args.values, args.environment_type, args.templates_dir, args.dry_run
+                    args.values,
+                    args.environment_type,
+                    args.templates_dir,
+                    args.dry_run,
+                    args.max_parallel,
+                    args.inventory_dir,
+                    args.inventory_ttl,
+                )
+            elif args.action in ["plan", "apply"]:
+                ecs_fargate.plan(
+                    args.values,
+                    args.environment_type,
+                    args.templates_dir,
+                    args.action == "apply",
+                    args.max_parallel,
+                    args.inventory_dir,
+                    args.inventory_ttl,
                 )
             else:
                 logger.info(f"invalid action: {args.action}")
@@ -42,8 +82,9 @@ class AWSCommand:
         parser.add_argument(
             "action",
             type=str,
-            choices=["create", "destroy"],
-            help="Choose between create or destroy",
+            choices=["create", "destroy", "plan", "apply"],
+            help="Choose between create, destroy, plan or apply. plan prints the changes "
+            "between the templates and the existing infrastructure, apply makes them",
         )
         parser.add_argument(
             "--environment-type",
@@ -72,4 +113,67 @@ class AWSCommand:
             action="store_true",
             help="Dry run for delete action",
         )
+        parser.add_argument(
+            "--resume",
+            required=False,
+            action="store_true",
+            help="Resumes a failed create: the resources created by the previous run are "
+            "found by tag and the steps which created them are skipped",
+        )
+        parser.add_argument(
+            "--max-parallel",
+            required=False,
+            type=int,
+            default=DEFAULT_MAX_PARALLEL,
+            help="Maximum number of independent steps running concurrently",
+        )
+        parser.add_argument(
+            "--max-concurrent-requests",
+            required=False,
+            type=int,
+            default=DEFAULT_MAX_CONCURRENT_REQUESTS,
+            help="Maximum number of requests of a step running concurrently, e.g. the "
+            "subnets or the listeners created from a template",
+        )
+        parser.add_argument(
+            "--inventory-dir",
+            required=False,
+            type=str,
+            help="Directory of the inventory of the created and discovered resources, which "
+            f"spares their lookup by tag. Defaults to ${INVENTORY_DIR_ENV_VAR}",
+        )
+        parser.add_argument(
+            "--inventory-ttl",
+            required=False,
+            type=int,
+            help="Number of seconds the resources are read from the inventory, defaults to 3600",
+        )
+        parser.add_argument(
+            "--region",
+            required=False,
+            type=str,
+            help="AWS region of the infrastructure, defaults to the region of the profile",
+        )
+        parser.add_argument(
+            "--aws-profile",
+            dest="aws_profile",
+            required=False,
+            type=str,
+            help="AWS profile, defaults to the default credentials chain",
+        )
+        parser.add_argument(
+            "--max-pool-connections",
+            required=False,
+            type=int,
+            default=DEFAULT_MAX_POOL_CONNECTIONS,
+            help="Maximum number of connections kept open by every AWS client",
+        )
+        parser.add_argument(
+            "--retry-mode",
+            required=False,
+            type=str,
+            default=DEFAULT_RETRY_MODE,
+            choices=RETRY_MODES,
+            help="Retry mode of the AWS clients",
+        )
         return parser
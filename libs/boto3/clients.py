@@ -0,0 +1,138 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+from libs.profiling import instrument_client
+
+DEFAULT_MAX_POOL_CONNECTIONS = 25
+DEFAULT_RETRY_MODE = "standard"
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_MODES = ["legacy", "standard", "adaptive"]
+
+_client_registry = None
+_client_registry_lock = threading.Lock()
+
+
+class ClientRegistry:
+    """
+    Registry of the boto3 clients shared by the whole process. A client is built once per service,
+    region and profile, from one session per profile, and keeps its pool of connections for all the
+    calls of the run.
+    """
+
+    def __init__(
+        self,
+        max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retry_mode=DEFAULT_RETRY_MODE,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        region=None,
+        profile=None,
+    ):
+        self.region = region
+        self.profile = profile
+        self.config = _client_config(
+            max_pool_connections, tcp_keepalive, retry_mode, max_attempts
+        )
+        self.sessions = {}
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def client(self, service, region=None, profile=None):
+        """
+        Returns the client of a service, creating it on first use
+        :param service: Name of the AWS service, e.g. ec2
+        :param region: AWS region, defaults to the region of the registry or of the profile
+        :param profile: AWS profile, defaults to the profile of the registry or to the default
+                        credentials chain
+        :return: boto3 client
+        """
+        region = region or self.region
+        profile = profile or self.profile
+        key = (service, region, profile)
+        client = self.clients.get(key)
+        if client is not None:
+            return client
+        # Sessions are not thread safe, so the clients are built one at a time
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                session = self.sessions.get(profile)
+                if session is None:
+                    session = boto3.session.Session(profile_name=profile)
+                    self.sessions[profile] = session
+                client = instrument_client(
+                    session.client(service, region_name=region, config=self.config)
+                )
+                self.clients[key] = client
+        return client
+
+    def clear(self):
+        with self.lock:
+            self.clients.clear()
+            self.sessions.clear()
+
+
+def _client_config(max_pool_connections, tcp_keepalive, retry_mode, max_attempts):
+    options = {
+        "max_pool_connections": max_pool_connections,
+        "retries": {"mode": retry_mode, "total_max_attempts": max_attempts},
+    }
+    try:
+        return Config(tcp_keepalive=tcp_keepalive, **options)
+    except TypeError:
+        # tcp_keepalive is only supported by botocore 1.27 and later
+        return Config(**options)
+
+
+def configure_clients(
+    max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    retry_mode=DEFAULT_RETRY_MODE,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+    region=None,
+    profile=None,
+):
+    """
+    Replaces the shared client registry, e.g. to size the connection pools for a number of threads
+    :param max_pool_connections: Maximum number of connections kept open by every client
+    :param tcp_keepalive: Flag whether to enable the TCP keep-alive of the connections
+    :param retry_mode: Retry mode of botocore: legacy, standard or adaptive
+    :param max_attempts: Maximum number of attempts of a call, retries included
+    :param region: Default AWS region of the clients
+    :param profile: Default AWS profile of the clients
+    :return: ClientRegistry
+    """
+    global _client_registry
+    with _client_registry_lock:
+        _client_registry = ClientRegistry(
+            max_pool_connections,
+            tcp_keepalive,
+            retry_mode,
+            max_attempts,
+            region,
+            profile,
+        )
+    return _client_registry
+
+
+def get_client_registry():
+    """
+    Returns the shared client registry, creating it with the default settings on first use
+    :return: ClientRegistry
+    """
+    if _client_registry is None:
+        return configure_clients()
+    return _client_registry
+
+
+def get_client(service, region=None, profile=None):
+    """
+    Returns the shared client of a service
+    :param service: Name of the AWS service, e.g. ec2
+    :param region: AWS region, defaults to the region of the registry or of the profile
+    :param profile: AWS profile, defaults to the profile of the registry
+    :return: boto3 client
+    """
+    return get_client_registry().client(service, region, profile)
@@ -1,13 +1,31 @@
+import functools
+import inspect
 import os
 import time
 
-import boto3
 from botocore.exceptions import ClientError, ParamValidationError
 
 from libs import get_logger
+from libs.boto3.clients import get_client
+from libs.boto3.fan_out import FanOutError, fan_out
+from libs.boto3.retry_policy import (
+    MAX_RETRIES,
+    RETRY_DEADLINE,
+    RETRY_DELAY,
+    RetryPolicy,
+)
+from libs.boto3.tag_discovery import (
+    ECS_CLUSTER,
+    LOAD_BALANCER,
+    TARGET_GROUP,
+    VPC,
+    TagDiscovery,
+)
+from libs.profiling import span
 
-MAX_RETRIES = 5
-RETRY_DELAY = 5
+# Polling of the botocore waiters
+WAITER_DELAY = 5
+WAITER_MAX_ATTEMPTS = 60
 
 logger = get_logger(__name__)
 
@@ -15,36 +33,70 @@ logger = get_logger(__name__)
 def retry(function_name):
     """
     This function is used as a decorator around any function which would implement retry logic
-    The target function would simply annotate itself with @retry annotation
+    The target function would simply annotate itself with @retry annotation. Its max_retries, delay
+    and deadline arguments, defaults included, override the ones of the RetryPolicy for every call.
     :param function_name: Name of the function which is annotated with @retry
     :return: The return value of the annotating function
     """
+    signature = inspect.signature(function_name)
+    overrides = {
+        "max_retries": "max_retries",
+        "delay": "base_delay",
+        "deadline": "deadline",
+    }
 
+    @functools.wraps(function_name)
     def inner(*args, **kwargs):
-        max_retries = kwargs.get("max_retries") or MAX_RETRIES
-        delay = kwargs.get("delay") or RETRY_DELAY
-        for num_retry in range(MAX_RETRIES):
-            try:
-                return function_name(*args)
-            except ClientError as e:
-                logger.warn(
-                    f"Attempt: {num_retry + 2}: Resources might be busy. Trying again after {delay} seconds"
-                )
-                time.sleep(delay)
-                if num_retry == max_retries - 1:
-                    raise Exception(f"Maximum retries exceeded: {e}")
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        policy = RetryPolicy(
+            **{
+                option: arguments.arguments[argument]
+                for argument, option in overrides.items()
+                if arguments.arguments.get(argument) is not None
+            }
+        )
+        return policy.call(function_name.__name__, function_name, *args, **kwargs)
 
     return inner
 
 
+def present_ids(resource_ids):
+    return [resource_id for resource_id in resource_ids if resource_id]
+
+
 class BotoAws:
     def __init__(self, jinja_template, templates_base_dir, resource_type):
-        self.client = boto3.client(resource_type)
+        # The clients are shared by all the instances of the process
+        self.client = get_client(resource_type)
         self.jinja_template = jinja_template
         self.jinja_template.process_input_yaml()
         self.input_values_dict = self.jinja_template.input_values_dict
         self.templates_base_dir = templates_base_dir
         self.resource_type = resource_type
+        # StackContext of the resources created so far, whose IDs every template may reference
+        self.stack_context = None
+
+    @property
+    def tag_discovery(self):
+        """
+        :return: TagDiscovery of the resources tagged with the tag of the stack
+        """
+        tags = self.input_values_dict.get("tags")
+        return TagDiscovery(tags.get("key"), tags.get("name"))
+
+    def render_request(self, template_file, dynamic_vars=None):
+        """
+        Renders a request template with the dynamic variables of the resources of the stack, as
+        well as the given ones
+        :param template_file: The jinja template of the request
+        :param dynamic_vars: Dictionary of the dynamic variables of the request
+        :return: Dictionary or list of the request
+        """
+        stack_vars = self.stack_context.dynamic_vars() if self.stack_context else {}
+        return self.jinja_template.render_to_object(
+            template_file, dynamic_vars={**stack_vars, **(dynamic_vars or {})}
+        )
 
     def get_template(self, template_file_path, template_name):
         if not template_file_path:
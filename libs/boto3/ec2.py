@@ -1,10 +1,16 @@
-import json
+import functools
 import os
 import time
 
 from libs.boto3.common import *
+from libs.boto3.stack_context import StackContext
 
 AWS_RESOURCE_TYPE = "ec2"
+ENI_DRAIN_DELAY = 5
+ENI_DRAIN_TIMEOUT = 600
+# Descriptions of the network interfaces AWS releases asynchronously once the load balancers and the
+# tasks are deleted, e.g. "ELB app/name/id" and "arn:aws:ecs:region:account:attachment/id"
+ENI_DRAIN_DESCRIPTIONS = ["ELB *", "arn:aws:ecs:*"]
 
 
 class BotoEc2(BotoAws):
@@ -20,33 +26,50 @@ class BotoEc2(BotoAws):
 
     # Public functions
 
-    def create_and_configure_vpc(self):
+    def create_and_configure_vpc(self, context=None):
         """
         Creates and configures VPC resources: Subnets, Route Table, Internet Gateway, Security Groups with
         Ingress Rules
-        :return: None
+        :param context: StackContext where the IDs of the created resources are recorded
+        :return: The StackContext
         """
-        vpc_id = self.create_vpc()
-        subnet_ids = self.create_subnets_for_vpc(vpc_id)
-        self.configure_vpc(vpc_id, subnet_ids)
-        sg_id = self.create_security_group(vpc_id)
-        self.create_security_group_ingress(sg_id)
+        if context is None:
+            context = StackContext()
+        context.vpc_id = self.create_vpc()
+        context.subnet_ids = self.create_subnets_for_vpc(context.vpc_id)
+        context.internet_gateway_id, context.route_table_id = self.configure_vpc(
+            context.vpc_id, context.subnet_ids
+        )
+        context.security_group_id = self.create_security_group(context.vpc_id)
+        self.create_security_group_ingress(context.security_group_id)
+        return context
 
-    def delete_vpc(self, dry_run=True):
+    def delete_vpc(self, dry_run=True, context=None):
         """
         Deletes VPC along with all its resources like Subnets, Internet Gateways, Security Groups etc.
+        The network interfaces left by the load balancers and the tasks are awaited first, then the
+        sibling resources are deleted concurrently and the VPC last.
         :param dry_run: If set, will not delete the resources, only self.logger.info the resources to be deleted
+        :param context: StackContext of the resources, which are looked up by tag when not given
         :return: None
         """
         try:
-            vpc_ids = self.find_vpcs_by_tag()
+            if context is not None:
+                vpc_ids = [context.vpc_id] if context.vpc_id else []
+            else:
+                vpc_ids = self.find_vpcs_by_tag()
             if not vpc_ids:
                 raise ValueError("No VPC found for the provided tag")
             # At most 1 vpc will be found
             vpc_id = vpc_ids[0]
-            subnet_ids = self.get_subnets_by_vpc_id(vpc_id)
-            igt_ids = self.get_internet_gateways_by_vpc_id(vpc_id)
-            sg_ids = self.get_security_groups_by_vpc_id(vpc_id)
+            if context is not None:
+                subnet_ids = context.subnet_ids
+                igt_ids = present_ids([context.internet_gateway_id])
+                sg_ids = present_ids([context.security_group_id])
+            else:
+                subnet_ids = self.get_subnets_by_vpc_id(vpc_id)
+                igt_ids = self.get_internet_gateways_by_vpc_id(vpc_id)
+                sg_ids = self.get_security_groups_by_vpc_id(vpc_id)
             self.logger.info(
                 f"Following resources are going to be deleted\n"
                 f"\tSecurity Groups: {sg_ids}\n"
@@ -55,18 +78,26 @@ class BotoEc2(BotoAws):
                 f"\tVPC: {vpc_ids}\n"
             )
             if not dry_run:
-                for sg_id in sg_ids:
-                    self.logger.info(f"Deleting Security Group with ID: {sg_id}")
-                    self.delete_security_group_by_id(sg_id)
-                for subnet_id in subnet_ids:
-                    self.logger.info(f"Deleting Subnet with ID: {subnet_id}")
-                    self.delete_subnet_by_id(subnet_id)
-                for igt_id in igt_ids:
-                    self.client.detach_internet_gateway(
-                        InternetGatewayId=igt_id, VpcId=vpc_id
-                    )
-                    self.logger.info(f"Deleting Internet Gateway with ID: {igt_id}")
-                    self.delete_internet_gateway_by_id(igt_id, vpc_id)
+                # The subnets, security groups and public addresses are in use until then
+                self.wait_for_network_interfaces_released(vpc_id)
+                # The sibling resources are deleted together
+                fan_out(
+                    lambda delete: delete(),
+                    [
+                        functools.partial(self.delete_security_group_by_id, sg_id)
+                        for sg_id in sg_ids
+                    ]
+                    + [
+                        functools.partial(self.delete_subnet_by_id, subnet_id)
+                        for subnet_id in subnet_ids
+                    ]
+                    + [
+                        functools.partial(
+                            self.detach_and_delete_internet_gateway, igt_id, vpc_id
+                        )
+                        for igt_id in igt_ids
+                    ],
+                )
                 self.logger.info(f"Deleting VPC with ID: {vpc_id}")
                 self.delete_vpc_by_id(vpc_id)
             else:
@@ -77,18 +108,72 @@ class BotoEc2(BotoAws):
             raise e
 
     def find_vpcs_by_tag(self):
+        vpc_ids = []
+        try:
+            vpc_ids = self.tag_discovery.find(VPC)
+        except (KeyError, ClientError) as e:
+            self.logger.info(f"Exception occurred: {e}")
+        return vpc_ids
+
+    def describe_vpcs_by_tag(self):
+        """
+        Lists the VPCs with the tag of the stack with describe_vpcs, which, unlike the Resource
+        Groups Tagging API, reflects a VPC as soon as it is created or deleted
+        :return: List of the VPC Ids
+        """
         vpc_ids = []
         try:
             vpc_filter = {
                 "Name": f"tag:{self.input_values_dict.get('tags').get('key')}",
                 "Values": [self.input_values_dict.get("tags").get("name")],
             }
-            vpcs = self.client.describe_vpcs(Filters=[vpc_filter])
-            vpc_ids = [vpc.get("VpcId") for vpc in vpcs.get("Vpcs")]
-        except (KeyError, ClientError) as e:
+            pages = self.client.get_paginator("describe_vpcs").paginate(
+                Filters=[vpc_filter]
+            )
+            vpc_ids = [vpc.get("VpcId") for page in pages for vpc in page.get("Vpcs")]
+        except (AttributeError, ClientError) as e:
             self.logger.info(f"Exception occurred: {e}")
         return vpc_ids
 
+    def wait_for_network_interfaces_released(
+        self, vpc_id, delay=ENI_DRAIN_DELAY, timeout=ENI_DRAIN_TIMEOUT
+    ):
+        """
+        Polls the network interfaces of the load balancers and of the tasks of the VPC until they
+        are all released, which AWS does asynchronously once they are deleted. The other interfaces
+        are left to the deletes, which report what still uses the VPC.
+        :param vpc_id: The VPC Id
+        :param delay: Seconds between the polls
+        :param timeout: Seconds after which the remaining interfaces fail the delete
+        :return: None
+        :raises Exception: If interfaces are still in use after the timeout
+        """
+        deadline = time.monotonic() + timeout
+        with span("ec2.eni_drain", "waiter", vpc_id=vpc_id):
+            while True:
+                pages = self.client.get_paginator(
+                    "describe_network_interfaces"
+                ).paginate(
+                    Filters=[
+                        {"Name": "vpc-id", "Values": [vpc_id]},
+                        {"Name": "description", "Values": ENI_DRAIN_DESCRIPTIONS},
+                    ]
+                )
+                enis = {
+                    eni.get("NetworkInterfaceId"): eni.get("Description")
+                    for page in pages
+                    for eni in page.get("NetworkInterfaces")
+                }
+                if not enis:
+                    return
+                if time.monotonic() + delay > deadline:
+                    raise Exception(
+                        f"Network interfaces of the load balancers and the tasks of VPC "
+                        f"{vpc_id} still in use after {timeout} seconds: {enis}"
+                    )
+                self.logger.info(f"Waiting for the network interfaces: {sorted(enis)}")
+                time.sleep(delay)
+
     def get_internet_gateways_by_vpc_id(self, vpc_id):
         igt_ids = []
         if not vpc_id:
@@ -121,6 +206,46 @@ class BotoEc2(BotoAws):
             self.logger.info(f"Exception occurred while getting Security Groups: {e}")
         return sg_ids
 
+    def get_main_route_table_by_vpc_id(self, vpc_id):
+        if not vpc_id:
+            return None
+        try:
+            response = self.client.describe_route_tables(
+                Filters=[
+                    {"Name": "vpc-id", "Values": [vpc_id]},
+                    {"Name": "association.main", "Values": ["true"]},
+                ]
+            )
+            # There will be only 1 default route table
+            return response["RouteTables"][0]["RouteTableId"]
+        except (KeyError, IndexError, ClientError) as e:
+            self.logger.error(f"Exception while getting the route table: {e}")
+
+    def get_security_group_ingress(self, sg_id):
+        """
+        :param sg_id: The Security Group Id
+        :return: The IpPermissions of the ingress rules of the security group
+        """
+        try:
+            response = self.client.describe_security_groups(GroupIds=[sg_id])
+            return response["SecurityGroups"][0].get("IpPermissions", [])
+        except (KeyError, IndexError, ClientError) as e:
+            raise Exception(f"Exception while getting the ingress rules: {e}")
+
+    def get_subnet_details_by_vpc_id(self, vpc_id):
+        """
+        :param vpc_id: The VPC Id
+        :return: The descriptions of the subnets of the VPC, with their SubnetId, CidrBlock and
+                 AvailabilityZone
+        """
+        try:
+            pages = self.client.get_paginator("describe_subnets").paginate(
+                Filters=[{"Name": "vpc-id", "Values": [vpc_id]}]
+            )
+            return [subnet for page in pages for subnet in page.get("Subnets")]
+        except (KeyError, ClientError) as e:
+            raise Exception(f"Exception while getting subnets: {e}")
+
     def get_subnets_by_vpc_id(self, vpc_id):
         subnet_ids = []
         if not vpc_id:
@@ -142,7 +267,17 @@ class BotoEc2(BotoAws):
         Creates Internet Gateway, new routes and attaches with the subnets
         :param vpc_id: The VPC Id
         :param subnet_ids: The Subnet Ids
-        :return: None
+        :return: The Internet Gateway Id and the Route Table Id
+        """
+        igt_id, route_table_id = self.create_internet_gateway_route(vpc_id)
+        self.associate_subnets_with_route_table(route_table_id, subnet_ids)
+        return igt_id, route_table_id
+
+    def create_internet_gateway_route(self, vpc_id):
+        """
+        Creates an Internet Gateway attached to the VPC and routes the default route table to it
+        :param vpc_id: The VPC Id
+        :return: The Internet Gateway Id and the Route Table Id
         """
         try:
             response = self.client.create_internet_gateway()
@@ -150,15 +285,9 @@ class BotoEc2(BotoAws):
             self.logger.info(f"Internet Gateway: {igt_id} created")
             self.client.attach_internet_gateway(InternetGatewayId=igt_id, VpcId=vpc_id)
             self.logger.info(f"Internet gateway attached to VPC")
-            # Get the default Route table of the VPC
-            response = self.client.describe_route_tables(
-                Filters=[
-                    {"Name": "vpc-id", "Values": [vpc_id]},
-                    {"Name": "association.main", "Values": ["true"]},
-                ]
-            )
-            # There will be only 1 default route table
-            route_table_id = response["RouteTables"][0]["RouteTableId"]
+            route_table_id = self.get_main_route_table_by_vpc_id(vpc_id)
+            if not route_table_id:
+                raise KeyError(f"No main route table found for VPC: {vpc_id}")
             self.logger.info(f"Default route table id: {route_table_id}")
             self.client.create_route(
                 DestinationCidrBlock="0.0.0.0/0",
@@ -166,43 +295,61 @@ class BotoEc2(BotoAws):
                 RouteTableId=route_table_id,
             )
             self.logger.info(f"New route created for RouteTable: {route_table_id}")
-            for subnet_id in subnet_ids:
-                self.client.associate_route_table(
-                    RouteTableId=route_table_id, SubnetId=subnet_id
-                )
-                self.logger.info(f"Subnet: {subnet_id} associated with route table")
-            for subnet_id in subnet_ids:
-                self.client.modify_subnet_attribute(
-                    MapPublicIpOnLaunch={"Value": True}, SubnetId=subnet_id
-                )
+            return igt_id, route_table_id
         except (ClientError, KeyError) as e:
             raise Exception(e)
 
+    def associate_subnets_with_route_table(self, route_table_id, subnet_ids):
+        """
+        Associates the subnets with the route table and maps a public IP on launch in the subnets
+        :param route_table_id: The Route Table Id
+        :param subnet_ids: The Subnet Ids
+        :return: None
+        """
+
+        def associate(subnet_id):
+            self.client.associate_route_table(
+                RouteTableId=route_table_id, SubnetId=subnet_id
+            )
+            self.logger.info(f"Subnet: {subnet_id} associated with route table")
+            self.client.modify_subnet_attribute(
+                MapPublicIpOnLaunch={"Value": True}, SubnetId=subnet_id
+            )
+
+        try:
+            fan_out(associate, subnet_ids)
+        except FanOutError as e:
+            raise Exception(e)
+
     def create_subnets_for_vpc(self, vpc_id, template_file=None):
-        subnet_ids = []
+        """
+        Creates the subnets of the template concurrently
+        :param vpc_id: The VPC Id
+        :param template_file: The jinja template of the list of the requests
+        :return: The Subnet Ids, in the order of the template
+        """
         template_file = self.get_template(template_file, "subnets.yaml.jinja2")
-        # Sets the env vars to be used in jinja template rendering
-        os.environ["AWS_ENV_VARS_VPC_ID"] = vpc_id
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
+        request_dict = self.render_request(
+            template_file, dynamic_vars={"AWS_ENV_VARS_VPC_ID": vpc_id}
         )
-        request_dict = json.loads(request_string)
+
+        def create_subnet(subnet_dict):
+            response = self.client.create_subnet(**subnet_dict)
+            response_status = response.get("ResponseMetadata").get("HTTPStatusCode")
+            if response_status != 200:
+                raise Exception(f"API returned status: {response_status}")
+            subnet_id = response["Subnet"]["SubnetId"]
+            self.logger.info(f"Subnet created successfully with ID: {subnet_id}")
+            return subnet_id
+
         try:
-            for subnet_dict in request_dict:
-                response = self.client.create_subnet(**subnet_dict)
-                response_status = response.get("ResponseMetadata").get("HTTPStatusCode")
-                if response_status != 200:
-                    raise Exception(f"API returned status: {response_status}")
-                subnet_id = response["Subnet"]["SubnetId"]
-                self.logger.info(f"Subnet created successfully with ID: {subnet_id}")
-                subnet_ids.append(subnet_id)
-            return subnet_ids
-        except (ClientError, KeyError) as e:
+            return fan_out(create_subnet, request_dict)
+        except FanOutError as e:
             raise Exception(e)
 
     def create_vpc(self, template_file=None):
         # Checks if any VPC exists with the given tag and raises exception if any
-        existing_vpcs = self.find_vpcs_by_tag()
+        existing_vpcs = self.describe_vpcs_by_tag()
         if len(existing_vpcs) > 0:
             raise Exception(
                 f"VPCs: {existing_vpcs} already exists with the tag: "
@@ -213,10 +360,7 @@ class BotoEc2(BotoAws):
             template_file = os.path.join(
                 self.templates_base_dir, AWS_RESOURCE_TYPE, "vpc.yaml.jinja2"
             )
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
-        )
-        request_dict = json.loads(request_string)
+        request_dict = self.render_request(template_file)
         try:
             response = self.client.create_vpc(**request_dict)
             response_status = response.get("ResponseMetadata").get("HTTPStatusCode")
@@ -233,12 +377,9 @@ class BotoEc2(BotoAws):
             template_file = os.path.join(
                 self.templates_base_dir, AWS_RESOURCE_TYPE, "security_group.yaml.jinja2"
             )
-        # Sets the env var to be used in jinja template rendering
-        os.environ["AWS_ENV_VARS_VPC_ID"] = vpc_id
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
+        request_dict = self.render_request(
+            template_file, dynamic_vars={"AWS_ENV_VARS_VPC_ID": vpc_id}
         )
-        request_dict = json.loads(request_string)
         try:
             response = self.client.create_security_group(**request_dict)
             security_group_id = response["GroupId"]
@@ -253,19 +394,46 @@ class BotoEc2(BotoAws):
                 AWS_RESOURCE_TYPE,
                 "security_group_ingress.yaml.jinja2",
             )
-        os.environ["AWS_ENV_VARS_SG_ID"] = sg_id
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
+        request_dict = self.render_request(
+            template_file, dynamic_vars={"AWS_ENV_VARS_SG_ID": sg_id}
         )
-        request_dict = json.loads(request_string)
         try:
             self.client.authorize_security_group_ingress(**request_dict)
         except (ClientError, ParamValidationError, KeyError) as e:
             raise Exception(e)
 
+    def detach_and_delete_internet_gateway(self, igt_id, vpc_id):
+        self.detach_internet_gateway_by_id(igt_id, vpc_id)
+        self.logger.info(f"Deleting Internet Gateway with ID: {igt_id}")
+        self.delete_internet_gateway_by_id(igt_id, vpc_id)
+
+    @retry
+    def detach_internet_gateway_by_id(
+        self,
+        igt_id,
+        vpc_id,
+        max_retries=MAX_RETRIES,
+        delay=RETRY_DELAY,
+        deadline=RETRY_DEADLINE,
+    ):
+        # The detach fails with DependencyViolation until the public addresses of the VPC are
+        # released
+        self.logger.info(f"Detaching Internet Gateway with ID: {igt_id}")
+        response = self.client.detach_internet_gateway(
+            InternetGatewayId=igt_id, VpcId=vpc_id
+        )
+        self.logger.debug(
+            f"Response from API: {response.get('ResponseMetadata').get('HTTPStatusCode')}"
+        )
+
     @retry
     def delete_internet_gateway_by_id(
-        self, igt_id, vpc_id, max_retries=MAX_RETRIES, delay=RETRY_DELAY
+        self,
+        igt_id,
+        vpc_id,
+        max_retries=MAX_RETRIES,
+        delay=RETRY_DELAY,
+        deadline=RETRY_DEADLINE,
     ):
         response = self.client.delete_internet_gateway(InternetGatewayId=igt_id)
         self.logger.debug(
@@ -274,8 +442,9 @@ class BotoEc2(BotoAws):
 
     @retry
     def delete_security_group_by_id(
-        self, sg_id, max_retries=MAX_RETRIES, delay=RETRY_DELAY
+        self, sg_id, max_retries=MAX_RETRIES, delay=RETRY_DELAY, deadline=RETRY_DEADLINE
     ):
+        self.logger.info(f"Deleting Security Group with ID: {sg_id}")
         response = self.client.delete_security_group(GroupId=sg_id)
         self.logger.debug(
             f"Response from API: {response.get('ResponseMetadata').get('HTTPStatusCode')}"
@@ -283,15 +452,26 @@ class BotoEc2(BotoAws):
 
     @retry
     def delete_subnet_by_id(
-        self, subnet_id, max_retries=MAX_RETRIES, delay=RETRY_DELAY
+        self,
+        subnet_id,
+        max_retries=MAX_RETRIES,
+        delay=RETRY_DELAY,
+        deadline=RETRY_DEADLINE,
     ):
+        self.logger.info(f"Deleting Subnet with ID: {subnet_id}")
         response = self.client.delete_subnet(SubnetId=subnet_id)
         self.logger.debug(
             f"Response from API: {response.get('ResponseMetadata').get('HTTPStatusCode')}"
         )
 
     @retry
-    def delete_vpc_by_id(self, vpc_id, max_retries=MAX_RETRIES, delay=RETRY_DELAY):
+    def delete_vpc_by_id(
+        self,
+        vpc_id,
+        max_retries=MAX_RETRIES,
+        delay=RETRY_DELAY,
+        deadline=RETRY_DEADLINE,
+    ):
         response = self.client.delete_vpc(VpcId=vpc_id)
         self.logger.debug(
             f"Response from API: {response.get('ResponseMetadata').get('HTTPStatusCode')}"
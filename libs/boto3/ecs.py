@@ -1,4 +1,3 @@
-import json
 import os
 import time
 
@@ -27,10 +26,7 @@ class BotoEcs(BotoAws):
                 AWS_RESOURCE_TYPE,
                 "ecs_fargate_cluster.yaml.jinja2",
             )
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
-        )
-        request_dict = json.loads(request_string)
+        request_dict = self.render_request(template_file)
         try:
             response = self.client.create_cluster(**request_dict)
             cluster_arn = response["cluster"]["clusterArn"]
@@ -39,13 +35,17 @@ class BotoEcs(BotoAws):
         except (ClientError, KeyError) as e:
             raise Exception(e)
 
-    def delete_ecs_fargate_cluster(self, dry_run=True):
+    def delete_ecs_fargate_cluster(self, dry_run=True, context=None):
         """
         Destroys the Fargate Cluster
         :param dry_run: If set, will not delete the resources, only self.logger.info the resources to be deleted
+        :param context: StackContext of the resources, which are looked up by tag when not given
         :return: None
         """
-        arns = self.find_ecs_cluster_by_tag()
+        if context is not None:
+            arns = present_ids([context.cluster_arn])
+        else:
+            arns = self.find_ecs_cluster_by_tag()
         self.logger.info(
             f"The following ECS resources will be deleted\n"
             f"\tFargate ECS Clusters: {arns}"
@@ -62,17 +62,7 @@ class BotoEcs(BotoAws):
     def find_ecs_cluster_by_tag(self):
         filtered_arns = []
         try:
-            tag_key = self.input_values_dict.get("tags").get("key")
-            tag_value = self.input_values_dict.get("tags").get("name")
-            clusters_list = self.client.list_clusters()
-            cluster_arns = clusters_list.get("clusterArns")
-            clusters = self.client.describe_clusters(
-                clusters=cluster_arns, include=["TAGS"]
-            )
-            for row in clusters.get("clusters"):
-                for tag in row.get("tags"):
-                    if tag.get("key") == tag_key and tag.get("value") == tag_value:
-                        filtered_arns.append(row.get("clusterArn"))
+            filtered_arns = self.tag_discovery.find(ECS_CLUSTER)
         except (ClientError, KeyError) as e:
             raise Exception(f"An error occurred while finding ECS Cluster by tag: {e}")
 
@@ -82,7 +72,11 @@ class BotoEcs(BotoAws):
 
     @retry
     def delete_ecs_cluster_by_arn(
-        self, ecs_arn, max_retries=MAX_RETRIES, delay=RETRY_DELAY
+        self,
+        ecs_arn,
+        max_retries=MAX_RETRIES,
+        delay=RETRY_DELAY,
+        deadline=RETRY_DEADLINE,
     ):
         response = self.client.delete_cluster(cluster=ecs_arn)
         self.logger.debug(
@@ -5,60 +5,404 @@ from libs import get_logger
 from libs.boto3.ec2 import BotoEc2
 from libs.boto3.ecs import BotoEcs
 from libs.boto3.elbv2 import BotoElbv2
+from libs.boto3.inventory import open_inventory, stack_key, validate
+from libs.boto3.retry_policy import retry_stats
 from libs.boto3.route53 import BotoRoute53
+from libs.boto3.scheduler import DEFAULT_MAX_PARALLEL, Step, StepScheduler
+from libs.boto3.stack_context import StackContext
+from libs.boto3.stack_plan import StackPlan
 from libs.jinja.jinja_utils import JinjaTemplate
+from libs.profiling import span
 
 logger = get_logger(__name__)
 
 
-def create(values_input_file, environment_type, templates_root_dir):
+def create(
+    values_input_file,
+    environment_type,
+    templates_root_dir,
+    resume=False,
+    max_parallel=DEFAULT_MAX_PARALLEL,
+    inventory_dir=None,
+    inventory_ttl=None,
+):
     """
-    Creates all the AWS infrastructure resources for the ECS Fargate Cluster
+    Creates all the AWS infrastructure resources for the ECS Fargate Cluster. The steps run as a graph
+    where the independent steps run concurrently, the IDs of the created resources being passed from
+    one step to the next through a StackContext.
     :param values_input_file: The absolute path of values input file template
     :param environment_type: The environment type of deployment qa|uat|prod
     :param templates_root_dir: The root directory where the jinja templates are placed
-    :return: None
+    :param resume: If set, the resources created by a previous run are found by tag and the steps
+                   which created them are skipped
+    :param max_parallel: Maximum number of steps running concurrently
+    :param inventory_dir: Directory of the inventory where the created resources are recorded
+    :param inventory_ttl: Number of seconds an inventory entry is served
+    :return: The StackContext
     """
+    inventory = open_inventory(inventory_dir, inventory_ttl)
+    context = None
+    succeeded = False
     try:
-        jinja_template = JinjaTemplate(values_input_file, environment_type)
-        boto_ec2 = BotoEc2(jinja_template, templates_root_dir)
-        boto_ecs = BotoEcs(jinja_template, templates_root_dir)
-        boto_elbv2 = BotoElbv2(jinja_template, templates_root_dir)
-        boto_route53 = BotoRoute53(jinja_template, templates_root_dir)
-
-        boto_ec2.create_and_configure_vpc()
-        boto_elbv2.create_elbv2()
-        boto_elbv2.create_elbv2_target_group()
-        boto_elbv2.create_elbv2_listeners()
-        boto_ecs.create_ecs_fargate_cluster()
-        boto_route53.change_record_set_elbv2("CREATE")
-        logger.info("Infrastructure creation successful")
+        with span("setup", "step"):
+            jinja_template = JinjaTemplate(values_input_file, environment_type)
+            boto_ec2 = BotoEc2(jinja_template, templates_root_dir)
+            boto_ecs = BotoEcs(jinja_template, templates_root_dir)
+            boto_elbv2 = BotoElbv2(jinja_template, templates_root_dir)
+            boto_route53 = BotoRoute53(jinja_template, templates_root_dir)
+
+            key = inventory and stack_key(*tag_of(boto_ec2))
+            if resume:
+                context = load_stack_context(
+                    boto_ec2, boto_elbv2, boto_ecs, inventory, key
+                )
+                logger.info(f"Resuming the stack: {context}")
+            else:
+                context = StackContext()
+            bind_stack_context(context, boto_ec2, boto_ecs, boto_elbv2, boto_route53)
+
+        scheduler = StepScheduler(
+            create_steps(boto_ec2, boto_elbv2, boto_ecs, boto_route53, resume),
+            max_parallel,
+        )
+        failures = scheduler.run(context, resume)
+        scheduler.report()
+        log_retry_stats()
+        if failures:
+            raise Exception(f"Failed steps: {failures}")
+        succeeded = True
+        logger.info(f"Infrastructure creation successful: {context}")
+        return context
     except Exception as e:
         logger.error(f"Exception occurred while creating infrastructure: {e}")
         traceback.print_exception(*sys.exc_info())
+    finally:
+        # A partially resumed stack is recorded as well, for the next --resume and destroy. A
+        # failed create, e.g. refused on an existing stack, holds only part of the resources and
+        # would replace the entry of the stack, which is discovered by tag instead
+        if inventory and context is not None and (succeeded or resume):
+            inventory.save(key, context)
 
 
-def destroy(values_input_file, environment_type, templates_root_dir, dry_run=True):
+def destroy(
+    values_input_file,
+    environment_type,
+    templates_root_dir,
+    dry_run=True,
+    max_parallel=DEFAULT_MAX_PARALLEL,
+    inventory_dir=None,
+    inventory_ttl=None,
+):
     """
-    Destroys all the AWS infrastructure resources for the ECS Fargate Cluster
+    Destroys all the AWS infrastructure resources for the ECS Fargate Cluster. The independent steps
+    run concurrently. The resources are read from the inventory when it holds the stack, and looked
+    up by tag otherwise.
     :param values_input_file: The absolute path of values input file template
     :param environment_type: The environment type of deployment qa|uat|prod
     :param templates_root_dir: The root directory where the jinja templates are placed
     :param dry_run: If dry-run flag is set, the infrastructure to be deleted is only printed and not deleted
+    :param max_parallel: Maximum number of steps running concurrently
+    :param inventory_dir: Directory of the inventory of the resources
+    :param inventory_ttl: Number of seconds an inventory entry is served
     :return:
     """
+    inventory = open_inventory(inventory_dir, inventory_ttl)
+    key = None
     try:
-        jinja_template = JinjaTemplate(values_input_file, environment_type)
-        boto_ec2 = BotoEc2(jinja_template, templates_root_dir)
-        boto_ecs = BotoEcs(jinja_template, templates_root_dir)
-        boto_elbv2 = BotoElbv2(jinja_template, templates_root_dir)
-        boto_route53 = BotoRoute53(jinja_template, templates_root_dir)
-
-        boto_route53.change_record_set_elbv2("DELETE", dry_run=dry_run)
-        boto_ecs.delete_ecs_fargate_cluster(dry_run=dry_run)
-        boto_elbv2.delete_elbv2_resources(dry_run=dry_run)
-        boto_ec2.delete_vpc(dry_run=dry_run)
+        with span("setup", "step"):
+            jinja_template = JinjaTemplate(values_input_file, environment_type)
+            boto_ec2 = BotoEc2(jinja_template, templates_root_dir)
+            boto_ecs = BotoEcs(jinja_template, templates_root_dir)
+            boto_elbv2 = BotoElbv2(jinja_template, templates_root_dir)
+            boto_route53 = BotoRoute53(jinja_template, templates_root_dir)
+            key = inventory and stack_key(*tag_of(boto_ec2))
+            context = load_stack_context(boto_ec2, boto_elbv2, boto_ecs, inventory, key)
+            bind_stack_context(context, boto_ec2, boto_ecs, boto_elbv2, boto_route53)
+            if inventory and dry_run:
+                inventory.save(key, context)
+
+        scheduler = StepScheduler(
+            destroy_steps(boto_ec2, boto_elbv2, boto_ecs, boto_route53, dry_run),
+            max_parallel,
+        )
+        failures = scheduler.run(context)
+        scheduler.report()
+        log_retry_stats()
+        if failures:
+            raise Exception(f"Failed steps: {failures}")
         logger.info("Destroy infrastructure successful")
     except Exception as e:
         logger.error(f"Exception occurred while destroying infrastructure: {e}")
         traceback.print_exception(*sys.exc_info())
+    finally:
+        # Whatever was deleted, the recorded resources are out of date
+        if inventory and key and not dry_run:
+            inventory.invalidate(key)
+
+
+def plan(
+    values_input_file,
+    environment_type,
+    templates_root_dir,
+    apply=False,
+    max_parallel=DEFAULT_MAX_PARALLEL,
+    inventory_dir=None,
+    inventory_ttl=None,
+):
+    """
+    Prints the difference between the requests rendered from the templates and the existing stack,
+    and applies it with apply: the missing resources are created by the steps of create, the
+    subnets, ingress rules and listeners of the existing ones are created, modified or deleted.
+    Applying an unchanged stack issues no mutating call.
+    :param values_input_file: The absolute path of values input file template
+    :param environment_type: The environment type of deployment qa|uat|prod
+    :param templates_root_dir: The root directory where the jinja templates are placed
+    :param apply: If set, the plan is applied, otherwise it is only printed
+    :param max_parallel: Maximum number of steps running concurrently
+    :param inventory_dir: Directory of the inventory of the resources
+    :param inventory_ttl: Number of seconds an inventory entry is served
+    :return: The StackPlan
+    """
+    inventory = open_inventory(inventory_dir, inventory_ttl)
+    key = None
+    applied = False
+    try:
+        with span("setup", "step"):
+            jinja_template = JinjaTemplate(values_input_file, environment_type)
+            boto_ec2 = BotoEc2(jinja_template, templates_root_dir)
+            boto_ecs = BotoEcs(jinja_template, templates_root_dir)
+            boto_elbv2 = BotoElbv2(jinja_template, templates_root_dir)
+            boto_route53 = BotoRoute53(jinja_template, templates_root_dir)
+            key = inventory and stack_key(*tag_of(boto_ec2))
+            context = load_stack_context(boto_ec2, boto_elbv2, boto_ecs, inventory, key)
+            bind_stack_context(context, boto_ec2, boto_ecs, boto_elbv2, boto_route53)
+
+        # The record set only changes with a new load balancer
+        scheduler = StepScheduler(
+            create_steps(
+                boto_ec2,
+                boto_elbv2,
+                boto_ecs,
+                boto_route53,
+                resume=True,
+                record_set_always=False,
+            ),
+            max_parallel,
+        )
+        with span("plan", "step"):
+            stack_plan = StackPlan(
+                boto_ec2, boto_elbv2, context, scheduler.pending(context)
+            )
+        stack_plan.print()
+        if not apply or stack_plan.is_empty():
+            return stack_plan
+        applied = True
+        if stack_plan.steps:
+            failures = scheduler.run(context, resume=True)
+            scheduler.report()
+            if failures:
+                raise Exception(f"Failed steps: {failures}")
+        stack_plan.apply_changes()
+        log_retry_stats()
+        logger.info(f"Infrastructure update successful: {context}")
+        return stack_plan
+    except Exception as e:
+        logger.error(f"Exception occurred while planning infrastructure: {e}")
+        traceback.print_exception(*sys.exc_info())
+    finally:
+        # The changed resources are discovered again by the next run
+        if inventory and key and applied:
+            inventory.invalidate(key)
+
+
+def tag_of(boto_aws):
+    tags = boto_aws.input_values_dict.get("tags")
+    return tags.get("key"), tags.get("name")
+
+
+def bind_stack_context(context, *boto_aws):
+    """
+    Renders the templates of the Boto* instances with the IDs of the resources of the StackContext,
+    as they are created
+    :param context: StackContext
+    :param boto_aws: Boto* instances
+    :return: None
+    """
+    for boto in boto_aws:
+        boto.stack_context = context
+
+
+def load_stack_context(boto_ec2, boto_elbv2, boto_ecs, inventory=None, key=None):
+    """
+    Returns the resources of the stack recorded in the inventory, if they still exist, or looks them
+    up by tag
+    :param inventory: Optional Inventory
+    :param key: Key of the stack in the inventory
+    :return: StackContext
+    """
+    if inventory:
+        with span("inventory.load", "step"):
+            context = inventory.load(key)
+            if context is not None and validate(context):
+                logger.info(f"Resources of the stack read from the inventory")
+                return context
+    with span("discover", "step"):
+        return StackContext.discover(boto_ec2, boto_elbv2, boto_ecs)
+
+
+def log_retry_stats():
+    summary = retry_stats.summary()
+    if summary:
+        logger.info(f"Retried operations:\n{summary}")
+
+
+def create_steps(
+    boto_ec2, boto_elbv2, boto_ecs, boto_route53, resume=False, record_set_always=True
+):
+    """
+    Returns the graph of the steps creating the stack
+    :param resume: If set, the record set is upserted
+    :param record_set_always: If set, the record set step runs even when the load balancer exists
+    :return: List of Step
+    """
+
+    def create_vpc(context):
+        context.vpc_id = boto_ec2.create_vpc()
+
+    def create_subnets(context):
+        context.subnet_ids = boto_ec2.create_subnets_for_vpc(context.vpc_id)
+
+    def create_internet_gateway(context):
+        (
+            context.internet_gateway_id,
+            context.route_table_id,
+        ) = boto_ec2.create_internet_gateway_route(context.vpc_id)
+
+    def associate_subnets(context):
+        boto_ec2.associate_subnets_with_route_table(
+            context.route_table_id, context.subnet_ids
+        )
+
+    def create_security_group(context):
+        context.security_group_id = boto_ec2.create_security_group(context.vpc_id)
+
+    def create_security_group_ingress(context):
+        boto_ec2.create_security_group_ingress(context.security_group_id)
+
+    def create_load_balancer(context):
+        boto_elbv2.create_elbv2(
+            context.subnet_ids, context.security_group_id, context=context
+        )
+
+    def create_target_group(context):
+        context.target_group_arn = boto_elbv2.create_elbv2_target_group(context.vpc_id)
+
+    def create_listeners(context):
+        context.listener_arns = boto_elbv2.create_elbv2_listeners(
+            context.load_balancer_arn, context.target_group_arn
+        )
+
+    def create_cluster(context):
+        context.cluster_arn = boto_ecs.create_ecs_fargate_cluster()
+
+    def create_record_set(context):
+        # A record set left by a failed run is overwritten when resuming
+        boto_route53.change_record_set_elbv2(
+            "UPSERT" if resume else "CREATE", elb_dns=context.load_balancer_dns
+        )
+
+    return [
+        Step("ec2.vpc", create_vpc, outputs=["vpc_id"]),
+        Step("ec2.subnets", create_subnets, ["vpc_id"], ["subnet_ids"]),
+        Step(
+            "ec2.internet_gateway",
+            create_internet_gateway,
+            ["vpc_id"],
+            ["internet_gateway_id", "route_table_id"],
+        ),
+        Step(
+            "ec2.route_table_associations",
+            associate_subnets,
+            ["route_table_id", "subnet_ids"],
+        ),
+        Step(
+            "ec2.security_group",
+            create_security_group,
+            ["vpc_id"],
+            ["security_group_id"],
+        ),
+        Step(
+            "ec2.security_group_ingress",
+            create_security_group_ingress,
+            ["security_group_id"],
+        ),
+        # An internet facing load balancer requires the internet gateway of the VPC
+        Step(
+            "elbv2.load_balancer",
+            create_load_balancer,
+            ["subnet_ids", "security_group_id"],
+            ["load_balancer_arn", "load_balancer_dns"],
+            after=["ec2.internet_gateway"],
+        ),
+        Step(
+            "elbv2.target_group",
+            create_target_group,
+            ["vpc_id"],
+            ["target_group_arn"],
+        ),
+        Step(
+            "elbv2.listeners",
+            create_listeners,
+            ["load_balancer_arn", "target_group_arn"],
+            ["listener_arns"],
+        ),
+        # A create refused by ec2.vpc on an existing stack must not create anything
+        Step(
+            "ecs.cluster",
+            create_cluster,
+            outputs=["cluster_arn"],
+            after=["ec2.vpc"],
+        ),
+        Step(
+            "route53.record_set",
+            create_record_set,
+            ["load_balancer_dns"],
+            always=record_set_always,
+        ),
+    ]
+
+
+def destroy_steps(boto_ec2, boto_elbv2, boto_ecs, boto_route53, dry_run=True):
+    """
+    Returns the graph of the steps destroying the stack, whose resources are read from the
+    StackContext
+    :return: List of Step
+    """
+    return [
+        # The record set is found from the DNS name of the load balancer
+        Step(
+            "route53.record_set",
+            lambda context: boto_route53.change_record_set_elbv2(
+                "DELETE", elb_dns=context.load_balancer_dns, dry_run=dry_run
+            ),
+        ),
+        Step(
+            "ecs.cluster",
+            lambda context: boto_ecs.delete_ecs_fargate_cluster(
+                dry_run=dry_run, context=context
+            ),
+        ),
+        Step(
+            "elbv2.resources",
+            lambda context: boto_elbv2.delete_elbv2_resources(
+                dry_run=dry_run, context=context
+            ),
+            after=["route53.record_set"],
+        ),
+        # The network interfaces of the load balancers and of the tasks must be released first
+        Step(
+            "ec2.vpc",
+            lambda context: boto_ec2.delete_vpc(dry_run=dry_run, context=context),
+            after=["elbv2.resources", "ecs.cluster"],
+        ),
+    ]
@@ -1,4 +1,3 @@
-import json
 import os
 import time
 
@@ -21,11 +20,17 @@ class BotoElbv2(BotoAws):
 
     # Public functions
 
-    def create_elbv2(self, subnet_ids=None, sg_id=None, template_file=None):
-        if not template_file:
-            template_file = os.path.join(
-                self.templates_base_dir, AWS_RESOURCE_TYPE, "elbv2.yaml.jinja2"
-            )
+    def create_elbv2(
+        self, subnet_ids=None, sg_id=None, template_file=None, context=None
+    ):
+        """
+        Creates the load balancer. The VPC resources are looked up by tag when not given.
+        :param subnet_ids: The Subnet Ids of the load balancer
+        :param sg_id: The Security Group Id of the load balancer
+        :param template_file: The jinja template of the request
+        :param context: StackContext where the ARN and the DNS name of the load balancer are recorded
+        :return: The ARN of the load balancer
+        """
         if not (subnet_ids or sg_id):
             boto_ec2 = BotoEc2(self.jinja_template, self.templates_base_dir)
             vpc_ids = boto_ec2.find_vpcs_by_tag()
@@ -40,25 +45,44 @@ class BotoElbv2(BotoAws):
             if not sg_ids:
                 raise ValueError(f"No Target Group found for vpc: {vpc_id}")
             sg_id = sg_ids[0]
-        # Set the env vars to be used by jinja template rendering
-        for index, subnet_id in enumerate(subnet_ids):
-            os.environ[f"AWS_ENV_VARS_SUBNET_ID_{index+1}"] = subnet_id
-        os.environ["AWS_ENV_VARS_SG_ID"] = sg_id
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
-        )
-        request_dict = json.loads(request_string)
+        request_dict = self.render_elbv2_request(subnet_ids, sg_id, template_file)
         try:
             response = self.client.create_load_balancer(**request_dict)
             # Array size will always be 1 upon successful creation
-            elbv2_arn = response["LoadBalancers"][0]["LoadBalancerArn"]
+            load_balancer = response["LoadBalancers"][0]
+            elbv2_arn = load_balancer["LoadBalancerArn"]
             self.logger.info(f"ELBv2 with ARN: {elbv2_arn} created")
+            if context is not None:
+                context.load_balancer_arn = elbv2_arn
+                context.load_balancer_dns = load_balancer.get("DNSName")
             return elbv2_arn
         except (ClientError, KeyError) as e:
             raise Exception(e)
 
+    def render_elbv2_request(self, subnet_ids, sg_id, template_file=None):
+        """
+        Renders the request creating the load balancer
+        :param subnet_ids: The Subnet Ids of the VPC, in the order of the subnets template
+        :param sg_id: The Security Group Id of the load balancer
+        :param template_file: The jinja template of the request
+        :return: Dictionary of the request
+        """
+        template_file = self.get_template(template_file, "elbv2.yaml.jinja2")
+        # Dynamic vars to be used by jinja template rendering
+        dynamic_vars = {"AWS_ENV_VARS_SG_ID": sg_id}
+        for index, subnet_id in enumerate(subnet_ids):
+            dynamic_vars[f"AWS_ENV_VARS_SUBNET_ID_{index+1}"] = subnet_id
+        return self.render_request(template_file, dynamic_vars=dynamic_vars)
+
     def create_elbv2_listeners(self, elbv2_arn=None, tg_arn=None, template_file=None):
-        listener_arns = []
+        """
+        Creates the listeners of the template concurrently. The load balancer and the target group
+        are looked up by tag when not given.
+        :param elbv2_arn: The ARN of the load balancer
+        :param tg_arn: The ARN of the target group of the listeners
+        :param template_file: The jinja template of the list of the requests
+        :return: The ARNs of the listeners, in the order of the template
+        """
         if not template_file:
             template_file = os.path.join(
                 self.templates_base_dir,
@@ -79,22 +103,22 @@ class BotoElbv2(BotoAws):
                     f"{self.input_values_dict.get('tags').get('name')}"
                 )
             tg_arn = tg_arns[0]
-        # Set env vars to be used by jinja template rendering
-        os.environ["AWS_ENV_VARS_ELBV2_ARN"] = elbv2_arn
-        os.environ["AWS_ENV_VARS_TARGET_GROUP_ARN"] = tg_arn
+        # Dynamic vars to be used by jinja template rendering
+        dynamic_vars = {
+            "AWS_ENV_VARS_ELBV2_ARN": elbv2_arn,
+            "AWS_ENV_VARS_TARGET_GROUP_ARN": tg_arn,
+        }
+        request_dict = self.render_request(template_file, dynamic_vars=dynamic_vars)
+
+        def create_listener(listener_dict):
+            response = self.client.create_listener(**listener_dict)
+            listener_arn = response["Listeners"][0]["ListenerArn"]
+            self.logger.info(f"ELBv2 Listener with ARN: {listener_arn} created")
+            return listener_arn
 
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
-        )
-        request_dict = json.loads(request_string)
         try:
-            for listener_dict in request_dict:
-                response = self.client.create_listener(**listener_dict)
-                listener_arn = response["Listeners"][0]["ListenerArn"]
-                self.logger.info(f"ELBv2 Listener with ARN: {listener_arn} created")
-                listener_arns.append(listener_arn)
-            return listener_arns
-        except (ClientError, KeyError) as e:
+            return fan_out(create_listener, request_dict)
+        except FanOutError as e:
             raise Exception(e)
 
     def create_elbv2_target_group(self, vpc_id=None, template_file=None):
@@ -113,12 +137,9 @@ class BotoElbv2(BotoAws):
                 )
             # At most 1 VPC will be found
             vpc_id = vpc_ids[0]
-        # Set env vars to be used by jinja template rendering
-        os.environ["AWS_ENV_VARS_VPC_ID"] = vpc_id
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
+        request_dict = self.render_request(
+            template_file, dynamic_vars={"AWS_ENV_VARS_VPC_ID": vpc_id}
         )
-        request_dict = json.loads(request_string)
         try:
             response = self.client.create_target_group(**request_dict)
             tg_arn = response["TargetGroups"][0]["TargetGroupArn"]
@@ -127,26 +148,39 @@ class BotoElbv2(BotoAws):
         except (ClientError, KeyError) as e:
             raise Exception(e)
 
-    def delete_elbv2_resources(self, dry_run=True):
+    def delete_elbv2_resources(self, dry_run=True, context=None):
         """
-        Deletes all the ELBv2 resources including Load Balancers, Listeners, Target Groups
+        Deletes all the ELBv2 resources including Load Balancers, Listeners, Target Groups. The load
+        balancers are deleted concurrently and awaited, the target groups in use until then are deleted
+        concurrently next.
         :param dry_run: If set, will not delete the resources, only self.logger.info the resources to be deleted
+        :param context: StackContext of the resources, which are looked up by tag when not given
         :return: None
         """
-        elbv2_arns = self.find_elbv2_by_tag()
-        tg_arns = self.find_elbv2_target_group_by_tag()
+        if context is not None:
+            elbv2_arns = present_ids([context.load_balancer_arn])
+            tg_arns = present_ids([context.target_group_arn])
+        else:
+            elbv2_arns = self.find_elbv2_by_tag()
+            tg_arns = self.find_elbv2_target_group_by_tag()
         self.logger.info(
             f"The following ELBv2 resources will be deleted\n"
             f"\tLoad Balancers: {elbv2_arns}\n"
             f"\tTarget Groups: {tg_arns}"
         )
         if not dry_run:
-            for elbv2_arn in elbv2_arns:
-                self.logger.info(f"Deleting LB with ARN: {elbv2_arn}")
-                self.delete_elbv2_by_arn(elbv2_arn)
-            for tg_arn in tg_arns:
-                self.logger.info(f"Deleting Target Group with ARN: {tg_arn}")
-                self.delete_tg_by_arn(tg_arn)
+            fan_out(self.delete_elbv2_by_arn, elbv2_arns)
+            if elbv2_arns:
+                # The listeners are deleted with the load balancers, releasing the target groups
+                with span("elbv2.load_balancers_deleted", "waiter"):
+                    self.client.get_waiter("load_balancers_deleted").wait(
+                        LoadBalancerArns=elbv2_arns,
+                        WaiterConfig={
+                            "Delay": WAITER_DELAY,
+                            "MaxAttempts": WAITER_MAX_ATTEMPTS,
+                        },
+                    )
+            fan_out(self.delete_tg_by_arn, tg_arns)
         else:
             self.logger.info(
                 f"No resources are deleted since the --dry-run flag is set."
@@ -159,40 +193,52 @@ class BotoElbv2(BotoAws):
         except Exception as e:
             self.logger.info(f"Exception occurred: {e}")
 
+    def get_elbv2_subnets_by_arn(self, elbv2_arn):
+        try:
+            response = self.client.describe_load_balancers(LoadBalancerArns=[elbv2_arn])
+            return [
+                zone.get("SubnetId")
+                for zone in response["LoadBalancers"][0].get("AvailabilityZones")
+            ]
+        except (KeyError, IndexError, ClientError) as e:
+            raise Exception(f"Exception while getting the subnets of the ELBv2: {e}")
+
+    def get_listener_details_by_elbv2_arn(self, elbv2_arn):
+        """
+        :param elbv2_arn: The ARN of the load balancer
+        :return: The descriptions of the listeners of the load balancer
+        """
+        try:
+            pages = self.client.get_paginator("describe_listeners").paginate(
+                LoadBalancerArn=elbv2_arn
+            )
+            return [listener for page in pages for listener in page.get("Listeners")]
+        except (KeyError, ClientError) as e:
+            raise Exception(f"Exception while getting listeners: {e}")
+
+    def get_listeners_by_elbv2_arn(self, elbv2_arn):
+        listener_arns = []
+        try:
+            listeners = self.client.describe_listeners(LoadBalancerArn=elbv2_arn)
+            listener_arns = [
+                listener.get("ListenerArn") for listener in listeners.get("Listeners")
+            ]
+        except (KeyError, ClientError) as e:
+            self.logger.error(f"Exception while getting listeners: {e}")
+        return listener_arns
+
     def find_elbv2_by_tag(self):
         filtered_arns = []
-        tag_key = self.input_values_dict.get("tags").get("key")
-        tag_value = self.input_values_dict.get("tags").get("name")
         try:
-            # Work-around to find elb with tags, since describe_load_balancers() does not retrieve the tags
-            elbs = self.client.describe_load_balancers()
-            elb_arns = [elb.get("LoadBalancerArn") for elb in elbs.get("LoadBalancers")]
-            tags = self.client.describe_tags(ResourceArns=elb_arns)
-            for row in tags.get("TagDescriptions"):
-                if row.get("Tags"):
-                    for tag in row.get("Tags"):
-                        if tag.get("Key") == tag_key and tag.get("Value") == tag_value:
-                            filtered_arns.append(row.get("ResourceArn"))
+            filtered_arns = self.tag_discovery.find(LOAD_BALANCER)
         except (KeyError, ClientError) as e:
             self.logger.error(f"An error occurred while finding ELBv2 by tag: {e}")
         return filtered_arns
 
     def find_elbv2_target_group_by_tag(self):
         filtered_arns = []
-        tag_key = self.input_values_dict.get("tags").get("key")
-        tag_value = self.input_values_dict.get("tags").get("name")
         try:
-            # Work-around to find TG with tags, since describe_target_groups() does not retrieve the tags
-            all_tgs = self.client.describe_target_groups()
-            all_tgs_arns = [
-                tg.get("TargetGroupArn") for tg in all_tgs.get("TargetGroups")
-            ]
-            tags = self.client.describe_tags(ResourceArns=all_tgs_arns)
-            for row in tags.get("TagDescriptions"):
-                if row.get("Tags"):
-                    for tag in row.get("Tags"):
-                        if tag.get("Key") == tag_key and tag.get("Value") == tag_value:
-                            filtered_arns.append(row.get("ResourceArn"))
+            filtered_arns = self.tag_discovery.find(TARGET_GROUP)
         except (KeyError, ClientError) as e:
             self.logger.error(
                 f"Exception occurred while finding Target Group by tag: {e}"
@@ -203,15 +249,27 @@ class BotoElbv2(BotoAws):
 
     @retry
     def delete_elbv2_by_arn(
-        self, elbv2_arn, max_retries=MAX_RETRIES, delay=RETRY_DELAY
+        self,
+        elbv2_arn,
+        max_retries=MAX_RETRIES,
+        delay=RETRY_DELAY,
+        deadline=RETRY_DEADLINE,
     ):
+        self.logger.info(f"Deleting LB with ARN: {elbv2_arn}")
         response = self.client.delete_load_balancer(LoadBalancerArn=elbv2_arn)
         self.logger.debug(
             f"Response from API: {response.get('ResponseMetadata').get('HTTPStatusCode')}"
         )
 
     @retry
-    def delete_tg_by_arn(self, tg_arn, max_retries=MAX_RETRIES, delay=RETRY_DELAY):
+    def delete_tg_by_arn(
+        self,
+        tg_arn,
+        max_retries=MAX_RETRIES,
+        delay=RETRY_DELAY,
+        deadline=RETRY_DEADLINE,
+    ):
+        self.logger.info(f"Deleting Target Group with ARN: {tg_arn}")
         response = self.client.delete_target_group(TargetGroupArn=tg_arn)
         self.logger.debug(
             f"Response from API: {response.get('ResponseMetadata').get('HTTPStatusCode')}"
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+_max_concurrency = DEFAULT_MAX_CONCURRENCY
+_max_concurrency_lock = threading.Lock()
+
+
+class FanOutError(Exception):
+    """
+    Failure of some of the requests of a fan-out, raised once all the requests completed
+    """
+
+    def __init__(self, items, errors, results):
+        """
+        :param items: Items of the requests
+        :param errors: Dictionary of the index of every failed item to its exception
+        :param results: Results of the requests, None for the failed ones
+        """
+        self.items = items
+        self.errors = errors
+        self.results = results
+        failures = "; ".join(
+            f"{items[index]!r}: {error}" for index, error in sorted(errors.items())
+        )
+        super().__init__(f"{len(errors)} of {len(items)} requests failed: {failures}")
+
+
+def fan_out(function, items, max_concurrency=None):
+    """
+    Calls a function on every item of a list-shaped request concurrently, e.g. one create_subnet
+    per subnet of the rendered template. Every request runs even when some fail.
+    :param function: Function called with one item
+    :param items: Items of the requests
+    :param max_concurrency: Maximum number of requests in flight, defaults to the configured one
+    :return: List of the results, in the order of the items
+    :raises FanOutError: If any request failed
+    """
+    items = list(items)
+    if not items:
+        return []
+    max_workers = min(len(items), max_concurrency or _max_concurrency)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(function, item) for item in items]
+    results = []
+    errors = {}
+    for index, future in enumerate(futures):
+        error = future.exception()
+        if error is not None:
+            errors[index] = error
+        results.append(None if error is not None else future.result())
+    if errors:
+        raise FanOutError(items, errors, results)
+    return results
+
+
+def configure_fan_out(max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Sets the default maximum number of requests of a fan-out in flight
+    :param max_concurrency: Maximum number of requests, at least 1
+    :return: None
+    """
+    global _max_concurrency
+    with _max_concurrency_lock:
+        _max_concurrency = max(max_concurrency, 1)
@@ -0,0 +1,198 @@
+import dataclasses
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from libs import get_logger
+from libs.boto3.clients import get_client
+from libs.boto3.stack_context import StackContext
+from libs.output_file import write_if_changed
+
+DEFAULT_TTL = 3600
+INVENTORY_DIR_ENV_VAR = "MAGICDUST_INVENTORY_DIR"
+INVENTORY_TTL_ENV_VAR = "MAGICDUST_INVENTORY_TTL"
+# Describe call of every resource of a StackContext, as its field, the service, the operation, its
+# parameter listing the IDs and the list of the resources in the response
+RESOURCE_DESCRIBES = [
+    ("vpc_id", "ec2", "describe_vpcs", "VpcIds", "Vpcs"),
+    ("subnet_ids", "ec2", "describe_subnets", "SubnetIds", "Subnets"),
+    (
+        "internet_gateway_id",
+        "ec2",
+        "describe_internet_gateways",
+        "InternetGatewayIds",
+        "InternetGateways",
+    ),
+    ("route_table_id", "ec2", "describe_route_tables", "RouteTableIds", "RouteTables"),
+    (
+        "security_group_id",
+        "ec2",
+        "describe_security_groups",
+        "GroupIds",
+        "SecurityGroups",
+    ),
+    (
+        "load_balancer_arn",
+        "elbv2",
+        "describe_load_balancers",
+        "LoadBalancerArns",
+        "LoadBalancers",
+    ),
+    (
+        "target_group_arn",
+        "elbv2",
+        "describe_target_groups",
+        "TargetGroupArns",
+        "TargetGroups",
+    ),
+    ("listener_arns", "elbv2", "describe_listeners", "ListenerArns", "Listeners"),
+    ("cluster_arn", "ecs", "describe_clusters", "clusters", "clusters"),
+]
+
+logger = get_logger(__name__)
+
+
+class Inventory:
+    """
+    On-disk inventory of the resources of the stacks, one JSON file per account, region and tag
+    holding the StackContext written by create and discovered by destroy. An entry is served until
+    its TTL expires, provided its resources still exist.
+    """
+
+    def __init__(self, inventory_dir, ttl=DEFAULT_TTL):
+        """
+        :param inventory_dir: Directory of the inventory files
+        :param ttl: Number of seconds an entry is served before the stack is discovered again
+        """
+        self.inventory_dir = inventory_dir
+        self.ttl = ttl
+
+    def load(self, key):
+        """
+        Returns the StackContext of a stack, if its entry has not expired
+        :param key: Tuple of the account, region, tag key and tag value of the stack
+        :return: StackContext or None
+        """
+        try:
+            with open(self.__path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != list(key) or time.time() - entry["saved"] > self.ttl:
+            return None
+        fields = {field.name for field in dataclasses.fields(StackContext)}
+        return StackContext(
+            **{
+                name: value
+                for name, value in entry["context"].items()
+                if name in fields
+            }
+        )
+
+    def save(self, key, context):
+        """
+        Records the StackContext of a stack
+        :param key: Tuple of the account, region, tag key and tag value of the stack
+        :param context: StackContext
+        :return: None
+        """
+        entry = {
+            "key": list(key),
+            "saved": time.time(),
+            "context": dataclasses.asdict(context),
+        }
+        write_if_changed(self.__path(key), json.dumps(entry, indent=2))
+
+    def invalidate(self, key):
+        try:
+            os.remove(self.__path(key))
+        except FileNotFoundError:
+            pass
+
+    # Private methods
+
+    def __path(self, key):
+        digest = hashlib.sha256(json.dumps(list(key)).encode()).hexdigest()
+        return os.path.join(self.inventory_dir, f"{digest}.json")
+
+
+def stack_key(tag_key, tag_value, region=None):
+    """
+    Returns the key of a stack in the inventory
+    :param tag_key: Key of the tag of the stack
+    :param tag_value: Value of the tag of the stack
+    :param region: AWS region, defaults to the region of the clients
+    :return: Tuple of the account, region, tag key and tag value
+    """
+    account = get_client("sts", region).get_caller_identity()["Account"]
+    region = region or get_client("ec2").meta.region_name
+    return account, region, tag_key, tag_value
+
+
+def validate(context, region=None):
+    """
+    Checks that the resources of a StackContext still exist, with one describe call per type of
+    resource on all its cached IDs, the calls running concurrently
+    :param context: StackContext
+    :param region: AWS region, defaults to the region of the clients
+    :return: Flag whether the StackContext holds resources and they all exist
+    """
+
+    def exists(describe):
+        field, service, operation, parameter, result = describe
+        resource_ids = _ids(getattr(context, field))
+        response = getattr(get_client(service, region), operation)(
+            **{parameter: resource_ids}
+        )
+        # The deleted ECS clusters are still described, as INACTIVE
+        found = [
+            resource
+            for resource in response.get(result)
+            if resource.get("status", "ACTIVE") == "ACTIVE"
+        ]
+        if len(found) != len(resource_ids):
+            logger.info(f"Inventory entry out of date: {field} {resource_ids}")
+            return False
+        return True
+
+    describes = [
+        describe
+        for describe in RESOURCE_DESCRIBES
+        if _ids(getattr(context, describe[0]))
+    ]
+    if not describes:
+        # An empty stack is discovered again, it may have been created since
+        return False
+    try:
+        with ThreadPoolExecutor(max_workers=len(describes)) as executor:
+            return all(list(executor.map(exists, describes)))
+    except ClientError as e:
+        # e.g. InvalidSubnetID.NotFound or LoadBalancerNotFound
+        logger.info(f"Inventory entry out of date: {e}")
+        return False
+
+
+def open_inventory(inventory_dir=None, ttl=None):
+    """
+    Returns the inventory of the stacks. The directory and the TTL default to the
+    MAGICDUST_INVENTORY_DIR and MAGICDUST_INVENTORY_TTL environment variables.
+    :param inventory_dir: Directory of the inventory files
+    :param ttl: Number of seconds an entry is served
+    :return: Inventory, or None when no inventory directory is set
+    """
+    inventory_dir = inventory_dir or os.environ.get(INVENTORY_DIR_ENV_VAR)
+    if not inventory_dir:
+        return None
+    if ttl is None:
+        ttl = int(os.environ.get(INVENTORY_TTL_ENV_VAR, DEFAULT_TTL))
+    return Inventory(inventory_dir, ttl)
+
+
+def _ids(value):
+    if isinstance(value, list):
+        return value
+    return [value] if value else []
@@ -0,0 +1,189 @@
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from libs import get_logger
+from libs.profiling import span
+
+MAX_RETRIES = 8
+RETRY_DELAY = 1
+RETRY_MAX_DELAY = 20
+RETRY_DEADLINE = 300
+
+# Classes of the errors
+THROTTLING = "throttling"
+DEPENDENCY = "dependency"
+EVENTUAL_CONSISTENCY = "eventual consistency"
+FATAL = "fatal"
+
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "SlowDown",
+    "PriorRequestNotComplete",
+}
+# The resource is still used by another one being deleted, which AWS releases asynchronously
+DEPENDENCY_ERROR_CODES = {
+    "DependencyViolation",
+    "ResourceInUse",
+    "ResourceInUseException",
+    "InvalidNetworkInterface.InUse",
+    "ClusterContainsContainerInstancesException",
+    "ClusterContainsServicesException",
+    "ClusterContainsTasksException",
+    "UpdateInProgressException",
+}
+# The resource was just created and is not visible yet to every EC2 endpoint
+EVENTUAL_CONSISTENCY_ERROR_CODES = {
+    "InvalidGroup.NotFound",
+    "InvalidVpcID.NotFound",
+    "InvalidSubnetID.NotFound",
+    "InvalidRouteTableID.NotFound",
+    "InvalidInternetGatewayID.NotFound",
+    "InvalidNetworkInterfaceID.NotFound",
+}
+# Operations removing a resource, for which a NotFound error means the resource is already gone
+DELETE_OPERATION_PREFIXES = ("delete_", "detach_")
+
+logger = get_logger(__name__)
+
+
+def classify(error):
+    """
+    Classifies a botocore error by its code
+    :param error: ClientError
+    :return: THROTTLING, DEPENDENCY, EVENTUAL_CONSISTENCY or FATAL
+    """
+    code = error.response.get("Error", {}).get("Code", "")
+    if code in THROTTLING_ERROR_CODES:
+        return THROTTLING
+    if code in DEPENDENCY_ERROR_CODES:
+        return DEPENDENCY
+    if code in EVENTUAL_CONSISTENCY_ERROR_CODES:
+        return EVENTUAL_CONSISTENCY
+    return FATAL
+
+
+class RetryStats:
+    """
+    Attempts and time spent sleeping of every retried operation of the process
+    """
+
+    def __init__(self):
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, attempts, sleep_seconds):
+        with self.lock:
+            calls, total_attempts, total_sleep = self.operations.get(
+                operation, (0, 0, 0.0)
+            )
+            self.operations[operation] = (
+                calls + 1,
+                total_attempts + attempts,
+                total_sleep + sleep_seconds,
+            )
+
+    def summary(self):
+        """
+        :return: One line per operation with its calls, attempts and seconds spent sleeping
+        """
+        with self.lock:
+            return "\n".join(
+                f"{operation}: {calls} calls, {attempts} attempts, {sleep:.2f} s sleeping"
+                for operation, (calls, attempts, sleep) in sorted(
+                    self.operations.items()
+                )
+            )
+
+    def clear(self):
+        with self.lock:
+            self.operations.clear()
+
+
+retry_stats = RetryStats()
+
+
+class RetryPolicy:
+    """
+    Retries the calls failing with a throttling, a dependency or an eventual consistency error,
+    sleeping with exponential backoff and full jitter between the attempts, i.e. a random delay
+    between 0 and min(max_delay, base_delay * 2 ** retry). The fatal errors are raised at once. A
+    delete or a detach failing with NotFound succeeded, as its resource is already gone.
+    """
+
+    def __init__(
+        self,
+        max_retries=MAX_RETRIES,
+        base_delay=RETRY_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        deadline=RETRY_DEADLINE,
+        stats=retry_stats,
+    ):
+        """
+        :param max_retries: Maximum number of attempts of a call
+        :param base_delay: Seconds of the first backoff
+        :param max_delay: Maximum seconds of a backoff
+        :param deadline: Seconds after which a call is not retried anymore, whatever its attempts
+        :param stats: RetryStats where the attempts are recorded
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.stats = stats
+
+    def backoff(self, retry):
+        """
+        :param retry: Number of the retry, starting at 0
+        :return: Seconds to sleep before the retry
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+    def call(self, operation, function, *args, **kwargs):
+        """
+        Calls a function until it succeeds, fails with a fatal error or runs out of attempts or time
+        :param operation: Name of the operation in the stats, e.g. delete_subnet_by_id
+        :param function: Function called with args and kwargs
+        :return: The return value of the function, None for a delete of a missing resource
+        """
+        deadline = time.monotonic() + self.deadline
+        attempts = 0
+        sleep_seconds = 0.0
+        try:
+            while True:
+                attempts += 1
+                try:
+                    return function(*args, **kwargs)
+                except ClientError as e:
+                    error_class = classify(e)
+                    if error_class == FATAL:
+                        raise
+                    if error_class == EVENTUAL_CONSISTENCY and operation.startswith(
+                        DELETE_OPERATION_PREFIXES
+                    ):
+                        logger.info(f"{operation}: already deleted ({e})")
+                        return None
+                    if attempts >= self.max_retries:
+                        raise Exception(f"Maximum retries exceeded: {e}")
+                    delay = self.backoff(attempts - 1)
+                    if time.monotonic() + delay > deadline:
+                        raise Exception(
+                            f"Retry deadline of {self.deadline} seconds exceeded: {e}"
+                        )
+                    logger.warn(
+                        f"Attempt {attempts} of {operation} failed with a {error_class} "
+                        f"error, trying again after {delay:.2f} seconds"
+                    )
+                    with span("retry.sleep", "retry", function=operation):
+                        time.sleep(delay)
+                    sleep_seconds += delay
+        finally:
+            self.stats.record(operation, attempts, sleep_seconds)
@@ -1,5 +1,3 @@
-import json
-
 from libs.boto3.common import *
 from libs.boto3.elbv2 import BotoElbv2
 
@@ -35,8 +33,9 @@ class BotoRoute53(BotoAws):
                 f"The Route53 record set: {record_set_domain} will not be deleted "
                 "as the --dry-run flag is set"
             )
-        if action not in {"CREATE", "DELETE"}:
-            raise ValueError(f"The action should either be CREATE or DELETE")
+            return
+        if action not in {"CREATE", "UPSERT", "DELETE"}:
+            raise ValueError(f"The action should either be CREATE, UPSERT or DELETE")
         template_file = self.get_template(
             template_file, CHANGE_RECORD_SET_TEMPLATE_FILE
         )
@@ -47,12 +46,11 @@ class BotoRoute53(BotoAws):
             if not elbv2_arns:
                 raise Exception("Could not file ELB instances matching the tag")
             elb_dns = boto_elbv2.get_elb_dns_by_arn(elbv2_arns[0])
-        os.environ["AWS_ENV_VARS_LOAD_BALANCER_DNS"] = elb_dns
-        os.environ["AWS_ENV_VARS_ROUTE53_ACTION_TYPE"] = action
-        request_string = self.jinja_template.generate_from_template(
-            template_file, output_format="json", print_output=False
-        )
-        request_dict = json.loads(request_string)
+        dynamic_vars = {
+            "AWS_ENV_VARS_LOAD_BALANCER_DNS": elb_dns,
+            "AWS_ENV_VARS_ROUTE53_ACTION_TYPE": action,
+        }
+        request_dict = self.render_request(template_file, dynamic_vars=dynamic_vars)
         try:
             self.client.change_resource_record_sets(**request_dict)
             self.logger.info(
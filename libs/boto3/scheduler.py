@@ -0,0 +1,231 @@
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from libs import get_logger
+from libs.profiling import span
+
+DEFAULT_MAX_PARALLEL = 4
+
+# Status of the steps
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+BLOCKED = "blocked"
+
+logger = get_logger(__name__)
+
+
+class Step:
+    """
+    Node of a provisioning graph. A step reads the fields of the StackContext named by its inputs and
+    fills in the fields named by its outputs, so it depends on the steps producing its inputs and on
+    the steps listed in after.
+    """
+
+    def __init__(self, name, function, inputs=(), outputs=(), after=(), always=False):
+        """
+        :param name: Name of the step, e.g. ec2.vpc
+        :param function: Function called with the StackContext
+        :param inputs: Fields of the StackContext read by the step
+        :param outputs: Fields of the StackContext filled in by the step
+        :param after: Names of the steps which must complete first, without passing any field
+        :param always: Flag whether to run the step even when resuming a stack which has its outputs
+        """
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.after = tuple(after)
+        self.always = always
+        self.status = None
+        self.error = None
+        self.start = None
+        self.end = None
+
+
+class StepScheduler:
+    """
+    Runs the steps of a graph on a bounded pool of threads, each step as soon as the steps it depends
+    on succeeded. When a step fails, the steps depending on it are blocked while the independent
+    ones keep running.
+    """
+
+    def __init__(self, steps, max_parallel=DEFAULT_MAX_PARALLEL):
+        self.steps = {step.name: step for step in steps}
+        self.max_parallel = max(max_parallel, 1)
+        self.dependencies = self.__dependencies()
+        self.order = self.__order(self.dependencies)
+        self.origin = None
+
+    def run(self, context, resume=False):
+        """
+        Runs all the steps
+        :param context: StackContext shared by the steps
+        :param resume: If set, the steps whose outputs are already in the context are skipped, as
+                       well as the steps without outputs which only depend on skipped steps
+        :return: Dictionary of the failed steps and their error
+        """
+        self.origin = time.perf_counter()
+        pending = dict(self.steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    statuses = {
+                        self.steps[dependency].status
+                        for dependency in self.dependencies[name]
+                    }
+                    if statuses & {FAILED, BLOCKED}:
+                        step.status = BLOCKED
+                        del pending[name]
+                    elif statuses <= {SUCCEEDED, SKIPPED}:
+                        del pending[name]
+                        if resume and self.__is_done(step, context, statuses):
+                            step.status = SKIPPED
+                            logger.info(f"Skipping {name}, already created")
+                        else:
+                            future = executor.submit(self.__run_step, step, context)
+                            running[future] = step
+                if not running:
+                    # The steps unblocked by this pass are scheduled by the next one
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+        return {
+            name: step.error
+            for name, step in self.steps.items()
+            if step.status == FAILED
+        }
+
+    def pending(self, context):
+        """
+        Returns the steps which a resumed run would execute, without running them
+        :param context: StackContext of the existing resources
+        :return: List of the names of the steps, in a dependency order
+        """
+        statuses = {}
+        for name in self.order:
+            dependencies = {
+                statuses[dependency] for dependency in self.dependencies[name]
+            }
+            if self.__is_done(self.steps[name], context, dependencies):
+                statuses[name] = SKIPPED
+            else:
+                statuses[name] = SUCCEEDED
+        return [name for name in self.order if statuses[name] == SUCCEEDED]
+
+    def report(self, out=None):
+        """
+        Prints the timing of every step and the critical path, i.e. the chain of dependent steps
+        which determined the wall time
+        :param out: File object where the report is printed, defaults to stdout
+        :return: List of the names of the steps of the critical path
+        """
+        out = out or sys.stdout
+        critical_path = self.critical_path()
+        width = max(len(name) for name in self.steps)
+        print(f"{'Step':{width}}  {'Start s':>8}  {'Duration s':>10}  Status", file=out)
+        timed = sorted(
+            self.steps.values(),
+            key=lambda step: step.start if step.start is not None else float("inf"),
+        )
+        for step in timed:
+            if step.start is None:
+                start, duration = f"{'-':>8}", f"{'-':>10}"
+            else:
+                start = f"{step.start - self.origin:8.2f}"
+                duration = f"{step.end - step.start:10.2f}"
+            marker = " *" if step.name in critical_path else ""
+            print(
+                f"{step.name:{width}}  {start}  {duration}  {step.status}{marker}",
+                file=out,
+            )
+        if critical_path:
+            last = self.steps[critical_path[-1]]
+            print(
+                f"Critical path (*): {' -> '.join(critical_path)}, "
+                f"{last.end - self.origin:.2f} s",
+                file=out,
+            )
+        return critical_path
+
+    def critical_path(self):
+        """
+        Returns the chain of steps ending with the last step to finish, each step being preceded by
+        the dependency which finished last
+        :return: List of the names of the steps
+        """
+        timed = [step for step in self.steps.values() if step.end is not None]
+        if not timed:
+            return []
+        step = max(timed, key=lambda step: step.end)
+        path = [step.name]
+        while True:
+            dependencies = [
+                self.steps[name]
+                for name in self.dependencies[step.name]
+                if self.steps[name].end is not None
+            ]
+            if not dependencies:
+                break
+            step = max(dependencies, key=lambda step: step.end)
+            path.append(step.name)
+        return list(reversed(path))
+
+    # Private methods
+
+    def __dependencies(self):
+        producers = {}
+        for step in self.steps.values():
+            for output in step.outputs:
+                producers[output] = step.name
+        dependencies = {}
+        for step in self.steps.values():
+            names = set(step.after)
+            names.update(
+                producers[field] for field in step.inputs if field in producers
+            )
+            unknown = names - set(self.steps)
+            if unknown:
+                raise ValueError(f"Unknown steps {unknown} required by {step.name}")
+            dependencies[step.name] = names
+        return dependencies
+
+    def __order(self, dependencies):
+        order = []
+        remaining = {name: set(names) for name, names in dependencies.items()}
+        while remaining:
+            ready = [name for name, names in remaining.items() if not names]
+            if not ready:
+                raise ValueError(
+                    f"Cycle between the steps: {', '.join(sorted(remaining))}"
+                )
+            for name in ready:
+                del remaining[name]
+            for names in remaining.values():
+                names.difference_update(ready)
+            order.extend(ready)
+        return order
+
+    def __is_done(self, step, context, statuses):
+        if step.always:
+            return False
+        if step.outputs:
+            return all(getattr(context, output) for output in step.outputs)
+        # A step without outputs was part of the creation of the resources it depends on
+        return bool(statuses) and statuses == {SKIPPED}
+
+    def __run_step(self, step, context):
+        step.start = time.perf_counter()
+        try:
+            with span(step.name, "step"):
+                step.function(context)
+            step.status = SUCCEEDED
+        except Exception as e:
+            step.status = FAILED
+            step.error = e
+            logger.error(f"Step {step.name} failed: {e}")
+        finally:
+            step.end = time.perf_counter()
@@ -0,0 +1,83 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from libs.boto3.tag_discovery import ECS_CLUSTER, LOAD_BALANCER, TARGET_GROUP, VPC
+
+
+@dataclass
+class StackContext:
+    """
+    IDs of the resources of an ECS Fargate stack, filled in by every provisioning step and read by the
+    next ones, so that a step never looks up by tag what a previous step created
+    """
+
+    vpc_id: Optional[str] = None
+    subnet_ids: List[str] = field(default_factory=list)
+    internet_gateway_id: Optional[str] = None
+    route_table_id: Optional[str] = None
+    security_group_id: Optional[str] = None
+    load_balancer_arn: Optional[str] = None
+    load_balancer_dns: Optional[str] = None
+    target_group_arn: Optional[str] = None
+    listener_arns: List[str] = field(default_factory=list)
+    cluster_arn: Optional[str] = None
+
+    def dynamic_vars(self):
+        """
+        Returns the dynamic variables of the resources created so far, which every template of the
+        stack may reference, e.g. %%AWS_ENV_VARS_VPC_ID in the values file
+        :return: Dictionary of the dynamic variable names to the IDs
+        """
+        dynamic_vars = {
+            "AWS_ENV_VARS_VPC_ID": self.vpc_id,
+            "AWS_ENV_VARS_SG_ID": self.security_group_id,
+            "AWS_ENV_VARS_ELBV2_ARN": self.load_balancer_arn,
+            "AWS_ENV_VARS_LOAD_BALANCER_DNS": self.load_balancer_dns,
+            "AWS_ENV_VARS_TARGET_GROUP_ARN": self.target_group_arn,
+        }
+        for index, subnet_id in enumerate(self.subnet_ids):
+            dynamic_vars[f"AWS_ENV_VARS_SUBNET_ID_{index + 1}"] = subnet_id
+        return {name: value for name, value in dynamic_vars.items() if value}
+
+    @classmethod
+    def discover(cls, boto_ec2, boto_elbv2, boto_ecs):
+        """
+        Finds by tag the resources of a stack created by a previous run, to resume its creation
+        :param boto_ec2: BotoEc2
+        :param boto_elbv2: BotoElbv2
+        :param boto_ecs: BotoEcs
+        :return: StackContext
+        """
+        context = cls()
+        # One lookup of all the tagged resources of the stack
+        resources = boto_ec2.tag_discovery.find_all(
+            [VPC, LOAD_BALANCER, TARGET_GROUP, ECS_CLUSTER]
+        )
+        vpc_ids = resources[VPC]
+        if vpc_ids:
+            # At most 1 VPC will be found
+            context.vpc_id = vpc_ids[0]
+            context.subnet_ids = boto_ec2.get_subnets_by_vpc_id(context.vpc_id)
+            context.route_table_id = boto_ec2.get_main_route_table_by_vpc_id(
+                context.vpc_id
+            )
+            context.internet_gateway_id = next(
+                iter(boto_ec2.get_internet_gateways_by_vpc_id(context.vpc_id)), None
+            )
+            context.security_group_id = next(
+                iter(boto_ec2.get_security_groups_by_vpc_id(context.vpc_id)), None
+            )
+        elbv2_arns = resources[LOAD_BALANCER]
+        if elbv2_arns:
+            context.load_balancer_arn = elbv2_arns[0]
+            context.load_balancer_dns = boto_elbv2.get_elb_dns_by_arn(elbv2_arns[0])
+            context.listener_arns = boto_elbv2.get_listeners_by_elbv2_arn(
+                context.load_balancer_arn
+            )
+        tg_arns = resources[TARGET_GROUP]
+        if tg_arns:
+            context.target_group_arn = tg_arns[0]
+        cluster_arns = resources[ECS_CLUSTER]
+        if cluster_arns:
+            context.cluster_arn = cluster_arns[0]
+        return context
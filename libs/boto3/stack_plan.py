@@ -0,0 +1,416 @@
+import sys
+
+from libs import get_logger
+
+# Actions of the changes
+CREATE = "create"
+MODIFY = "modify"
+DELETE = "delete"
+
+SYMBOLS = {CREATE: "+", MODIFY: "~", DELETE: "-"}
+
+# Fields of the requests which are not part of the state of the resources
+REQUEST_ONLY_FIELDS = {"LoadBalancerArn", "TagSpecifications", "Tags", "DryRun"}
+# Fields of a subnet request placing it in a zone
+SUBNET_ZONE_FIELDS = ["AvailabilityZone", "AvailabilityZoneId"]
+# Kinds of the sources of the ingress rules and their fields, the first one present naming the
+# source, e.g. a security group is named by its GroupId or its GroupName
+INGRESS_SOURCES = {
+    "IpRanges": ["CidrIp"],
+    "Ipv6Ranges": ["CidrIpv6"],
+    "PrefixListIds": ["PrefixListId"],
+    "UserIdGroupPairs": ["GroupId", "GroupName"],
+}
+# Names of the protocols EC2 describes as given in the request, e.g. 6 instead of tcp
+PROTOCOL_NAMES = {"6": "tcp", "17": "udp", "1": "icmp", "58": "icmpv6", "all": "-1"}
+# Protocol of the rules allowing all the traffic, whatever their ports
+ALL_PROTOCOLS = "-1"
+
+logger = get_logger(__name__)
+
+
+class Change:
+    """
+    Change of one resource of an existing stack, applied by calling its function
+    """
+
+    def __init__(self, action, resource, name, detail="", function=None):
+        """
+        :param action: CREATE, MODIFY or DELETE
+        :param resource: Type of the resource, e.g. elbv2.listener
+        :param name: Identifier of the resource in the plan, e.g. the port of a listener
+        :param detail: Description of the difference
+        :param function: Function applying the change
+        """
+        self.action = action
+        self.resource = resource
+        self.name = name
+        self.detail = detail
+        self.function = function
+
+    def __str__(self):
+        detail = f": {self.detail}" if self.detail else ""
+        return f"{SYMBOLS[self.action]} {self.resource} {self.name}{detail}"
+
+
+class StackPlan:
+    """
+    Difference between the requests rendered from the templates and the live state of a stack. The
+    missing resources of the stack are created by the steps of the create graph, the subnets, the
+    ingress rules of the security group, the subnets of the load balancer and the listeners of the
+    existing resources are created, modified or deleted one by one.
+    """
+
+    def __init__(self, boto_ec2, boto_elbv2, context, steps):
+        """
+        :param boto_ec2: BotoEc2
+        :param boto_elbv2: BotoElbv2
+        :param context: StackContext of the existing resources
+        :param steps: Names of the create steps to run
+        """
+        self.boto_ec2 = boto_ec2
+        self.boto_elbv2 = boto_elbv2
+        self.context = context
+        self.steps = steps
+        self.changes = []
+        # Subnet Ids created by the plan by CIDR block
+        self.created_subnet_ids = {}
+        if context.vpc_id and context.subnet_ids:
+            self.changes.extend(self.__subnet_changes())
+        if context.security_group_id:
+            self.changes.extend(self.__ingress_changes())
+        if (
+            context.load_balancer_arn
+            and context.target_group_arn
+            and context.listener_arns
+        ):
+            self.changes.extend(self.__listener_changes())
+
+    def is_empty(self):
+        return not (self.steps or self.changes)
+
+    def print(self, out=None):
+        """
+        Prints the steps and the changes of the plan
+        :param out: File object where the plan is printed, defaults to stdout
+        :return: None
+        """
+        out = out or sys.stdout
+        counts = {CREATE: len(self.steps), MODIFY: 0, DELETE: 0}
+        for change in self.changes:
+            counts[change.action] += 1
+        print(
+            f"Plan: {counts[CREATE]} to create, {counts[MODIFY]} to modify, "
+            f"{counts[DELETE]} to delete",
+            file=out,
+        )
+        for step in self.steps:
+            print(f"{SYMBOLS[CREATE]} {step}", file=out)
+        for change in self.changes:
+            print(change, file=out)
+
+    def apply_changes(self):
+        """
+        Applies the changes of the existing resources, in the order of the plan
+        :return: None
+        """
+        for change in self.changes:
+            logger.info(f"Applying {change}")
+            change.function()
+
+    # Private methods
+
+    def __subnet_changes(self):
+        ec2 = self.boto_ec2
+        template_file = ec2.get_template(None, "subnets.yaml.jinja2")
+        desired = {
+            request["CidrBlock"]: request
+            for request in ec2.jinja_template.render_to_object(
+                template_file, dynamic_vars=self.context.dynamic_vars()
+            )
+        }
+        live = {
+            subnet["CidrBlock"]: subnet
+            for subnet in ec2.get_subnet_details_by_vpc_id(self.context.vpc_id)
+        }
+        # A subnet cannot change zone, it is replaced when the template moves it
+        moved = {
+            cidr
+            for cidr in set(desired) & set(live)
+            if not _same_zone(desired[cidr], live[cidr])
+        }
+        kept = {
+            cidr: live[cidr]["SubnetId"]
+            for cidr in set(desired) & set(live)
+            if cidr not in moved
+        }
+        changes = []
+        for cidr in sorted((set(desired) - set(live)) | moved):
+            changes.append(
+                Change(
+                    CREATE,
+                    "ec2.subnet",
+                    _subnet_name(desired[cidr]),
+                    function=lambda cidr=cidr: self.__create_subnet(
+                        cidr, desired[cidr]
+                    ),
+                )
+            )
+        # The load balancer is moved to its new subnets before the deleted ones go
+        if self.context.load_balancer_arn:
+            elbv2_arn = self.context.load_balancer_arn
+            live_elbv2_subnets = self.boto_elbv2.get_elbv2_subnets_by_arn(elbv2_arn)
+            # The subnets to create are named by their CIDR block and zone until they have an Id
+            planned_subnets = self.__elbv2_subnets(
+                [kept.get(cidr) or _subnet_name(desired[cidr]) for cidr in desired]
+            )
+            if set(planned_subnets) != set(live_elbv2_subnets):
+                changes.append(
+                    Change(
+                        MODIFY,
+                        "elbv2.load_balancer",
+                        elbv2_arn,
+                        f"subnets {sorted(live_elbv2_subnets)} -> {planned_subnets}",
+                        lambda: self.boto_elbv2.client.set_subnets(
+                            LoadBalancerArn=elbv2_arn,
+                            Subnets=self.__elbv2_subnets(
+                                [
+                                    kept.get(cidr) or self.created_subnet_ids[cidr]
+                                    for cidr in desired
+                                ]
+                            ),
+                        ),
+                    )
+                )
+        for cidr in sorted((set(live) - set(desired)) | moved):
+            subnet_id = live[cidr]["SubnetId"]
+            changes.append(
+                Change(
+                    DELETE,
+                    "ec2.subnet",
+                    _subnet_name(live[cidr]),
+                    subnet_id,
+                    lambda subnet_id=subnet_id: ec2.delete_subnet_by_id(subnet_id),
+                )
+            )
+        return changes
+
+    def __elbv2_subnets(self, subnet_ids):
+        request = self.boto_elbv2.render_elbv2_request(
+            subnet_ids, self.context.security_group_id
+        )
+        if "SubnetMappings" in request:
+            return [mapping["SubnetId"] for mapping in request["SubnetMappings"]]
+        return request.get("Subnets", [])
+
+    def __create_subnet(self, cidr, request):
+        subnet_id = self.boto_ec2.client.create_subnet(**request)["Subnet"]["SubnetId"]
+        logger.info(f"Subnet created successfully with ID: {subnet_id}")
+        route_table_id = (
+            self.context.route_table_id
+            or self.boto_ec2.get_main_route_table_by_vpc_id(self.context.vpc_id)
+        )
+        self.boto_ec2.associate_subnets_with_route_table(route_table_id, [subnet_id])
+        self.created_subnet_ids[cidr] = subnet_id
+
+    def __ingress_changes(self):
+        ec2 = self.boto_ec2
+        sg_id = self.context.security_group_id
+        template_file = ec2.get_template(None, "security_group_ingress.yaml.jinja2")
+        request = ec2.jinja_template.render_to_object(
+            template_file, dynamic_vars=self.context.dynamic_vars()
+        )
+        live_permissions = ec2.get_security_group_ingress(sg_id)
+        # The security groups a template names are compared by the Ids described
+        group_ids = {
+            pair["GroupName"]: pair["GroupId"]
+            for permission in live_permissions
+            for pair in permission.get("UserIdGroupPairs") or []
+            if pair.get("GroupName") and pair.get("GroupId")
+        }
+        desired = _ingress_rules(_ip_permissions(request), group_ids)
+        live = _ingress_rules(live_permissions)
+        changes = []
+        for rule in sorted(desired - live, key=str):
+            changes.append(
+                Change(
+                    CREATE,
+                    "ec2.security_group_ingress",
+                    _rule_name(rule),
+                    function=lambda rule=rule: ec2.client.authorize_security_group_ingress(
+                        GroupId=sg_id, IpPermissions=[_ip_permission(rule)]
+                    ),
+                )
+            )
+        for rule in sorted(live - desired, key=str):
+            changes.append(
+                Change(
+                    DELETE,
+                    "ec2.security_group_ingress",
+                    _rule_name(rule),
+                    function=lambda rule=rule: ec2.client.revoke_security_group_ingress(
+                        GroupId=sg_id, IpPermissions=[_ip_permission(rule)]
+                    ),
+                )
+            )
+        return changes
+
+    def __listener_changes(self):
+        elbv2 = self.boto_elbv2
+        elbv2_arn = self.context.load_balancer_arn
+        template_file = elbv2.get_template(None, "elbv2_listeners.yaml.jinja2")
+        desired = {
+            request["Port"]: request
+            for request in elbv2.jinja_template.render_to_object(
+                template_file, dynamic_vars=self.context.dynamic_vars()
+            )
+        }
+        live = {
+            listener["Port"]: listener
+            for listener in elbv2.get_listener_details_by_elbv2_arn(elbv2_arn)
+        }
+        changes = []
+        for port in sorted(desired):
+            request = desired[port]
+            if port not in live:
+                changes.append(
+                    Change(
+                        CREATE,
+                        "elbv2.listener",
+                        port,
+                        function=lambda request=request: elbv2.client.create_listener(
+                            **request
+                        ),
+                    )
+                )
+                continue
+            fields = {
+                name: value
+                for name, value in request.items()
+                if name not in REQUEST_ONLY_FIELDS
+                and not _matches(value, live[port].get(name))
+            }
+            if fields:
+                changes.append(
+                    Change(
+                        MODIFY,
+                        "elbv2.listener",
+                        port,
+                        ", ".join(sorted(fields)),
+                        lambda arn=live[port]["ListenerArn"], fields=fields: (
+                            elbv2.client.modify_listener(ListenerArn=arn, **fields)
+                        ),
+                    )
+                )
+        for port in sorted(set(live) - set(desired)):
+            changes.append(
+                Change(
+                    DELETE,
+                    "elbv2.listener",
+                    port,
+                    function=lambda arn=live[port]["ListenerArn"]: (
+                        elbv2.client.delete_listener(ListenerArn=arn)
+                    ),
+                )
+            )
+        return changes
+
+
+def _subnet_name(subnet):
+    zone = subnet.get("AvailabilityZone") or subnet.get("AvailabilityZoneId")
+    return f"{subnet['CidrBlock']} {zone}" if zone else subnet["CidrBlock"]
+
+
+def _same_zone(request, subnet):
+    """
+    Compares the zone of a requested subnet with the live one, when the request sets it. EC2 picks
+    the zone of a subnet requested without any.
+    """
+    return all(
+        request[name] == subnet.get(name)
+        for name in SUBNET_ZONE_FIELDS
+        if request.get(name)
+    )
+
+
+def _matches(desired, live):
+    """
+    Compares a requested value with its live state, which describes more fields than requested,
+    e.g. the forward config AWS derives from the target group of an action
+    """
+    if isinstance(desired, dict):
+        return isinstance(live, dict) and all(
+            _matches(value, live.get(name)) for name, value in desired.items()
+        )
+    if isinstance(desired, list):
+        return (
+            isinstance(live, list)
+            and len(desired) == len(live)
+            and all(_matches(value, item) for value, item in zip(desired, live))
+        )
+    return desired == live or str(desired) == str(live)
+
+
+def _ip_permissions(request):
+    if "IpPermissions" in request:
+        return request["IpPermissions"]
+    # Short form of a single rule: IpProtocol, FromPort, ToPort and CidrIp
+    permission = {
+        name: request[name]
+        for name in ["IpProtocol", "FromPort", "ToPort"]
+        if name in request
+    }
+    permission["IpRanges"] = [{"CidrIp": request["CidrIp"]}]
+    return [permission]
+
+
+def _ingress_rules(ip_permissions, group_ids=None):
+    """
+    Splits the IpPermissions into single rules, the descriptions aside. The protocols are named
+    and the ports of the rules of all the protocols are dropped, as EC2 ignores them.
+    :param ip_permissions: IpPermissions of a request or of a security group
+    :param group_ids: Dictionary of the Ids of the security groups by name
+    :return: Set of tuples of the protocol, the ports, the kind, the field and the value of the
+             source
+    """
+    group_ids = group_ids or {}
+    rules = set()
+    for permission in ip_permissions:
+        protocol = str(permission.get("IpProtocol")).lower()
+        protocol = PROTOCOL_NAMES.get(protocol, protocol)
+        if protocol == ALL_PROTOCOLS:
+            ports = (None, None)
+        else:
+            ports = tuple(
+                None if port is None else int(port)
+                for port in (permission.get("FromPort"), permission.get("ToPort"))
+            )
+        for kind, fields in INGRESS_SOURCES.items():
+            for source in permission.get(kind) or []:
+                field = next((field for field in fields if source.get(field)), None)
+                if field is None:
+                    continue
+                value = source[field]
+                if field == "GroupName" and value in group_ids:
+                    field, value = "GroupId", group_ids[value]
+                rules.add((protocol,) + ports + (kind, field, value))
+    return rules
+
+
+def _ip_permission(rule):
+    protocol, from_port, to_port, kind, field, value = rule
+    permission = {"IpProtocol": protocol}
+    if from_port is not None:
+        permission["FromPort"] = from_port
+    if to_port is not None:
+        permission["ToPort"] = to_port
+    permission[kind] = [{field: value}]
+    return permission
+
+
+def _rule_name(rule):
+    protocol, from_port, to_port, _, _, value = rule
+    if from_port is None and to_port is None:
+        return f"{protocol} from {value}"
+    ports = f"{from_port}" if from_port == to_port else f"{from_port}-{to_port}"
+    return f"{protocol}/{ports} from {value}"
@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from libs import get_logger
+from libs.boto3.clients import get_client
+
+# Resource types of the Resource Groups Tagging API
+VPC = "ec2:vpc"
+ECS_CLUSTER = "ecs:cluster"
+LOAD_BALANCER = "elasticloadbalancing:loadbalancer"
+TARGET_GROUP = "elasticloadbalancing:targetgroup"
+
+# Maximum number of resources of a describe call with tags
+DESCRIBE_CLUSTERS_CHUNK = 100
+DESCRIBE_TAGS_CHUNK = 20
+MAX_CONCURRENT_DESCRIBES = 8
+
+logger = get_logger(__name__)
+
+
+class TagDiscovery:
+    """
+    Finds the resources of a stack by tag with the paginated get_resources calls of the Resource
+    Groups Tagging API, one call for all the resource types. When the API is not allowed, the
+    resources of every service are listed and their tags described concurrently, by chunks.
+    """
+
+    def __init__(self, tag_key, tag_value, region=None):
+        self.tag_key = tag_key
+        self.tag_value = tag_value
+        self.region = region
+
+    def find(self, resource_type):
+        """
+        Finds the resources of one type
+        :param resource_type: One of VPC, ECS_CLUSTER, LOAD_BALANCER, TARGET_GROUP
+        :return: List of the VPC IDs for VPC, of the ARNs otherwise
+        """
+        return self.find_all([resource_type])[resource_type]
+
+    def find_all(self, resource_types):
+        """
+        Finds the resources of several types
+        :param resource_types: List of VPC, ECS_CLUSTER, LOAD_BALANCER, TARGET_GROUP
+        :return: Dictionary of the resource type to the list of the IDs or ARNs of its resources
+        """
+        try:
+            return self.__get_resources(resource_types)
+        except ClientError as e:
+            logger.info(
+                f"Resource Groups Tagging API not available, describing the resources: {e}"
+            )
+        fallbacks = {
+            VPC: self.__describe_vpcs,
+            ECS_CLUSTER: self.__describe_ecs_clusters,
+            LOAD_BALANCER: self.__describe_load_balancers,
+            TARGET_GROUP: self.__describe_target_groups,
+        }
+        with ThreadPoolExecutor(max_workers=len(resource_types)) as executor:
+            futures = {
+                resource_type: executor.submit(fallbacks[resource_type])
+                for resource_type in resource_types
+            }
+        return {
+            resource_type: future.result() for resource_type, future in futures.items()
+        }
+
+    # Private methods
+
+    def __get_resources(self, resource_types):
+        client = get_client("resourcegroupstaggingapi", self.region)
+        resources = {resource_type: [] for resource_type in resource_types}
+        pages = client.get_paginator("get_resources").paginate(
+            TagFilters=[{"Key": self.tag_key, "Values": [self.tag_value]}],
+            ResourceTypeFilters=list(resource_types),
+        )
+        for page in pages:
+            for mapping in page.get("ResourceTagMappingList"):
+                arn = mapping.get("ResourceARN")
+                resource_type = _resource_type(arn)
+                if resource_type == VPC:
+                    resources[VPC].append(arn.split("/")[-1])
+                elif resource_type in resources:
+                    resources[resource_type].append(arn)
+        return resources
+
+    def __describe_vpcs(self):
+        client = get_client("ec2", self.region)
+        pages = client.get_paginator("describe_vpcs").paginate(
+            Filters=[{"Name": f"tag:{self.tag_key}", "Values": [self.tag_value]}]
+        )
+        return [vpc.get("VpcId") for page in pages for vpc in page.get("Vpcs")]
+
+    def __describe_ecs_clusters(self):
+        client = get_client("ecs", self.region)
+        pages = client.get_paginator("list_clusters").paginate()
+        arns = [arn for page in pages for arn in page.get("clusterArns")]
+
+        def describe(chunk):
+            response = client.describe_clusters(clusters=chunk, include=["TAGS"])
+            return [
+                (cluster.get("clusterArn"), cluster.get("tags") or [])
+                for cluster in response.get("clusters")
+            ]
+
+        return [
+            arn
+            for arn, tags in _describe_by_chunk(describe, arns, DESCRIBE_CLUSTERS_CHUNK)
+            if {"key": self.tag_key, "value": self.tag_value} in tags
+        ]
+
+    def __describe_load_balancers(self):
+        client = get_client("elbv2", self.region)
+        pages = client.get_paginator("describe_load_balancers").paginate()
+        arns = [
+            elb.get("LoadBalancerArn")
+            for page in pages
+            for elb in page.get("LoadBalancers")
+        ]
+        return self.__filter_elbv2_by_tag(client, arns)
+
+    def __describe_target_groups(self):
+        client = get_client("elbv2", self.region)
+        pages = client.get_paginator("describe_target_groups").paginate()
+        arns = [
+            tg.get("TargetGroupArn")
+            for page in pages
+            for tg in page.get("TargetGroups")
+        ]
+        return self.__filter_elbv2_by_tag(client, arns)
+
+    def __filter_elbv2_by_tag(self, client, arns):
+        def describe(chunk):
+            response = client.describe_tags(ResourceArns=chunk)
+            return [
+                (row.get("ResourceArn"), row.get("Tags") or [])
+                for row in response.get("TagDescriptions")
+            ]
+
+        return [
+            arn
+            for arn, tags in _describe_by_chunk(describe, arns, DESCRIBE_TAGS_CHUNK)
+            if {"Key": self.tag_key, "Value": self.tag_value} in tags
+        ]
+
+
+def _resource_type(arn):
+    # e.g. arn:aws:elasticloadbalancing:us-east-1:123456789012:loadbalancer/app/name/id
+    service, resource = arn.split(":")[2], arn.split(":", 5)[5]
+    return f"{service}:{resource.split('/')[0]}"
+
+
+def _describe_by_chunk(describe, items, chunk_size):
+    chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if not chunks:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=min(len(chunks), MAX_CONCURRENT_DESCRIBES)
+    ) as executor:
+        return [row for rows in executor.map(describe, chunks) for row in rows]
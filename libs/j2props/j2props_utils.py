@@ -1,16 +1,33 @@
 import os
 from pathlib import Path
 
-import boto3
 import yaml
-from botocore.exceptions import ClientError
 from jinja2 import Environment, FileSystemLoader, Template
 
+from libs.j2props.secret_cache import DEFAULT_VERSION_STAGE, SecretCache
+from libs.j2props.secret_prefetch import (
+    find_secret_references,
+    prefetch_secrets,
+    resolve_secret_ids,
+)
+from libs.profiling import span
+
 
 class J2PropsTemplate:
-    def __init__(self, region="us-east-2"):
+    def __init__(self, region="us-east-2", disk_cache=None):
+        """
+        :param region: AWS region of the secrets
+        :param disk_cache: Optional EncryptedDiskCache keeping the secrets between the runs
+        """
         self.region = region
         self._aws_client = None
+        self._jinja_envs = {}
+        # Parsed input values of every values file, as (signature, values)
+        self._input_values = {}
+        # Secret references of every compiled template, as (template, references)
+        self._secret_references = {}
+        # Secrets looked up by the renders of this instance
+        self.secret_cache = SecretCache(self.__fetch_secret, disk_cache)
 
     # Public methods
 
@@ -19,6 +36,7 @@ class J2PropsTemplate:
         Performs a jinja2 template expansion from the given input and template files.  Adds functionality to
         replace secrets from AWS Secrets Manager using the awssecrets filter:
         mysecretvalue={{ some.yaml.path | awssecret }}
+        mypreviousvalue={{ some.yaml.path | awssecret("AWSPREVIOUS") }}
 
         This will lookup the value of the secret defined at some.yaml.path in AWS Secrets Manager, where value in the
         input file contains a key into AWS SM (example: myapp/dev/oracle/password).
@@ -28,30 +46,69 @@ class J2PropsTemplate:
         This will lookup the ARN of the secret defined at some.yaml.path in AWS Secrets Manager, where value in the
         input file contains a key into AWS SM (example: myapp/dev/oracle/password).
 
+        Both filters take an optional version stage, AWSCURRENT by default. Every secret is looked up
+        once per instance, whatever the number of filters referencing it.
+
         :param input_file: path to the input values yaml file
         :param template_file: path to the jinja2 template file to expand
         :return: None - writes to stdout
         """
-        self.__validate_paths(input_file, template_file)
+        rendered_data = self.render_from_template(input_file, template_file)
 
-        template_dir = Path(template_file).parent
-        template_file = Path(template_file).name
-        jinja_env = Environment(loader=FileSystemLoader(template_dir))
-        jinja_env.filters["awssecret"] = self.__lookup_aws_secret_filter
-        jinja_env.filters["awssecretarn"] = self.__lookup_aws_secret_arn_filter
+        # Write rendered data to stdout
+        print(rendered_data)
 
-        # Load YAML input
-        with open(input_file, "r") as file:
-            input_data = yaml.safe_load(file)
+    def render_from_template(self, input_file, template_file):
+        """
+        Performs the same expansion as generate_from_template and returns the rendered text.  The jinja
+        environment of each template directory is kept, so the compiled templates are reused by the
+        next renders of the same instance.
 
-        # Load Jinja2 template
-        template = jinja_env.get_template(template_file)
+        The secrets referenced by the template and the templates it includes are retrieved
+        concurrently before the render. The filters whose input is computed at render time look
+        their secret up during the render.
+
+        :param input_file: path to the input values yaml file
+        :param template_file: path to the jinja2 template file to expand
+        :return: The rendered template
+        """
+        _, template, input_data = self.__load(input_file, template_file)
+
+        # Retrieve the secrets referenced by the template all at once
+        self.prefetch_secrets([(input_file, template_file)])
 
         # Render template with YAML data and environment variables
-        rendered_data = template.render(input_data)
+        return template.render(input_data)
 
-        # Write rendered data to stdout
-        print(rendered_data)
+    def prefetch_secrets(self, files):
+        """
+        Retrieves concurrently the secrets referenced by several templates, which can then be
+        rendered without looking any secret up, e.g. by concurrent threads. The files which cannot be
+        loaded are skipped and their errors returned.
+        :param files: List of (input values file, template file)
+        :return: Dictionary of the exception of every (input values file, template file) which could
+                 not be loaded
+        """
+        keys = set()
+        errors = {}
+        for input_file, template_file in files:
+            try:
+                jinja_env, template, input_data = self.__load(input_file, template_file)
+            except Exception as e:
+                errors[(input_file, template_file)] = e
+                continue
+            cached = self._secret_references.get(template.filename)
+            if cached is None or cached[0] is not template:
+                # The template was compiled again, so its references may have changed
+                cached = (template, find_secret_references(jinja_env, template.name))
+                self._secret_references[template.filename] = cached
+            keys |= resolve_secret_ids(cached[1], input_data or {})
+        if keys and self.secret_cache.missing(keys):
+            with span("j2props.prefetch", secrets=len(keys)):
+                prefetch_secrets(
+                    self.secret_cache, self.__get_client(), keys, self.__fetch_secret
+                )
+        return errors
 
     # Private methods
 
@@ -62,51 +119,99 @@ class J2PropsTemplate:
         if not os.path.isfile(template_file):
             raise FileExistsError(f"Not a valid file: {template_file}")
 
+    def __load(self, input_file, template_file):
+        """
+        Return the jinja environment, the compiled template and the input values of a render
+        :param input_file: path to the input values yaml file
+        :param template_file: path to the jinja2 template file to expand
+        :return: (jinja2 Environment, jinja2 Template, input values)
+        """
+        self.__validate_paths(input_file, template_file)
+
+        template_dir = Path(template_file).parent
+        template_file = Path(template_file).name
+        jinja_env = self.__get_jinja_env(template_dir)
+
+        # Load YAML input, parsed again only once the file is modified
+        stat = os.stat(input_file)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._input_values.get(input_file)
+        if cached is None or cached[0] != signature:
+            with open(input_file, "r") as file:
+                cached = (signature, yaml.safe_load(file))
+            self._input_values[input_file] = cached
+
+        # Load Jinja2 template
+        template = jinja_env.get_template(template_file)
+        return jinja_env, template, cached[1]
+
+    def __get_jinja_env(self, template_dir):
+        """
+        Return the jinja2 environment loading the templates of the given directory
+        :param template_dir: directory of the template files
+        :return: jinja2 Environment
+        """
+        jinja_env = self._jinja_envs.get(template_dir)
+        if jinja_env is None:
+            jinja_env = Environment(loader=FileSystemLoader(template_dir))
+            jinja_env.filters["awssecret"] = self.__lookup_aws_secret_filter
+            jinja_env.filters["awssecretarn"] = self.__lookup_aws_secret_arn_filter
+            # Concurrent renders keep the first environment of the directory
+            jinja_env = self._jinja_envs.setdefault(template_dir, jinja_env)
+        return jinja_env
+
     def __get_client(self):
         """
-        Return an AWS boto3 client using lazy initialization.
+        Return an AWS boto3 client using lazy initialization. The client is shared by all the
+        instances of the process.
         :return: boto3 client
         """
         if self._aws_client is None:
-            # Create a Secrets Manager client
-            session = boto3.session.Session()
-            self._aws_client = session.client(
-                service_name="secretsmanager", region_name=self.region
-            )
+            # boto3 is only imported once a secret is looked up
+            from libs.boto3.clients import get_client
+
+            # Get the Secrets Manager client
+            self._aws_client = get_client("secretsmanager", self.region)
         return self._aws_client
 
-    def __lookup_aws_secret_filter(self, secret_name):
+    def __fetch_secret(self, secret_name, version_stage):
         """
-        Expand a reference to a secret pulling from AWS Secrets Manager
+        Retrieve a secret from AWS Secrets Manager, called on a secret cache miss
         :param secret_name: name of the secret to retrieve
-        :return: Secret value from AWS
+        :param version_stage: staging label of the version to retrieve
+        :return: GetSecretValue response
         """
+        from botocore.exceptions import ClientError
+
         client = self.__get_client()
         try:
-            get_secret_value_response = client.get_secret_value(SecretId=secret_name)
+            return client.get_secret_value(
+                SecretId=secret_name, VersionStage=version_stage
+            )
         except ClientError as e:
             # For a list of exceptions thrown, see
             # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
             raise e
 
-        # Decrypts secret using the associated KMS key.
-        secret = get_secret_value_response["SecretString"]
-        return secret
-
-    def __lookup_aws_secret_arn_filter(self, secret_name):
+    def __lookup_aws_secret_filter(
+        self, secret_name, version_stage=DEFAULT_VERSION_STAGE
+    ):
         """
         Expand a reference to a secret pulling from AWS Secrets Manager
         :param secret_name: name of the secret to retrieve
+        :param version_stage: staging label of the version to retrieve
         :return: Secret value from AWS
         """
-        client = self.__get_client()
-        try:
-            get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-        except ClientError as e:
-            # For a list of exceptions thrown, see
-            # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-            raise e
-
         # Decrypts secret using the associated KMS key.
-        secret = get_secret_value_response["ARN"]
-        return secret
+        return self.secret_cache.get(secret_name, version_stage)["SecretString"]
+
+    def __lookup_aws_secret_arn_filter(
+        self, secret_name, version_stage=DEFAULT_VERSION_STAGE
+    ):
+        """
+        Expand a reference to a secret pulling from AWS Secrets Manager
+        :param secret_name: name of the secret to retrieve
+        :param version_stage: staging label of the version to retrieve
+        :return: Secret ARN from AWS
+        """
+        return self.secret_cache.get(secret_name, version_stage)["ARN"]
@@ -0,0 +1,111 @@
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from libs import get_logger
+from libs.output_file import OutputStats, write_if_changed
+from libs.profiling import span
+
+DEFAULT_JOBS = 8
+
+ManifestEntry = namedtuple("ManifestEntry", ["values", "template", "output"])
+RenderResult = namedtuple("RenderResult", ["entry", "latency_ms", "changed", "error"])
+
+logger = get_logger(__name__)
+
+
+def load_manifest(manifest_file):
+    """
+    Loads a manifest of the files to render, a yaml file such as:
+
+    files:
+      - values: service-a/input.yml
+        template: templates/application.properties
+        output: out/service-a/application.properties
+
+    The relative paths are resolved against the directory of the manifest.
+    :param manifest_file: Path of the manifest yaml file
+    :return: List of ManifestEntry
+    """
+    with open(manifest_file, "r") as f:
+        manifest = yaml.safe_load(f) or {}
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    entries = []
+    for index, item in enumerate(manifest.get("files") or []):
+        missing = [key for key in ManifestEntry._fields if not item.get(key)]
+        if missing:
+            raise ValueError(
+                f"Entry {index} of {manifest_file} is missing: {', '.join(missing)}"
+            )
+        entries.append(
+            ManifestEntry(
+                *(os.path.join(base_dir, item[key]) for key in ManifestEntry._fields)
+            )
+        )
+    if not entries:
+        raise ValueError(f"No files listed in: {manifest_file}")
+    return entries
+
+
+class ManifestRenderer:
+    """
+    Renders all the files of a manifest in one process. The renders share the Secrets Manager client
+    and the secret cache of a single J2PropsTemplate and run on a pool of threads, the secrets of all
+    the files being retrieved together before the first render. An output file is only replaced when
+    its content changes.
+    """
+
+    def __init__(self, j2props_template, jobs=DEFAULT_JOBS):
+        self.j2props_template = j2props_template
+        self.jobs = max(jobs, 1)
+
+    def render(self, entries):
+        """
+        Renders every entry of the manifest into its output file. An entry whose values or template
+        cannot be loaded fails alone, the other entries are rendered.
+        :param entries: List of ManifestEntry
+        :return: List of RenderResult, in the order of the entries
+        """
+        load_errors = self.j2props_template.prefetch_secrets(
+            [(entry.values, entry.template) for entry in entries]
+        )
+
+        def render_one(entry):
+            error = load_errors.get((entry.values, entry.template))
+            if error is not None:
+                return RenderResult(
+                    entry, None, None, f"{type(error).__name__}: {error}"
+                )
+            return self.__render_one(entry)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            results = list(executor.map(render_one, entries))
+        stats = OutputStats()
+        for result in results:
+            if result.error:
+                logger.error(f"Failed to render {result.entry.output}: {result.error}")
+                continue
+            stats.record(result.changed)
+            logger.info(
+                f"Rendered {result.entry.output} in {result.latency_ms:.1f} ms"
+                f"{'' if result.changed else ' (unchanged)'}"
+            )
+        logger.info(f"Outputs: {stats.summary()}")
+        return results
+
+    # Private methods
+
+    def __render_one(self, entry):
+        start = time.perf_counter()
+        try:
+            with span("j2props.render", template=entry.template, output=entry.output):
+                output = self.j2props_template.render_from_template(
+                    entry.values, entry.template
+                )
+            changed = write_if_changed(entry.output, output + "\n")
+        except Exception as e:
+            return RenderResult(entry, None, None, f"{type(e).__name__}: {e}")
+        return RenderResult(entry, (time.perf_counter() - start) * 1000, changed, None)
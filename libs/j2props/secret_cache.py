@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+from libs import get_logger
+
+DEFAULT_VERSION_STAGE = "AWSCURRENT"
+DEFAULT_TTL = 300
+CACHE_DIR_ENV_VAR = "MAGICDUST_SECRET_CACHE_DIR"
+CACHE_KEY_ENV_VAR = "MAGICDUST_SECRET_CACHE_KEY"
+CACHE_TTL_ENV_VAR = "MAGICDUST_SECRET_CACHE_TTL"
+
+# Fields of the GetSecretValue response kept by the cache
+SECRET_FIELDS = ("ARN", "Name", "VersionId", "SecretString")
+
+SecretCacheStats = namedtuple("SecretCacheStats", ["hits", "disk_hits", "misses"])
+
+logger = get_logger(__name__)
+
+
+class SecretCache:
+    """
+    Cache of the Secrets Manager secrets keyed by secret id and version stage. One GetSecretValue
+    response serves every lookup of the secret, its value as well as its ARN.
+
+    The responses are kept in memory for the lifetime of the cache. When a disk cache is given, they
+    are also stored encrypted on disk so that the next runs of the pipeline skip the lookups until
+    their TTL expires.
+    """
+
+    def __init__(self, fetch, disk_cache=None):
+        """
+        :param fetch: Function called with the secret id and the version stage on a cache miss,
+                      returning the GetSecretValue response
+        :param disk_cache: Optional EncryptedDiskCache
+        """
+        self.fetch = fetch
+        self.disk_cache = disk_cache
+        self.secrets = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, secret_id, version_stage=DEFAULT_VERSION_STAGE):
+        """
+        Returns the cached secret, looking it up only on a miss
+        :param secret_id: Name or ARN of the secret
+        :param version_stage: Staging label of the version, e.g. AWSCURRENT or AWSPREVIOUS
+        :return: Dictionary of the ARN, Name, VersionId and SecretString of the secret
+        """
+        key = (secret_id, version_stage)
+        with self.lock:
+            secret = self.secrets.get(key)
+            if secret is not None:
+                self.hits += 1
+                return secret
+        if self.disk_cache is not None:
+            secret = self.disk_cache.get(key)
+            if secret is not None:
+                with self.lock:
+                    self.disk_hits += 1
+                    self.secrets[key] = secret
+                return secret
+        return self.put(secret_id, version_stage, self.fetch(secret_id, version_stage))
+
+    def put(self, secret_id, version_stage, response):
+        """
+        Stores a secret looked up outside of the cache, e.g. by a prefetch
+        :param secret_id: Name or ARN of the secret, as referenced by the templates
+        :param version_stage: Staging label of the version
+        :param response: GetSecretValue response, or secret entry of a BatchGetSecretValue response
+        :return: Dictionary of the ARN, Name, VersionId and SecretString of the secret
+        """
+        key = (secret_id, version_stage)
+        secret = {
+            field: response[field] for field in SECRET_FIELDS if field in response
+        }
+        with self.lock:
+            self.misses += 1
+            self.secrets[key] = secret
+        if self.disk_cache is not None:
+            self.disk_cache.put(key, secret)
+        return secret
+
+    def missing(self, keys):
+        """
+        Returns the secrets which would be looked up by get. The secrets found in the disk cache are
+        loaded in memory.
+        :param keys: Iterable of (secret id, version stage)
+        :return: List of the (secret id, version stage) neither in memory nor on disk
+        """
+        with self.lock:
+            keys = [key for key in keys if key not in self.secrets]
+        if self.disk_cache is None:
+            return keys
+        missing = []
+        for key in keys:
+            secret = self.disk_cache.get(key)
+            if secret is None:
+                missing.append(key)
+                continue
+            with self.lock:
+                self.disk_hits += 1
+                self.secrets[key] = secret
+        return missing
+
+    def stats(self):
+        """
+        Returns the statistics of the cache
+        :return: SecretCacheStats
+        """
+        with self.lock:
+            return SecretCacheStats(self.hits, self.disk_hits, self.misses)
+
+    def clear(self):
+        with self.lock:
+            self.secrets.clear()
+
+
+class EncryptedDiskCache:
+    """
+    Directory of secrets encrypted with Fernet (AES-128-CBC and HMAC-SHA256) from the cryptography
+    package. The file names are hashes of the keys, and the TTL is checked against the timestamp
+    authenticated in every token, so expired or tampered entries are looked up again.
+    """
+
+    def __init__(self, cache_dir, encryption_key, ttl=DEFAULT_TTL, namespace=""):
+        """
+        :param cache_dir: Directory of the cached secrets
+        :param encryption_key: Fernet key, i.e. 32 url-safe base64-encoded bytes
+        :param ttl: Number of seconds a secret is served from the disk
+        :param namespace: Prefix of the keys, e.g. the identity of the caller and the region of the
+                          secrets
+        """
+        # cryptography is only imported when the disk cache is used
+        from cryptography.fernet import Fernet
+
+        self.fernet = Fernet(encryption_key)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.namespace = namespace
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+    def get(self, key):
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.__path(key), "rb") as f:
+                token = f.read()
+            return json.loads(self.fernet.decrypt(token, ttl=self.ttl))
+        except (OSError, InvalidToken, ValueError):
+            return None
+
+    def put(self, key, secret):
+        path = self.__path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        token = self.fernet.encrypt(json.dumps(secret).encode())
+        # The file is only readable by its owner and replaced atomically
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(token)
+        os.replace(temp_path, path)
+
+    # Private methods
+
+    def __path(self, key):
+        digest = hashlib.sha256(json.dumps([self.namespace, *key]).encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest)
+
+
+def caller_identity(region=None):
+    """
+    Returns the identity the secrets are looked up with, so that the secrets cached for an account or
+    a role are never served to another one. The session name of an assumed role is left out, as it
+    usually changes with every run of the pipeline.
+    :param region: AWS region of the STS client
+    :return: ARN of the caller, or the AWS profile when STS cannot be called
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    from libs.boto3.clients import get_client
+
+    try:
+        arn = get_client("sts", region).get_caller_identity()["Arn"]
+    except (BotoCoreError, ClientError) as e:
+        profile = os.environ.get("AWS_PROFILE", "default")
+        logger.debug(
+            f"Failed to get the caller identity, using the profile {profile}: {e}"
+        )
+        return f"profile:{profile}"
+    if ":assumed-role/" in arn:
+        # arn:aws:sts::123456789012:assumed-role/role-name/session-name
+        arn = arn.rsplit("/", 1)[0]
+    return arn
+
+
+def open_disk_cache(cache_dir=None, ttl=None, region=None, identity=None):
+    """
+    Returns the encrypted disk cache of the secrets. The encryption key is only read from the
+    MAGICDUST_SECRET_CACHE_KEY environment variable, the directory and the TTL default to the
+    MAGICDUST_SECRET_CACHE_DIR and MAGICDUST_SECRET_CACHE_TTL environment variables. The secrets are
+    cached per caller identity and region.
+    :param cache_dir: Directory of the cached secrets
+    :param ttl: Number of seconds a secret is served from the disk
+    :param region: AWS region of the secrets
+    :param identity: Identity of the caller, defaults to the one returned by caller_identity
+    :return: EncryptedDiskCache, or None when no cache directory is set
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV_VAR)
+    if not cache_dir:
+        return None
+    encryption_key = os.environ.get(CACHE_KEY_ENV_VAR)
+    if not encryption_key:
+        raise ValueError(
+            f"{CACHE_KEY_ENV_VAR} must be set to a Fernet key to cache the secrets on disk"
+        )
+    if ttl is None:
+        ttl = int(os.environ.get(CACHE_TTL_ENV_VAR, DEFAULT_TTL))
+    if identity is None:
+        identity = caller_identity(region)
+    return EncryptedDiskCache(
+        cache_dir, encryption_key, ttl, namespace=f"{identity}|{region or ''}"
+    )
@@ -0,0 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from jinja2 import TemplateNotFound, TemplateSyntaxError, meta, nodes
+
+from libs import get_logger
+from libs.j2props.secret_cache import DEFAULT_VERSION_STAGE
+
+SECRET_FILTERS = {"awssecret", "awssecretarn"}
+# Maximum number of secrets of a BatchGetSecretValue call
+BATCH_SIZE = 20
+# Concurrent GetSecretValue calls, within the default connection pool of a boto3 client
+MAX_WORKERS = 10
+
+logger = get_logger(__name__)
+
+
+def find_secret_references(jinja_env, template_name):
+    """
+    Finds the secret filters of a template and of the templates it includes, imports or extends.
+    The input of a filter is kept when it can be resolved statically, i.e. it is a constant or a path
+    of attributes and constant subscripts from a variable, e.g. {{ db.passwords["app"] | awssecret }}.
+    :param jinja_env: jinja2 Environment loading the template
+    :param template_name: Name of the template in the environment
+    :return: List of the references as (variable path, version stage), where the variable path is a
+             tuple of the variable name followed by the keys, or a secret id string for a constant
+    """
+    references = []
+    pending = [template_name]
+    visited = set()
+    while pending:
+        name = pending.pop()
+        if name in visited:
+            continue
+        visited.add(name)
+        try:
+            source, _, _ = jinja_env.loader.get_source(jinja_env, name)
+            ast = jinja_env.parse(source)
+        except (TemplateNotFound, TemplateSyntaxError) as e:
+            # The render reports the error, the secrets of the template are looked up by then
+            logger.debug(f"Failed to find the secret references of {name}: {e}")
+            continue
+        for node in ast.find_all(nodes.Filter):
+            if node.name in SECRET_FILTERS and node.node is not None:
+                reference = _static_reference(node)
+                if reference is not None:
+                    references.append(reference)
+        for reference in meta.find_referenced_templates(ast):
+            if reference:
+                pending.append(jinja_env.join_path(reference, name))
+    return references
+
+
+def resolve_secret_ids(references, data):
+    """
+    Resolves the references found in a template against its input values
+    :param references: List of (variable path, version stage) returned by find_secret_references
+    :param data: Input values of the render
+    :return: Set of (secret id, version stage), skipping the references which are not strings
+    """
+    keys = set()
+    for path, version_stage in references:
+        if isinstance(path, str):
+            keys.add((path, version_stage))
+            continue
+        value = data
+        for key in path:
+            try:
+                value = value[key]
+            except (KeyError, IndexError, TypeError):
+                value = None
+                break
+        if isinstance(value, str) and value:
+            keys.add((value, version_stage))
+    return keys
+
+
+def prefetch_secrets(secret_cache, client, keys, fetch):
+    """
+    Looks up the secrets missing from the cache concurrently and stores them in the cache. The
+    secrets of the current version are retrieved in batches of 20 when the client supports
+    BatchGetSecretValue, the other ones with concurrent GetSecretValue calls. A secret which cannot be
+    retrieved is left to the lookup of the render, which reports the error.
+    :param secret_cache: SecretCache storing the secrets
+    :param client: Secrets Manager boto3 client
+    :param keys: Iterable of (secret id, version stage)
+    :param fetch: Function called with the secret id and the version stage, returning the
+                  GetSecretValue response
+    :return: Number of secrets retrieved
+    """
+    missing = secret_cache.missing(keys)
+    if not missing:
+        return 0
+    retrieved = 0
+    if hasattr(client, "batch_get_secret_value"):
+        current = [
+            secret_id
+            for secret_id, version_stage in missing
+            if version_stage == DEFAULT_VERSION_STAGE
+        ]
+        batches = [
+            current[index : index + BATCH_SIZE]
+            for index in range(0, len(current), BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for batch, secrets in zip(
+                batches, executor.map(lambda ids: _batch_get(client, ids), batches)
+            ):
+                for secret_id in batch:
+                    secret = secrets.get(secret_id)
+                    if secret is not None:
+                        secret_cache.put(secret_id, DEFAULT_VERSION_STAGE, secret)
+                        retrieved += 1
+        missing = secret_cache.missing(missing)
+
+    def fetch_one(key):
+        try:
+            return fetch(*key)
+        except Exception as e:
+            logger.debug(f"Failed to prefetch the secret {key[0]}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for key, response in zip(missing, executor.map(fetch_one, missing)):
+            if response is not None:
+                secret_cache.put(*key, response)
+                retrieved += 1
+    return retrieved
+
+
+def _batch_get(client, secret_ids):
+    """
+    Retrieves a batch of secrets with BatchGetSecretValue
+    :return: Dictionary of the secrets by requested secret id, without the failed ones
+    """
+    try:
+        response = client.batch_get_secret_value(SecretIdList=secret_ids)
+    except Exception as e:
+        logger.debug(f"Failed to prefetch a batch of secrets: {e}")
+        return {}
+    for error in response.get("Errors", []):
+        logger.debug(
+            f"Failed to prefetch the secret {error.get('SecretId')}: "
+            f"{error.get('ErrorCode')}: {error.get('Message')}"
+        )
+    secrets = {}
+    for secret in response.get("SecretValues", []):
+        secrets[secret.get("Name")] = secret
+        secrets[secret.get("ARN")] = secret
+    return {
+        secret_id: secrets[secret_id]
+        for secret_id in secret_ids
+        if secret_id in secrets
+    }
+
+
+def _static_reference(node):
+    version_stage = DEFAULT_VERSION_STAGE
+    if node.args or node.kwargs:
+        arguments = list(node.args) + [keyword.value for keyword in node.kwargs]
+        if len(arguments) != 1 or not isinstance(arguments[0], nodes.Const):
+            return None
+        version_stage = arguments[0].value
+    path = []
+    expression = node.node
+    while True:
+        if isinstance(expression, nodes.Getattr):
+            path.append(expression.attr)
+        elif isinstance(expression, nodes.Getitem) and isinstance(
+            expression.arg, nodes.Const
+        ):
+            path.append(expression.arg.value)
+        else:
+            break
+        expression = expression.node
+    if isinstance(expression, nodes.Const) and not path:
+        if isinstance(expression.value, str):
+            return expression.value, version_stage
+        return None
+    if isinstance(expression, nodes.Name):
+        path.append(expression.name)
+        return tuple(reversed(path)), version_stage
+    return None
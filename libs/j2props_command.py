@@ -2,25 +2,89 @@ import os
 import sys
 import traceback
 
-from libs.j2props.j2props_utils import J2PropsTemplate
+from libs import get_logger
+
+logger = get_logger(__name__)
 
 
 class J2PropsCommand:
     command = "j2props"
 
     def __init__(self, args):
+        # The implementation and boto3 are only imported once the command is selected
+        from libs.j2props.j2props_utils import J2PropsTemplate
+        from libs.j2props.manifest import ManifestRenderer, load_manifest
+        from libs.j2props.secret_cache import open_disk_cache
+        from libs.output_file import write_if_changed
+
         try:
-            if not os.path.exists(args.template):
-                raise FileNotFoundError(f"Template file not found: {args.template}")
-            if not os.path.exists(args.values):
-                raise FileNotFoundError(f"Input yaml file not found: {args.values}")
-            J2PropsTemplate(args.region).generate_from_template(
-                args.values, args.template
+            if args.manifest:
+                if args.template or args.values or args.out:
+                    raise ValueError(
+                        "--manifest replaces --values, --template and --out"
+                    )
+                entries = load_manifest(args.manifest)
+            else:
+                if not args.template or not args.values:
+                    raise ValueError(
+                        "--values and --template, or --manifest are required"
+                    )
+                if not os.path.exists(args.template):
+                    raise FileNotFoundError(f"Template file not found: {args.template}")
+                if not os.path.exists(args.values):
+                    raise FileNotFoundError(f"Input yaml file not found: {args.values}")
+            disk_cache = open_disk_cache(
+                args.secret_cache_dir, args.secret_cache_ttl, region=args.region
             )
+            if args.manifest:
+                from libs.boto3.clients import configure_clients
+
+                # One connection per rendering thread
+                configure_clients(max_pool_connections=max(args.jobs, 10))
+            j2props_template = J2PropsTemplate(args.region, disk_cache)
+            failed = False
+            if args.manifest:
+                results = ManifestRenderer(j2props_template, args.jobs).render(entries)
+                failed = any(result.error for result in results)
+            elif args.out:
+                output = j2props_template.render_from_template(
+                    args.values, args.template
+                )
+                changed = write_if_changed(args.out, output + "\n")
+                logger.info(f"{args.out}: {'changed' if changed else 'unchanged'}")
+            else:
+                j2props_template.generate_from_template(args.values, args.template)
+            stats = j2props_template.secret_cache.stats()
+            if any(stats):
+                logger.info(
+                    f"Secrets cache: {stats.hits} hits, {stats.disk_hits} disk hits, "
+                    f"{stats.misses} lookups"
+                )
+            if failed:
+                sys.exit(1)
         except Exception:
             traceback.print_exception(*sys.exc_info())
             sys.exit(1)
 
+    @staticmethod
+    def server_request(args):
+        """
+        Builds the request forwarding the command to a render server
+        :param args: Parsed arguments of the command
+        :return: Dictionary of the request
+        """
+        if args.manifest or not args.values or not args.template:
+            raise ValueError(
+                "Only the sprinkle of a single template to stdout can be forwarded "
+                "to a render server"
+            )
+        return {
+            "command": J2PropsCommand.command,
+            "values": os.path.abspath(args.values),
+            "template": os.path.abspath(args.template),
+            "region": args.region,
+        }
+
     @staticmethod
     def create_parser_in(parent_parser):
         parser = parent_parser.add_parser(
@@ -33,17 +97,39 @@ class J2PropsCommand:
         parser.add_argument(
             "--values",
             "-f",
-            required=True,
+            required=False,
             type=str,
             help="Path to the input yaml values file.  Ex: uat/application/input.yml",
         )
         parser.add_argument(
             "--template",
             "-t",
-            required=True,
+            required=False,
             type=str,
             help="Absolute or relative path to the template file.  Ex: templates/application.properties",
         )
+        parser.add_argument(
+            "--manifest",
+            "-m",
+            required=False,
+            type=str,
+            help="Path to a yaml manifest listing the values, template and output files to render "
+            "in one process, in place of --values and --template",
+        )
+        parser.add_argument(
+            "--out",
+            required=False,
+            type=str,
+            help="File where the output is written instead of stdout. The file is replaced "
+            "atomically, and only when its content changes",
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=8,
+            help="Number of files of the manifest rendered concurrently",
+        )
         parser.add_argument(
             "--region",
             "-r",
@@ -51,4 +137,19 @@ class J2PropsCommand:
             default="us-east-2",
             help="AWS Region for secret retrieval",
         )
+        parser.add_argument(
+            "--secret-cache-dir",
+            required=False,
+            type=str,
+            help="Directory where the secrets are cached encrypted between the runs, with the "
+            "Fernet key of the MAGICDUST_SECRET_CACHE_KEY environment variable. Defaults to the "
+            "MAGICDUST_SECRET_CACHE_DIR environment variable.",
+        )
+        parser.add_argument(
+            "--secret-cache-ttl",
+            required=False,
+            type=int,
+            help="Number of seconds the secrets are served from the disk cache, defaults to the "
+            "MAGICDUST_SECRET_CACHE_TTL environment variable or 300",
+        )
         return parser
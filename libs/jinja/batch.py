@@ -0,0 +1,170 @@
+import io
+import json
+import os
+import sys
+
+from libs.jinja.jinja_utils import JinjaTemplate
+from libs.jinja.template_cache import configure_template_cache, get_template_cache
+from libs.jinja.template_files import (
+    STREAM_FORMATS,
+    output_file_name,
+    unique_output_files,
+)
+from libs.output_file import AtomicOutput
+
+_worker_values = None
+_worker_jinja_templates = {}
+
+
+class BatchRenderer:
+    """
+    Renders many templates for one or more deployment environments in a single invocation. The
+    values of each environment are parsed once per process and the compiled templates are shared
+    by all the environments. The renders are optionally spread across a pool of processes.
+    """
+
+    def __init__(
+        self,
+        values_input_file,
+        environments,
+        env_vars_prefix="AWS_ENV_VARS_",
+        output_format="yaml",
+        jobs=1,
+    ):
+        self.values_input_file = values_input_file
+        self.environments = list(environments)
+        self.env_prefix = env_vars_prefix
+        self.output_format = output_format
+        self.jobs = max(jobs, 1)
+
+    def render_to_dir(self, templates, output_dir, environment_dirs=None):
+        """
+        Renders every template into its own file of the output directory. A file is only replaced
+        when its content changes.
+        :param templates: List of (template file, output file name) as returned by find_templates
+        :param output_dir: Directory where the rendered files are written
+        :param environment_dirs: Flag whether to write the files of each environment into
+            <output_dir>/<environment>. Defaults to True when rendering several environments
+        :return: List of (output file, flag whether the file changed)
+        :raises ValueError: If two templates are rendered into the same output file
+        """
+        if environment_dirs is None:
+            environment_dirs = len(self.environments) > 1
+        templates = unique_output_files(templates, self.output_format)
+        tasks = []
+        for environment in self.environments:
+            environment_dir = (
+                os.path.join(output_dir, environment)
+                if environment_dirs
+                else output_dir
+            )
+            for template_file, name in templates:
+                output_file = os.path.join(
+                    environment_dir, output_file_name(name, self.output_format)
+                )
+                tasks.append(
+                    (environment, template_file, output_file, self.output_format)
+                )
+        return list(self.__map(_render_to_file, tasks))
+
+    def render_to_stream(self, templates, stream_format, out=sys.stdout):
+        """
+        Renders all the templates into a single stream, as newline delimited json or as a
+        multi-document yaml
+        :param templates: List of (template file, output file name) as returned by find_templates
+        :param stream_format: ndjson or yaml
+        :param out: File object where the documents are written
+        :return: None
+        """
+        if stream_format not in STREAM_FORMATS:
+            raise TypeError(f"Invalid stream format: {stream_format}")
+        if len(self.environments) != 1:
+            raise ValueError("Streaming supports a single environment")
+        tasks = [
+            (self.environments[0], template_file, stream_format)
+            for template_file, _ in templates
+        ]
+        if self.jobs == 1:
+            # Streams the documents straight into the output
+            self.__init_worker()
+            for task in tasks:
+                _write_document(task, out)
+        else:
+            for document in self.__map(_render_document, tasks):
+                out.write(document)
+        out.flush()
+
+    # Private methods
+
+    def __init_worker(self):
+        _init_worker(*self.__worker_args())
+
+    def __map(self, function, tasks):
+        if self.jobs == 1 or len(tasks) < 2:
+            self.__init_worker()
+            return map(function, tasks)
+        # Imports multiprocessing only when a pool is needed
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(
+            max_workers=min(self.jobs, len(tasks)),
+            initializer=_init_worker,
+            initargs=self.__worker_args(),
+        )
+        with executor:
+            return list(executor.map(function, tasks))
+
+    def __worker_args(self):
+        return (
+            self.values_input_file,
+            self.env_prefix,
+            get_template_cache().bytecode_cache_dir,
+        )
+
+
+# Worker functions, run either in the current process or in the processes of the pool
+
+
+def _init_worker(values_input_file, env_vars_prefix, bytecode_cache_dir):
+    global _worker_values
+    if _worker_values != (values_input_file, env_vars_prefix):
+        _worker_values = (values_input_file, env_vars_prefix)
+        _worker_jinja_templates.clear()
+    if get_template_cache().bytecode_cache_dir != bytecode_cache_dir:
+        configure_template_cache(bytecode_cache_dir=bytecode_cache_dir)
+
+
+def _get_jinja_template(environment):
+    # Renders and parses the values of each environment once per process
+    jinja_template = _worker_jinja_templates.get(environment)
+    if jinja_template is None:
+        values_input_file, env_vars_prefix = _worker_values
+        jinja_template = JinjaTemplate(values_input_file, environment, env_vars_prefix)
+        _worker_jinja_templates[environment] = jinja_template
+    return jinja_template
+
+
+def _render_to_file(task):
+    environment, template_file, output_file, output_format = task
+    with AtomicOutput(output_file) as f:
+        _get_jinja_template(environment).stream_from_template(
+            template_file, f, output_format
+        )
+    return output_file, f.changed
+
+
+def _render_document(task):
+    out = io.StringIO()
+    _write_document(task, out)
+    return out.getvalue()
+
+
+def _write_document(task, out):
+    environment, template_file, stream_format = task
+    jinja_template = _get_jinja_template(environment)
+    if stream_format == "ndjson":
+        json.dump(jinja_template.render_to_object(template_file), out)
+        out.write("\n")
+    else:
+        out.write("---\n")
+        jinja_template.stream_from_template(template_file, out, "yaml")
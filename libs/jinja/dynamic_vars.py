@@ -0,0 +1,77 @@
+import os
+import re
+
+DYNAMIC_VARS_PLACEHOLDER = "%%"
+
+_PLACEHOLDER_PATTERN = re.compile(re.escape(DYNAMIC_VARS_PLACEHOLDER) + r"(\w*)")
+
+
+class DynamicVarsText:
+    """
+    A text containing %%NAME placeholders for dynamic variables. The text is tokenized once, so every
+    substitution is a single linear pass over the literal chunks and the placeholders.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.chunks = []
+        self.names = []
+        position = 0
+        for match in _PLACEHOLDER_PATTERN.finditer(text):
+            self.chunks.append(text[position : match.start()])
+            self.names.append(match.group(1))
+            position = match.end()
+        self.chunks.append(text[position:])
+
+    def variables(self, env_prefix):
+        """
+        Returns the names of the dynamic variables referenced by the text
+        :param env_prefix: Prefix of the dynamic variables names
+        :return: Sorted tuple of variable names
+        """
+        return tuple(
+            sorted({name for name in self.names if name.startswith(env_prefix)})
+        )
+
+    def resolve(self, env_prefix, dynamic_vars=None, environ=None):
+        """
+        Looks up the values of the dynamic variables referenced by the text. The explicit values take
+        precedence over the environment variables.
+        :param env_prefix: Prefix of the dynamic variables names
+        :param dynamic_vars: Dictionary of the dynamic variables values
+        :param environ: Environment variables looked up after dynamic_vars, defaults to the ones of
+                        the OS
+        :return: Dictionary of the resolved variables
+        """
+        dynamic_vars = dynamic_vars or {}
+        environ = os.environ if environ is None else environ
+        resolved = {}
+        for name in self.variables(env_prefix):
+            value = dynamic_vars.get(name, environ.get(name))
+            if value is not None:
+                resolved[name] = str(value)
+        return resolved
+
+    def substitute(self, env_prefix, dynamic_vars=None, environ=None):
+        """
+        Replaces the placeholders with the values of the dynamic variables. The placeholder marker of
+        a variable without any value is dropped and its name is kept.
+        :param env_prefix: Prefix of the dynamic variables names
+        :param dynamic_vars: Dictionary of the dynamic variables values
+        :param environ: Environment variables looked up after dynamic_vars, defaults to the ones of
+                        the OS
+        :return: The substituted text
+        """
+        return self.fill(self.resolve(env_prefix, dynamic_vars, environ))
+
+    def fill(self, resolved):
+        """
+        Replaces the placeholders with the already resolved values of the dynamic variables
+        :param resolved: Dictionary of the resolved variables
+        :return: The substituted text
+        """
+        parts = [self.chunks[0]]
+        for name, chunk in zip(self.names, self.chunks[1:]):
+            parts.append(resolved.get(name, name))
+            parts.append(chunk)
+        return "".join(parts)
@@ -1,15 +1,69 @@
 import json
 import os
-import re
+import threading
+from collections import OrderedDict, namedtuple
 
-import benedict
-from jinja2 import Template
+import yaml
+from jinja2 import nodes
 
-DYNAMIC_VARS_PLACEHOLDER = "%%"
+from libs.jinja.dynamic_vars import DynamicVarsText
+from libs.jinja.template_cache import get_template_cache
+from libs.profiling import span
+
+VALUES_CACHE_SIZE = 32
+# The libyaml based loader builds the rendered objects without the pure python node graph
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+ValuesCacheInfo = namedtuple("ValuesCacheInfo", ["hits", "misses", "size"])
+
+
+def find_environments(values_input_file):
+    """
+    Finds the deployment environments referenced by the input values file, i.e. the constants the env
+    variable is compared with, as in {% if env == "qa" %} or {% if env in ["uat", "prod"] %}
+    :param values_input_file: Path of the input values file jinja template
+    :return: List of the environments in the order they appear in the file
+    """
+    with open(values_input_file, "r") as f:
+        ast = get_template_cache().environment.parse(f.read())
+    environments = []
+    for compare in ast.find_all(nodes.Compare):
+        operands = [compare.expr] + [operand.expr for operand in compare.ops]
+        if not any(
+            isinstance(operand, nodes.Name) and operand.name == "env"
+            for operand in operands
+        ):
+            continue
+        for operand in operands:
+            if isinstance(operand, (nodes.List, nodes.Tuple)):
+                constants = operand.items
+            else:
+                constants = [operand]
+            for constant in constants:
+                if (
+                    isinstance(constant, nodes.Const)
+                    and isinstance(constant.value, str)
+                    and constant.value not in environments
+                ):
+                    environments.append(constant.value)
+    return environments
 
 
 class JinjaTemplate:
-    def __init__(self, values_input_file, environment, env_vars_prefix="AWS_ENV_VARS_"):
+    def __init__(
+        self,
+        values_input_file,
+        environment,
+        env_vars_prefix="AWS_ENV_VARS_",
+        environ=None,
+    ):
+        """
+        :param values_input_file: Path of the input values file jinja template
+        :param environment: The deployment environment-type
+        :param env_vars_prefix: Prefix of the dynamic variables names
+        :param environ: Environment variables the dynamic variables fall back to, defaults to the
+                        ones of the OS
+        """
         # generate the input values file from the jinja template
         if not os.path.isfile(values_input_file):
             raise FileExistsError(f"Not a valid file: {values_input_file}")
@@ -17,49 +71,155 @@ class JinjaTemplate:
         self.env = environment
         self.input_values_dict = {}
         self.env_prefix = env_vars_prefix
+        self.environ = environ
         self.template = None
+        # Parsed values keyed by the values of the dynamic vars referenced in the values file
+        self.values_cache = OrderedDict()
+        self.values_cache_hits = 0
+        self.values_cache_misses = 0
+        self.values_cache_lock = threading.Lock()
 
-    def __call__(self, template_file, output_format="yaml", print_output=True):
-        return self.generate_from_template(template_file, output_format, print_output)
+    def __call__(
+        self, template_file, output_format="yaml", print_output=True, dynamic_vars=None
+    ):
+        return self.generate_from_template(
+            template_file, output_format, print_output, dynamic_vars
+        )
 
     # Public methods
 
     def generate_from_template(
-        self, template_file, output_format="yaml", print_output=True
+        self, template_file, output_format="yaml", print_output=True, dynamic_vars=None
     ):
         """
         Renders the AWS resource yaml files from its respective jinja templates
         :param template_file: Full path of the jinja template file
         :param output_format: The format of the output. yaml or json
         :param print_output: Flag whether to print the output to the console
+        :param dynamic_vars: Dictionary of the dynamic variables to substitute in the input values
         :return: Rendered template
         """
         try:
-            with open(template_file, "r") as f:
-                self.template = Template(f.read())
-            self.process_input_yaml()
-            result = self.template.render(inputs=self.input_values_dict)
-            return self.__process_output_text(result, output_format, print_output)
+            if output_format in {"yaml", "yml"}:
+                # the rendered text is already in yaml format
+                output_text = self.render_text(template_file, dynamic_vars)
+            elif output_format == "json":
+                rendered = self.render_to_object(template_file, dynamic_vars)
+                with span("jinja.serialize", format="json"):
+                    output_text = json.dumps(rendered, indent=4)
+            else:
+                raise TypeError(f"Invalid Output format: {output_format}")
+            if print_output:
+                print(output_text)
+            return output_text
         except Exception as e:
             raise Exception(e)
 
-    def process_input_yaml(self):
+    def render_text(self, template_file, dynamic_vars=None):
+        """
+        Renders the jinja template with the input values
+        :param template_file: Full path of the jinja template file
+        :param dynamic_vars: Dictionary of the dynamic variables to substitute in the input values
+        :return: Rendered template as a yaml string
+        """
+        template = self.template = self.__load_template(template_file)
+        inputs = self.process_input_yaml(dynamic_vars)
+        with span("jinja.render", template=template_file):
+            return template.render(inputs=inputs)
+
+    def render_to_object(self, template_file, dynamic_vars=None):
+        """
+        Renders the jinja template and returns it as python objects, ready to be passed to the AWS
+        clients without any serialization
+        :param template_file: Full path of the jinja template file
+        :param dynamic_vars: Dictionary of the dynamic variables to substitute in the input values
+        :return: Rendered template as a dict or a list
+        """
+        chunks = self.__generate_chunks(template_file, dynamic_vars)
+        # The template is rendered while the yaml parser consumes the chunks
+        with span("jinja.render_parse", template=template_file):
+            return yaml.load(_ChunkReader(chunks), Loader=YAML_LOADER)
+
+    def stream_from_template(
+        self, template_file, out, output_format="yaml", dynamic_vars=None
+    ):
+        """
+        Renders the template chunk by chunk into a file object, so the rendered text is never held
+        in memory as a whole. The json output is parsed from the chunks and encoded incrementally.
+        :param template_file: Full path of the jinja template file
+        :param out: File object where the rendered template is written, e.g. sys.stdout
+        :param output_format: The format of the output. yaml or json
+        :param dynamic_vars: Dictionary of the dynamic variables to substitute in the input values
+        :return: None
+        """
+        if output_format in {"yaml", "yml"}:
+            chunks = self.__generate_chunks(template_file, dynamic_vars)
+        elif output_format == "json":
+            chunks = json.JSONEncoder(indent=4).iterencode(
+                self.render_to_object(template_file, dynamic_vars)
+            )
+        else:
+            raise TypeError(f"Invalid Output format: {output_format}")
+        with span("jinja.stream", template=template_file, format=output_format):
+            for chunk in chunks:
+                out.write(chunk)
+            out.write("\n")
+
+    def process_input_yaml(self, dynamic_vars=None):
         """
-        Performs dynamic env vars substitution and returns the text input values as a python dictionary
+        Performs dynamic env vars substitution and returns the text input values as a python dictionary.
+        The values are parsed again only when a dynamic variable referenced in the values file changes,
+        so the returned dictionary is shared between the renders and must not be modified.
 
+        :param dynamic_vars: Dictionary of the dynamic variables to substitute in the input values
         :return: Dictionary of values
         """
-        # Substitutes the environment variables
-        input_values_text = self.__populate_environment_variables(
-            self.input_values_text
+        resolved = self.input_values.resolve(
+            self.env_prefix, dynamic_vars, self.environ
         )
-        # Loads the values in yaml format
-        input_values_dict = benedict.load_yaml_str(input_values_text)
-        # returns the yaml for the common environment
-        self.input_values_dict = input_values_dict["common"]
+        cache_key = tuple(sorted(resolved.items()))
+        with self.values_cache_lock:
+            input_values_dict = self.values_cache.get(cache_key)
+            if input_values_dict is not None:
+                self.values_cache.move_to_end(cache_key)
+                self.values_cache_hits += 1
+        if input_values_dict is None:
+            # Substitutes the dynamic variables
+            with span("jinja.values.substitute"):
+                input_values_text = self.input_values.fill(resolved)
+            # Loads the values in yaml format and keeps the yaml for the common environment
+            with span("jinja.values.parse"):
+                input_values_dict = yaml.load(input_values_text, Loader=YAML_LOADER)[
+                    "common"
+                ]
+            with self.values_cache_lock:
+                self.values_cache_misses += 1
+                self.values_cache[cache_key] = input_values_dict
+                if len(self.values_cache) > VALUES_CACHE_SIZE:
+                    self.values_cache.popitem(last=False)
+        self.input_values_dict = input_values_dict
+        return input_values_dict
+
+    def values_cache_info(self):
+        """
+        Returns the statistics of the parsed values cache
+        :return: ValuesCacheInfo
+        """
+        with self.values_cache_lock:
+            return ValuesCacheInfo(
+                self.values_cache_hits, self.values_cache_misses, len(self.values_cache)
+            )
 
     # Private methods
 
+    def __load_template(self, template_file):
+        with span("jinja.template.load", template=template_file):
+            return get_template_cache().get_template(template_file)
+
+    def __generate_chunks(self, template_file, dynamic_vars):
+        template = self.template = self.__load_template(template_file)
+        return template.generate(inputs=self.process_input_yaml(dynamic_vars))
+
     def __generate_values_file(self, input_values_file, environment):
         """
         Generate the input yaml values file from the jinja template by substituting the
@@ -68,44 +228,34 @@ class JinjaTemplate:
         :param environment: The deployment environment-type
         :return: the input values file as a text string
         """
-        with open(input_values_file, "r") as f:
-            template = Template(f.read())
-        self.input_values_text = template.render(env=environment)
+        template = self.__load_template(input_values_file)
+        with span("jinja.values.render", environment=environment):
+            self.input_values_text = template.render(env=environment)
+        # Tokenizes the dynamic variables placeholders once for all the renders
+        self.input_values = DynamicVarsText(self.input_values_text)
 
-    def __populate_environment_variables(self, input_values_text):
-        """
-        Read all the environment variables of the OS and replace the place-holders in the input-yaml file
-        if the place-holder variable name matches a certain prefix
-        :param input_values_text: input-yaml file in raw string format
-        :return: env vars substituted input-yaml string
-        """
-        # replaces the placeholders with blank string
-        input_values_text = re.sub(DYNAMIC_VARS_PLACEHOLDER, "", input_values_text)
-        env_var_dict = dict(os.environ)
-        for k, v in env_var_dict.items():
-            if str(k).startswith(self.env_prefix):
-                input_values_text = re.sub(k, v, input_values_text)
-        return input_values_text
 
-    @staticmethod
-    def __process_output_text(rendered_text, output_format, print_output):
-        """
-        Converts the rendered template text to desired output
-        :param rendered_text: text rendered by jinja
-        :param output_format: The format of the output text
-        :return: The rendered template as a formatted yaml or json string
-        """
-        if output_format in {"yaml", "yml"}:
-            # the rendered text is already in yaml format
-            if print_output:
-                print(rendered_text)
-            return rendered_text
-        elif output_format == "json":
-            # convert to json
-            output_dict = benedict.load_yaml_str(rendered_text)
-            if print_output:
-                print(json.dumps(output_dict, indent=4))
-            return json.dumps(output_dict, indent=4)
-        else:
-            raise TypeError(f"Invalid Output format: {output_format}")
-        return None
+class _ChunkReader:
+    """
+    Read-only file object over the chunks generated by a template, which lets the yaml parser
+    consume the rendered text without holding all of it
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        data = "".join(parts)
+        if size < 0:
+            size = length
+        self.buffer = data[size:]
+        return data[:size]
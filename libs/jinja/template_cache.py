@@ -0,0 +1,141 @@
+import os
+import threading
+
+from jinja2 import (
+    BaseLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    TemplateNotFound,
+    TemplateSyntaxError,
+    meta,
+)
+
+BYTECODE_CACHE_DIR_ENV_VAR = "MAGICDUST_JINJA_CACHE_DIR"
+DEFAULT_CACHE_SIZE = 400
+
+_template_cache = None
+_template_cache_lock = threading.Lock()
+
+
+class _FileLoader(BaseLoader):
+    """
+    Loads templates by their file path. A cached template is considered up to date as long as the
+    modification time and the size of its file have not changed.
+    """
+
+    def get_source(self, environment, template):
+        path = os.path.abspath(template)
+        try:
+            stat = os.stat(path)
+            with open(path, "r") as f:
+                source = f.read()
+        except OSError:
+            raise TemplateNotFound(template)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        def uptodate():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            return (stat.st_mtime_ns, stat.st_size) == signature
+
+        return source, path, uptodate
+
+
+class _FileEnvironment(Environment):
+    """
+    Environment which resolves the relative paths of {% include %} and {% import %} against the
+    directory of the including template
+    """
+
+    def join_path(self, template, parent):
+        if os.path.isabs(template) or not parent:
+            return template
+        return os.path.join(os.path.dirname(parent), template)
+
+
+class TemplateCache:
+    """
+    Cache of compiled jinja templates shared by all the renders of the process.
+
+    Templates are kept in an LRU keyed by their absolute path and are recompiled once the mtime or
+    the size of the file changes. When a bytecode cache directory is set, the compiled code is also
+    stored on disk so that the next invocations skip parsing and compiling the templates.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, bytecode_cache_dir=None):
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.environment = _FileEnvironment(
+            loader=_FileLoader(),
+            cache_size=max_size,
+            auto_reload=True,
+            bytecode_cache=bytecode_cache,
+        )
+
+    def get_template(self, template_file):
+        """
+        Returns the compiled template of the given file, compiling it only when it is not cached
+        :param template_file: Absolute or relative path of the jinja template file
+        :return: jinja2.Template
+        """
+        return self.environment.get_template(os.path.abspath(template_file))
+
+    def dependencies(self, template_file):
+        """
+        Returns the files a template depends on: the template itself and the templates it includes,
+        imports or extends, recursively. References computed at render time are not followed.
+        :param template_file: Absolute or relative path of the jinja template file
+        :return: Set of absolute paths
+        """
+        pending = [os.path.abspath(template_file)]
+        dependencies = set()
+        while pending:
+            path = pending.pop()
+            if path in dependencies:
+                continue
+            dependencies.add(path)
+            try:
+                with open(path, "r") as f:
+                    ast = self.environment.parse(f.read())
+            except (OSError, TemplateSyntaxError):
+                continue
+            for reference in meta.find_referenced_templates(ast):
+                if reference:
+                    pending.append(
+                        os.path.abspath(self.environment.join_path(reference, path))
+                    )
+        return dependencies
+
+    def clear(self):
+        self.environment.cache.clear()
+
+
+def configure_template_cache(max_size=DEFAULT_CACHE_SIZE, bytecode_cache_dir=None):
+    """
+    Replaces the shared template cache. The bytecode cache directory defaults to the value of the
+    MAGICDUST_JINJA_CACHE_DIR environment variable.
+    :param max_size: Maximum number of compiled templates kept in memory
+    :param bytecode_cache_dir: Directory where the compiled templates are stored on disk
+    :return: TemplateCache
+    """
+    global _template_cache
+    if bytecode_cache_dir is None:
+        bytecode_cache_dir = os.environ.get(BYTECODE_CACHE_DIR_ENV_VAR)
+    with _template_cache_lock:
+        _template_cache = TemplateCache(max_size, bytecode_cache_dir)
+    return _template_cache
+
+
+def get_template_cache():
+    """
+    Returns the shared template cache, creating it with the default settings on first use
+    :return: TemplateCache
+    """
+    if _template_cache is None:
+        return configure_template_cache()
+    return _template_cache
@@ -0,0 +1,90 @@
+import glob
+import os
+
+TEMPLATE_EXTENSIONS = (".jinja2", ".jinja", ".j2")
+OUTPUT_EXTENSIONS = {"yaml": ".yaml", "yml": ".yaml", "json": ".json"}
+STREAM_FORMATS = ["ndjson", "yaml"]
+
+
+def find_templates(patterns):
+    """
+    Expands template files, glob patterns and directories into the list of templates to render.
+    Files of a directory whose name starts with "_" or "." are considered partials and are skipped.
+    The output names keep the path of the templates relative to the directory, or to the directory
+    of a glob pattern before its first wildcard, e.g. tpl/**/*.j2 renders tpl/a/b.j2 into a/b.
+    :param patterns: List of template files, glob patterns or directories
+    :return: List of (template file, output file name relative to the output directory)
+    """
+    templates = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for name in sorted(files):
+                    if name.startswith(("_", ".")) or not name.endswith(
+                        TEMPLATE_EXTENSIONS
+                    ):
+                        continue
+                    path = os.path.join(root, name)
+                    templates.append((path, os.path.relpath(path, pattern)))
+        elif glob.has_magic(pattern):
+            paths = sorted(
+                p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p)
+            )
+            if not paths:
+                raise FileNotFoundError(f"No template file matches: {pattern}")
+            base_dir = _glob_base_dir(pattern)
+            templates.extend((path, os.path.relpath(path, base_dir)) for path in paths)
+        elif os.path.isfile(pattern):
+            templates.append((pattern, os.path.basename(pattern)))
+        else:
+            raise FileNotFoundError(f"Template file not found: {pattern}")
+    return templates
+
+
+def output_file_name(template_name, output_format):
+    """
+    Returns the name of the rendered file, e.g. subnets.yaml.jinja2 becomes subnets.json when
+    rendered as json
+    :param template_name: Name of the template file
+    :param output_format: The format of the output. yaml or json
+    :return: Name of the output file
+    """
+    for extension in TEMPLATE_EXTENSIONS:
+        if template_name.endswith(extension):
+            template_name = template_name[: -len(extension)]
+            break
+    name, extension = os.path.splitext(template_name)
+    if extension in {".yaml", ".yml", ".json"}:
+        template_name = name
+    return template_name + OUTPUT_EXTENSIONS[output_format]
+
+
+def unique_output_files(templates, output_format):
+    """
+    Drops the templates listed twice and checks that no two templates are rendered into the same
+    output file, which they would overwrite, concurrently with several jobs
+    :param templates: List of (template file, output file name) as returned by find_templates
+    :param output_format: The format of the output. yaml or json
+    :return: List of (template file, output file name)
+    :raises ValueError: If two templates are rendered into the same output file
+    """
+    unique = {}
+    for template_file, name in templates:
+        output_name = output_file_name(name, output_format)
+        other_file, _ = unique.setdefault(output_name, (template_file, name))
+        if other_file != template_file:
+            raise ValueError(
+                f"Templates {other_file} and {template_file} are both rendered into "
+                f"{output_name}"
+            )
+    return list(unique.values())
+
+
+def _glob_base_dir(pattern):
+    parts = []
+    for part in pattern.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+
+from libs import get_logger
+from libs.jinja.jinja_utils import JinjaTemplate
+from libs.jinja.template_cache import get_template_cache
+from libs.jinja.template_files import output_file_name, unique_output_files
+from libs.output_file import AtomicOutput
+
+logger = get_logger(__name__)
+
+
+class TemplateWatcher:
+    """
+    Keeps the compiled templates and the parsed values resident and re-renders the outputs whose
+    inputs changed. Changes are detected by polling the mtime and the size of the values file, of
+    the templates and of the templates they include.
+    """
+
+    def __init__(
+        self,
+        values_input_file,
+        environments,
+        templates,
+        env_vars_prefix="AWS_ENV_VARS_",
+        output_format="yaml",
+        output_dir=None,
+        environment_dirs=False,
+        interval=1.0,
+    ):
+        self.values_input_file = values_input_file
+        self.environments = list(environments)
+        self.templates = (
+            unique_output_files(templates, output_format) if output_dir else templates
+        )
+        self.env_prefix = env_vars_prefix
+        self.output_format = output_format
+        self.output_dir = output_dir
+        self.environment_dirs = environment_dirs
+        self.interval = interval
+        self.jinja_templates = {}
+        self.values_dependencies = set()
+        self.template_dependencies = {}
+        self.signatures = {}
+
+    def run(self):
+        """
+        Renders all the outputs, then re-renders the affected ones whenever an input changes.
+        Stops on keyboard interrupt.
+        :return: None
+        """
+        self.render(reload_values=True)
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.poll()
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+
+    def poll(self):
+        """
+        Checks the inputs once and re-renders the outputs depending on the changed files
+        :return: Set of the changed files
+        """
+        changed = {
+            path
+            for path, signature in self.signatures.items()
+            if _signature(path) != signature
+        }
+        if not changed:
+            return changed
+        logger.info(f"Changed: {', '.join(sorted(changed))}")
+        if changed & self.values_dependencies:
+            self.render(reload_values=True)
+        else:
+            self.render(
+                [
+                    template
+                    for template in self.templates
+                    if changed & self.template_dependencies[template[0]]
+                ]
+            )
+        return changed
+
+    def render(self, templates=None, reload_values=False):
+        """
+        Renders the given templates for every environment
+        :param templates: List of (template file, output file name), defaults to all the templates
+        :param reload_values: Flag whether to render and parse the values file again
+        :return: None
+        """
+        cache = get_template_cache()
+        if reload_values:
+            self.values_dependencies = cache.dependencies(self.values_input_file)
+            self.__update_signatures(self.values_dependencies)
+            try:
+                self.jinja_templates = {
+                    environment: JinjaTemplate(
+                        self.values_input_file, environment, self.env_prefix
+                    )
+                    for environment in self.environments
+                }
+            except Exception as e:
+                self.jinja_templates = {}
+                logger.error(f"Failed to load {self.values_input_file}: {e}")
+            templates = self.templates
+        for template_file, name in templates or self.templates:
+            dependencies = cache.dependencies(template_file)
+            self.template_dependencies[template_file] = dependencies
+            self.__update_signatures(dependencies)
+            for environment, jinja_template in self.jinja_templates.items():
+                self.__render_one(jinja_template, environment, template_file, name)
+
+    # Private methods
+
+    def __render_one(self, jinja_template, environment, template_file, name):
+        start = time.perf_counter()
+        try:
+            if self.output_dir:
+                output_dir = self.output_dir
+                if self.environment_dirs:
+                    output_dir = os.path.join(output_dir, environment)
+                output_file = os.path.join(
+                    output_dir, output_file_name(name, self.output_format)
+                )
+                with AtomicOutput(output_file) as f:
+                    jinja_template.stream_from_template(
+                        template_file, f, self.output_format
+                    )
+                if not f.changed:
+                    logger.info(f"Unchanged {output_file} ({environment})")
+                    return
+            else:
+                jinja_template.stream_from_template(
+                    template_file, sys.stdout, self.output_format
+                )
+                sys.stdout.flush()
+        except Exception as e:
+            logger.error(f"Failed to render {template_file} ({environment}): {e}")
+            return
+        latency = (time.perf_counter() - start) * 1000
+        logger.info(f"Rendered {template_file} ({environment}) in {latency:.1f} ms")
+
+    def __update_signatures(self, paths):
+        for path in paths:
+            self.signatures[path] = _signature(path)
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
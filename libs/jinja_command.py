@@ -2,30 +2,149 @@ import os
 import sys
 import traceback
 
-from libs.jinja.jinja_utils import JinjaTemplate
+from libs import get_logger
+from libs.jinja.template_files import STREAM_FORMATS, find_templates
+
+ALL_ENVIRONMENTS_FROM_FILE = "all-from-file"
+
+logger = get_logger(__name__)
 
 
 class JinjaCommand:
     command = "jinja"
 
     def __init__(self, args):
+        # The implementation and jinja2 are only imported once the command is selected
+        from libs.jinja.batch import BatchRenderer
+        from libs.jinja.jinja_utils import JinjaTemplate, find_environments
+        from libs.jinja.template_cache import configure_template_cache
+        from libs.jinja.watch import TemplateWatcher
+        from libs.output_file import AtomicOutput, OutputStats
+
         try:
-            if not os.path.exists(args.template):
-                raise FileNotFoundError(f"Template file not found: {args.template}")
+            templates = find_templates(args.template)
             if not os.path.exists(args.values):
                 raise FileNotFoundError(f"Input yaml file not found: {args.values}")
-            JinjaTemplate(args.values, args.environment_type)(
-                args.template, args.output
+            if args.bytecode_cache_dir:
+                configure_template_cache(bytecode_cache_dir=args.bytecode_cache_dir)
+            environments = args.environment_type
+            if environments == [ALL_ENVIRONMENTS_FROM_FILE]:
+                environments = find_environments(args.values)
+                if not environments:
+                    raise ValueError(f"No environment referenced in: {args.values}")
+            # Each environment of a matrix is written into its own sub-directory
+            environment_dirs = (
+                args.environment_type == [ALL_ENVIRONMENTS_FROM_FILE]
+                or len(environments) > 1
             )
+            if args.out and args.output_dir:
+                raise ValueError("--out and --output-dir are exclusive")
+            if args.action == "watch":
+                if args.out:
+                    raise ValueError("Watch mode writes into --output-dir, not --out")
+                if len(environments) > 1 and not args.output_dir:
+                    raise ValueError(
+                        "Watching several environments requires --output-dir"
+                    )
+                TemplateWatcher(
+                    args.values,
+                    environments,
+                    templates,
+                    args.env_prefix,
+                    args.output,
+                    args.output_dir,
+                    environment_dirs,
+                    args.interval,
+                ).run()
+            elif args.output_dir or args.stream:
+                renderer = BatchRenderer(
+                    args.values, environments, args.env_prefix, args.output, args.jobs
+                )
+                if args.output_dir:
+                    stats = OutputStats()
+                    for _, changed in renderer.render_to_dir(
+                        templates, args.output_dir, environment_dirs
+                    ):
+                        stats.record(changed)
+                    logger.info(f"Outputs: {stats.summary()}")
+                elif args.out:
+                    with AtomicOutput(args.out) as out:
+                        renderer.render_to_stream(templates, args.stream, out)
+                    self.__report(args.out, out.changed)
+                else:
+                    renderer.render_to_stream(templates, args.stream)
+            else:
+                if len(environments) > 1:
+                    raise ValueError(
+                        "Rendering several environments requires --output-dir"
+                    )
+                jinja_template = JinjaTemplate(
+                    args.values, environments[0], args.env_prefix
+                )
+                out = AtomicOutput(args.out) if args.out else sys.stdout
+                try:
+                    for template_file, _ in templates:
+                        jinja_template.stream_from_template(
+                            template_file, out, args.output
+                        )
+                except Exception:
+                    if args.out:
+                        out.discard()
+                    raise
+                if args.out:
+                    self.__report(args.out, out.close())
         except Exception:
             traceback.print_exception(*sys.exc_info())
             sys.exit(1)
 
+    @staticmethod
+    def __report(out_file, changed):
+        logger.info(f"{out_file}: {'changed' if changed else 'unchanged'}")
+
+    @staticmethod
+    def server_request(args):
+        """
+        Builds the request forwarding the command to a render server
+        :param args: Parsed arguments of the command
+        :return: Dictionary of the request
+        """
+        if (
+            args.action != "sprinkle"
+            or args.output_dir
+            or args.stream
+            or len(args.environment_type) > 1
+            or ALL_ENVIRONMENTS_FROM_FILE in args.environment_type
+        ):
+            raise ValueError(
+                "Only the sprinkle of a single environment to stdout can be forwarded "
+                "to a render server"
+            )
+        return {
+            "command": JinjaCommand.command,
+            "values": os.path.abspath(args.values),
+            "environment": args.environment_type[0],
+            "templates": [
+                os.path.abspath(template_file)
+                for template_file, _ in find_templates(args.template)
+            ],
+            "output": args.output,
+            "env_prefix": args.env_prefix,
+            # The dynamic vars are read from the environment of the client
+            "dynamic_vars": {
+                name: value
+                for name, value in os.environ.items()
+                if name.startswith(args.env_prefix)
+            },
+        }
+
     @staticmethod
     def create_parser_in(parent_parser):
         parser = parent_parser.add_parser(JinjaCommand.command)
         parser.add_argument(
-            "action", type=str, choices=["sprinkle"], help="Type of action"
+            "action",
+            type=str,
+            choices=["sprinkle", "watch"],
+            help="Type of action. watch re-renders the outputs whenever their inputs change",
         )
         parser.add_argument(
             "--values",
@@ -38,14 +157,19 @@ class JinjaCommand:
             "--environment-type",
             required=True,
             type=str,
-            help="Deployment environment like qa|uat|prod",
+            nargs="+",
+            help="Deployment environment like qa|uat|prod. Accepts several environments, "
+            f"or {ALL_ENVIRONMENTS_FROM_FILE} to render every environment referenced "
+            "in the values file",
         )
         parser.add_argument(
             "--template",
             "-t",
             required=True,
             type=str,
-            help="Absolute or relative path to the template file. e.g. subnets.yaml.jinja2",
+            nargs="+",
+            help="Absolute or relative path to the template file. e.g. subnets.yaml.jinja2. "
+            "Accepts several files, glob patterns or directories",
         )
         parser.add_argument(
             "--output",
@@ -56,6 +180,43 @@ class JinjaCommand:
             choices=["yaml", "json"],
             help="Format of the output. Either yaml or json",
         )
+        destination = parser.add_mutually_exclusive_group()
+        destination.add_argument(
+            "--output-dir",
+            required=False,
+            type=str,
+            help="Directory where every template is rendered into its own file",
+        )
+        destination.add_argument(
+            "--stream",
+            required=False,
+            type=str,
+            choices=STREAM_FORMATS,
+            help="Renders all the templates to stdout as newline delimited json "
+            "or as a multi-document yaml",
+        )
+        parser.add_argument(
+            "--out",
+            required=False,
+            type=str,
+            help="File where the output is written instead of stdout. The file is replaced "
+            "atomically, and only when its content changes",
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            required=False,
+            type=int,
+            default=1,
+            help="Number of processes rendering the templates in parallel",
+        )
+        parser.add_argument(
+            "--interval",
+            required=False,
+            type=float,
+            default=1.0,
+            help="Seconds between two checks of the inputs in watch mode",
+        )
         parser.add_argument(
             "--env-prefix",
             "-p",
@@ -65,4 +226,11 @@ class JinjaCommand:
             help="Environment variables prefix for auto discovery of dynamic "
             "variables during template rendering",
         )
+        parser.add_argument(
+            "--bytecode-cache-dir",
+            required=False,
+            type=str,
+            help="Directory to cache the compiled templates across invocations. "
+            "Defaults to the MAGICDUST_JINJA_CACHE_DIR environment variable",
+        )
         return parser
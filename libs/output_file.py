@@ -0,0 +1,149 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class AtomicOutput:
+    """
+    Text file object rendering into a temporary file next to its destination. On close, the
+    destination is atomically replaced only when the content differs, so an unchanged output keeps
+    its mtime and costs nothing to the tools watching it.
+    """
+
+    def __init__(self, path, encoding="utf-8"):
+        self.path = os.path.abspath(path)
+        self.encoding = encoding
+        self.changed = None
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(self.path)}.", suffix=".tmp", dir=directory
+        )
+        self.file = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode(self.encoding)
+        self.digest.update(data)
+        self.size += len(data)
+        self.file.write(data)
+        return len(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        """
+        Replaces the destination with the rendered content when they differ
+        :return: Flag whether the destination changed
+        """
+        if self.changed is not None:
+            return self.changed
+        self.file.close()
+        if _file_digest(self.path, self.size) == self.digest.digest():
+            os.remove(self.temp_path)
+            self.changed = False
+        else:
+            try:
+                mode = os.stat(self.path).st_mode & 0o7777
+            except OSError:
+                mode = _new_file_mode(os.path.dirname(self.path))
+            os.chmod(self.temp_path, mode)
+            os.replace(self.temp_path, self.path)
+            self.changed = True
+        return self.changed
+
+    def discard(self):
+        """
+        Drops the rendered content, leaving the destination untouched
+        :return: None
+        """
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+class OutputStats:
+    """
+    Counts of the changed and unchanged outputs of a run
+    """
+
+    def __init__(self):
+        self.changed = 0
+        self.unchanged = 0
+        self.lock = threading.Lock()
+
+    def record(self, changed):
+        with self.lock:
+            if changed:
+                self.changed += 1
+            else:
+                self.unchanged += 1
+
+    def summary(self):
+        with self.lock:
+            return f"{self.changed} changed, {self.unchanged} unchanged"
+
+
+def write_if_changed(path, text):
+    """
+    Writes a text file only when its content differs, atomically
+    :param path: Path of the file
+    :param text: Content of the file
+    :return: Flag whether the file changed
+    """
+    with AtomicOutput(path) as output:
+        output.write(text)
+    return output.changed
+
+
+def _file_digest(path, expected_size):
+    try:
+        if os.stat(path).st_size != expected_size:
+            return None
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def _new_file_mode(directory):
+    """
+    Returns the mode open() would give a new file. The umask is read from /proc when available, it
+    is never changed, since other threads may be creating files meanwhile.
+    :param directory: Directory of the file
+    :return: Permission bits of the file
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    # Creates a probe file the way open() does and reads its mode
+    probe = os.path.join(directory, f".umask.{os.getpid()}.{threading.get_ident()}")
+    fd = os.open(probe, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        return os.fstat(fd).st_mode & 0o777
+    finally:
+        os.close(fd)
+        os.remove(probe)
@@ -0,0 +1,186 @@
+import json
+import os
+import sys
+import threading
+import time
+
+_profiler = None
+
+
+class Profiler:
+    """
+    Records the spans of the phases of a run and writes them as a Chrome trace-event file, which can
+    be opened with chrome://tracing or https://ui.perfetto.dev
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def record(self, name, category, start, end, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    def write_trace(self, trace_file):
+        """
+        Writes the recorded spans in the Chrome trace-event json format
+        :param trace_file: Path of the trace file
+        :return: None
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(trace_file, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        """
+        Returns a table of the count, total, mean and max duration of every span name
+        :return: The table as a string
+        """
+        totals = {}
+        with self.lock:
+            for event in self.events:
+                count, total, longest = totals.get(event["name"], (0, 0.0, 0.0))
+                duration = event["dur"] / 1000
+                totals[event["name"]] = (
+                    count + 1,
+                    total + duration,
+                    max(longest, duration),
+                )
+        width = max([len(name) for name in totals] + [len("Phase")])
+        lines = [
+            f"{'Phase':{width}}  {'Count':>7}  {'Total ms':>10}  {'Mean ms':>9}  {'Max ms':>9}"
+        ]
+        for name, (count, total, longest) in sorted(
+            totals.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append(
+                f"{name:{width}}  {count:7d}  {total:10.2f}  {total / count:9.2f}  {longest:9.2f}"
+            )
+        return "\n".join(lines)
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "category", "args", "start")
+
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(
+            self.name, self.category, self.start, time.perf_counter(), self.args
+        )
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, category="magicdust", **args):
+    """
+    Returns a context manager recording the duration of its block. When profiling is disabled, a
+    shared no-op context manager is returned.
+    :param name: Name of the span, e.g. jinja.render
+    :param category: Category of the span
+    :param args: Details shown with the span in the trace viewer
+    :return: Context manager
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _Span(_profiler, name, category, args)
+
+
+def enable_profiling():
+    """
+    Starts recording the spans of the process
+    :return: Profiler
+    """
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable_profiling():
+    global _profiler
+    _profiler = None
+
+
+def is_profiling_enabled():
+    return _profiler is not None
+
+
+def write_profile(trace_file, out=sys.stderr):
+    """
+    Writes the trace file and prints the summary table of the recorded spans
+    :param trace_file: Path of the trace file
+    :param out: File object where the summary table is printed
+    :return: None
+    """
+    if _profiler is None:
+        return
+    _profiler.write_trace(trace_file)
+    print(_profiler.summary(), file=out)
+    print(f"Profile written to: {trace_file}", file=out)
+
+
+def instrument_client(client):
+    """
+    Records a span for every API call made by a boto3 client while profiling is enabled
+    :param client: boto3 client
+    :return: The client
+    """
+    if _profiler is not None:
+        client.meta.events.register("before-call", _before_api_call)
+        client.meta.events.register("after-call", _after_api_call)
+    return client
+
+
+def _before_api_call(context=None, **kwargs):
+    if context is not None:
+        context["profiling_start"] = time.perf_counter()
+
+
+def _after_api_call(event_name=None, context=None, http_response=None, **kwargs):
+    if _profiler is None or not context or "profiling_start" not in context:
+        return
+    # event name: after-call.<service>.<operation>
+    _, service, operation = event_name.split(".", 2)
+    args = {}
+    if http_response is not None:
+        args["status"] = http_response.status_code
+    _profiler.record(
+        f"aws.{service}.{operation}",
+        "aws",
+        context.pop("profiling_start"),
+        time.perf_counter(),
+        args,
+    )
@@ -0,0 +1,60 @@
+import sys
+import traceback
+
+
+class ServeCommand:
+    command = "serve"
+
+    def __init__(self, args, logger):
+        from libs.server.render_server import RenderServer
+
+        server = RenderServer(args.socket)
+        logger.info(f"Serving render requests on: {args.socket}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopping the render server")
+        finally:
+            server.server_close()
+
+    @staticmethod
+    def forward(socket_path, request, out_file=None):
+        """
+        Forwards a render request to a running render server and writes its output to stdout
+        :param socket_path: Path of the unix socket of the server
+        :param request: Dictionary of the request
+        :param out_file: Optional file where the output is written instead, only when it changed
+        :return: None
+        """
+        from libs.output_file import write_if_changed
+        from libs.server.client import send_request
+
+        try:
+            output = send_request(socket_path, request)
+            if out_file:
+                changed = write_if_changed(out_file, output)
+                print(
+                    f"{out_file}: {'changed' if changed else 'unchanged'}",
+                    file=sys.stderr,
+                )
+            else:
+                sys.stdout.write(output)
+        except Exception:
+            traceback.print_exception(*sys.exc_info())
+            sys.exit(1)
+
+    @staticmethod
+    def create_parser_in(parent_parser):
+        parser = parent_parser.add_parser(
+            ServeCommand.command,
+            description="Resident process serving the jinja and j2props renders forwarded "
+            "with magicdust --server",
+        )
+        parser.add_argument(
+            "--socket",
+            "-s",
+            required=True,
+            type=str,
+            help="Path of the unix socket to listen on",
+        )
+        return parser
@@ -0,0 +1,20 @@
+import json
+import socket
+
+
+def send_request(socket_path, request):
+    """
+    Sends a render request to a running server
+    :param socket_path: Path of the unix socket of the server
+    :param request: Dictionary of the request
+    :return: The rendered output
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            response = json.loads(stream.readline())
+    if response.get("status") != "ok":
+        raise Exception(f"Render server error: {response.get('error')}")
+    return response["output"]
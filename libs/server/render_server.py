@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import socketserver
+import threading
+
+from libs import get_logger
+from libs.j2props.j2props_utils import J2PropsTemplate
+from libs.jinja.jinja_utils import JinjaTemplate
+
+logger = get_logger(__name__)
+
+
+class RenderState:
+    """
+    Warm state shared by all the requests of the server: the JinjaTemplate of every values file and
+    environment, with its compiled templates and parsed values, and the J2PropsTemplate of every
+    region, with its Secrets Manager client. The j2props renders of a region run one at a time, as
+    their secrets are only shared by the lookups of a request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jinja_templates = {}
+        # J2PropsTemplate and render lock of every region
+        self.j2props_templates = {}
+
+    def render(self, request):
+        """
+        Renders the templates of a request
+        :param request: Dictionary decoded from a request line
+        :return: The rendered output
+        """
+        command = request.get("command")
+        if command == "jinja":
+            return self.__render_jinja(request)
+        elif command == "j2props":
+            return self.__render_j2props(request)
+        raise ValueError(f"Invalid command: {command}")
+
+    # Private methods
+
+    def __render_jinja(self, request):
+        jinja_template = self.__get_jinja_template(
+            request["values"],
+            request["environment"],
+            request.get("env_prefix", "AWS_ENV_VARS_"),
+        )
+        out = io.StringIO()
+        for template_file in request["templates"]:
+            jinja_template.stream_from_template(
+                template_file,
+                out,
+                request.get("output", "yaml"),
+                request.get("dynamic_vars"),
+            )
+        return out.getvalue()
+
+    def __render_j2props(self, request):
+        region = request.get("region", "us-east-2")
+        with self.lock:
+            if region not in self.j2props_templates:
+                self.j2props_templates[region] = (
+                    J2PropsTemplate(region),
+                    threading.Lock(),
+                )
+            j2props_template, render_lock = self.j2props_templates[region]
+        # The cache is cleared and filled by one request at a time, so a concurrent request never
+        # clears the secrets of a render in progress
+        with render_lock:
+            j2props_template.secret_cache.clear()
+            output = j2props_template.render_from_template(
+                request["values"], request["template"]
+            )
+        return output + "\n"
+
+    def __get_jinja_template(self, values_input_file, environment, env_vars_prefix):
+        # The values are rendered again once the values file is modified
+        stat = os.stat(values_input_file)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        key = (values_input_file, environment, env_vars_prefix)
+        with self.lock:
+            cached = self.jinja_templates.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        # The dynamic variables of a request are the ones forwarded by its client, the environment
+        # of the server is never looked up
+        jinja_template = JinjaTemplate(
+            values_input_file, environment, env_vars_prefix, environ={}
+        )
+        with self.lock:
+            self.jinja_templates[key] = (signature, jinja_template)
+        return jinja_template
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = {"status": "ok", "output": self.server.state.render(request)}
+            except Exception as e:
+                logger.error(f"Failed to render the request: {e}")
+                response = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class RenderServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Resident render server listening on a unix socket. Every connection sends render requests as json
+    lines and receives one json line per request. Connections are served concurrently.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.socket_path = socket_path
+        super().__init__(socket_path, _RequestHandler)
+        self.state = RenderState()
+
+    def server_bind(self):
+        super().server_bind()
+        # Only the owner of the server can send requests. The socket does not accept any
+        # connection before server_activate listens on it.
+        os.chmod(self.socket_path, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
@@ -0,0 +1,14 @@
+from libs.boto3.clients import ClientRegistry
+
+
+def test_clients_are_shared_per_service_region_and_profile():
+    registry = ClientRegistry(max_pool_connections=50, region="us-east-2")
+
+    client = registry.client("ec2")
+    assert registry.client("ec2", "us-east-2") is client
+    assert registry.client("ec2", "eu-west-1") is not client
+    assert registry.client("elbv2") is not client
+    assert client.meta.region_name == "us-east-2"
+    assert client.meta.config.max_pool_connections == 50
+    assert client.meta.config.retries["mode"] == "standard"
+    assert len(registry.sessions) == 1
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from libs.boto3.fan_out import FanOutError, fan_out
+
+
+def test_results_are_in_the_order_of_the_items():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def create(item):
+        # The 3 requests are in flight together, the last one finishing first
+        barrier.wait()
+        time.sleep(0.01 * (3 - item))
+        return f"subnet-{item}"
+
+    assert fan_out(create, [1, 2, 3]) == ["subnet-1", "subnet-2", "subnet-3"]
+
+
+def test_requests_in_flight_are_bounded():
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def request(item):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+
+    fan_out(request, range(10), max_concurrency=3)
+
+    assert in_flight[1] <= 3
+
+
+def test_failures_are_reported_together_once_all_requests_ran():
+    def delete(item):
+        if item != "ok":
+            raise ValueError(f"{item} in use")
+        return item
+
+    with pytest.raises(FanOutError) as error:
+        fan_out(delete, ["a", "ok", "b"], max_concurrency=2)
+
+    assert str(error.value) == "2 of 3 requests failed: 'a': a in use; 'b': b in use"
+    assert error.value.results == [None, "ok", None]
+    assert sorted(error.value.errors) == [0, 2]
@@ -0,0 +1,127 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import libs.boto3.ecs_fargate_infra as ecs_fargate
+import libs.boto3.inventory as inventory_module
+from conftest import FakeClient
+from libs.boto3.inventory import RESOURCE_DESCRIBES, Inventory, validate
+from libs.boto3.stack_context import StackContext
+
+KEY = ("123456789012", "us-east-1", "stack", "qa")
+CONTEXT = StackContext(
+    vpc_id="vpc-1",
+    subnet_ids=["subnet-1", "subnet-2"],
+    security_group_id="sg-1",
+    load_balancer_arn="arn:lb",
+    load_balancer_dns="lb.example.com",
+)
+
+
+def test_entries_are_served_until_their_ttl(tmp_path, monkeypatch):
+    inventory = Inventory(str(tmp_path), ttl=60)
+    inventory.save(KEY, CONTEXT)
+
+    assert inventory.load(KEY) == CONTEXT
+    assert inventory.load(KEY[:3] + ("uat",)) is None
+
+    now = inventory_module.time.time()
+    monkeypatch.setattr(inventory_module.time, "time", lambda: now + 61)
+    assert inventory.load(KEY) is None
+
+    inventory.invalidate(KEY)
+    assert not list(tmp_path.iterdir())
+
+
+def describe(missing):
+    """
+    Response of the describe calls of the requested resources, failing on the missing ones
+    """
+
+    def respond(**kwargs):
+        [resource_ids] = kwargs.values()
+        if set(resource_ids) & set(missing):
+            raise ClientError({"Error": {"Code": "NotFound"}}, "Describe")
+        [result] = [
+            result
+            for _, _, _, parameter, result in RESOURCE_DESCRIBES
+            if parameter in kwargs
+        ]
+        return {result: [{"Id": resource_id} for resource_id in resource_ids]}
+
+    return respond
+
+
+@pytest.mark.parametrize(
+    "missing, valid",
+    [([], True), (["vpc-1"], False), (["subnet-2"], False), (["sg-1"], False)],
+)
+def test_validation_describes_every_cached_resource(monkeypatch, missing, valid):
+    client = FakeClient(
+        {operation: describe(missing) for _, _, operation, _, _ in RESOURCE_DESCRIBES}
+    )
+    monkeypatch.setattr(
+        inventory_module, "get_client", lambda service, region=None: client
+    )
+
+    assert validate(CONTEXT) is valid
+    assert valid is False or set(client.names()) == {
+        "describe_vpcs",
+        "describe_subnets",
+        "describe_security_groups",
+        "describe_load_balancers",
+    }
+    assert validate(StackContext()) is False
+
+
+def test_inactive_clusters_are_out_of_date(monkeypatch):
+    client = FakeClient(
+        {
+            "describe_clusters": {
+                "clusters": [{"clusterArn": "arn:cluster", "status": "INACTIVE"}]
+            }
+        }
+    )
+    monkeypatch.setattr(inventory_module, "get_client", lambda *args: client)
+
+    assert validate(StackContext(cluster_arn="arn:cluster")) is False
+
+
+def test_dry_run_reads_the_resources_from_the_inventory(
+    tmp_path, monkeypatch, fake_stack
+):
+    stack = fake_stack()
+    monkeypatch.setattr(ecs_fargate, "stack_key", lambda *tag: KEY)
+    monkeypatch.setattr(ecs_fargate, "validate", lambda context: True)
+    monkeypatch.setattr(StackContext, "discover", None)
+    Inventory(str(tmp_path)).save(KEY, CONTEXT)
+
+    ecs_fargate.destroy("values.yaml", "qa", "templates", inventory_dir=str(tmp_path))
+
+    assert sorted(stack.names()) == [
+        "change_record_set_elbv2",
+        "delete_ecs_fargate_cluster",
+        "delete_elbv2_resources",
+        "delete_vpc",
+    ]
+    assert all(
+        kwargs["context"] == CONTEXT
+        for name, _, kwargs in stack.calls
+        if name != "change_record_set_elbv2"
+    )
+    assert Inventory(str(tmp_path)).load(KEY) == CONTEXT
+
+
+def test_failed_create_keeps_the_entry_of_the_stack(tmp_path, monkeypatch, fake_stack):
+    def create_vpc():
+        raise Exception("VPC already exists")
+
+    stack = fake_stack(
+        {"create_vpc": create_vpc, "create_ecs_fargate_cluster": "arn:c"}
+    )
+    monkeypatch.setattr(ecs_fargate, "stack_key", lambda *tag: KEY)
+    Inventory(str(tmp_path)).save(KEY, CONTEXT)
+
+    ecs_fargate.create("values.yaml", "qa", "templates", inventory_dir=str(tmp_path))
+
+    assert "create_vpc" in stack.names()
+    assert Inventory(str(tmp_path)).load(KEY) == CONTEXT
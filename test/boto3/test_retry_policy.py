@@ -0,0 +1,117 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import libs.boto3.retry_policy as retry_policy
+from libs.boto3.common import retry
+from libs.boto3.retry_policy import (
+    DEPENDENCY,
+    EVENTUAL_CONSISTENCY,
+    FATAL,
+    THROTTLING,
+    RetryPolicy,
+    RetryStats,
+    classify,
+)
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "DeleteSubnet")
+
+
+class Failing:
+    """
+    Function failing with the given error codes before succeeding
+    """
+
+    def __init__(self, *codes):
+        self.codes = list(codes)
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        if self.codes:
+            raise client_error(self.codes.pop(0))
+        return "deleted"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(retry_policy.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_errors_are_classified_by_code():
+    assert classify(client_error("RequestLimitExceeded")) == THROTTLING
+    assert classify(client_error("DependencyViolation")) == DEPENDENCY
+    assert classify(client_error("InvalidSubnetID.NotFound")) == EVENTUAL_CONSISTENCY
+    assert classify(client_error("UnauthorizedOperation")) == FATAL
+
+
+def test_backoff_is_exponential_with_full_jitter(monkeypatch):
+    monkeypatch.setattr(retry_policy.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(base_delay=1, max_delay=6)
+
+    assert [policy.backoff(retry) for retry in range(5)] == [1, 2, 4, 6, 6]
+
+
+def test_transient_errors_are_retried_and_recorded(sleeps):
+    stats = RetryStats()
+    function = Failing("Throttling", "DependencyViolation")
+
+    result = RetryPolicy(stats=stats).call("delete_subnet", function, "subnet-1")
+
+    assert result == "deleted"
+    assert len(function.calls) == 3 and len(sleeps) == 2
+    assert stats.operations["delete_subnet"] == (1, 3, sum(sleeps))
+
+
+def test_fatal_errors_are_not_retried(sleeps):
+    function = Failing("InvalidParameterValue")
+
+    with pytest.raises(ClientError):
+        RetryPolicy(stats=RetryStats()).call("delete_subnet", function)
+
+    assert len(function.calls) == 1 and sleeps == []
+
+
+def test_resources_not_visible_yet_are_retried(sleeps):
+    function = Failing("InvalidGroup.NotFound", "InvalidRouteTableID.NotFound")
+
+    result = RetryPolicy(stats=RetryStats()).call("authorize_ingress", function)
+
+    assert result == "deleted"
+    assert len(function.calls) == 3 and len(sleeps) == 2
+
+
+def test_deletes_of_missing_resources_succeed_at_once(sleeps):
+    function = Failing("InvalidSubnetID.NotFound")
+
+    result = RetryPolicy(stats=RetryStats()).call("delete_subnet_by_id", function)
+
+    assert result is None
+    assert len(function.calls) == 1 and sleeps == []
+
+
+def test_retries_stop_at_the_deadline(sleeps):
+    function = Failing(*["DependencyViolation"] * 10)
+    policy = RetryPolicy(base_delay=10, max_delay=10, deadline=0, stats=RetryStats())
+
+    with pytest.raises(Exception, match="deadline"):
+        policy.call("delete_subnet", function)
+
+    assert len(function.calls) == 1
+
+
+def test_decorator_honors_the_overrides_and_passes_the_kwargs(sleeps):
+    function = Failing(*["DependencyViolation"] * 10)
+
+    @retry
+    def delete_subnet(subnet_id, max_retries=8, delay=1, deadline=300):
+        return function(subnet_id, max_retries=max_retries)
+
+    with pytest.raises(Exception, match="Maximum retries exceeded"):
+        delete_subnet("subnet-1", max_retries=3)
+
+    assert function.calls == [(("subnet-1",), {"max_retries": 3})] * 3
+    assert len(sleeps) == 2
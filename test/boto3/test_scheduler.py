@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from libs.boto3.scheduler import BLOCKED, FAILED, SUCCEEDED, Step, StepScheduler
+from libs.boto3.stack_context import StackContext
+
+
+def test_independent_steps_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def produce(field, value):
+        def function(context):
+            barrier.wait()
+            setattr(context, field, value)
+
+        return function
+
+    def create_target_group(context):
+        time.sleep(0.05)
+        context.target_group_arn = context.vpc_id
+
+    steps = [
+        Step("cluster", produce("cluster_arn", "arn:cluster"), outputs=["cluster_arn"]),
+        Step("vpc", produce("vpc_id", "vpc-1"), outputs=["vpc_id"]),
+        Step("target_group", create_target_group, ["vpc_id"], ["target_group_arn"]),
+    ]
+    scheduler = StepScheduler(steps, max_parallel=2)
+    context = StackContext()
+
+    assert scheduler.run(context) == {}
+    assert context.target_group_arn == "vpc-1"
+    assert scheduler.dependencies["target_group"] == {"vpc"}
+    assert scheduler.critical_path() == ["vpc", "target_group"]
+
+
+def test_a_failure_only_blocks_the_dependent_steps():
+    def fail(context):
+        raise RuntimeError("boom")
+
+    def slow(context):
+        time.sleep(0.05)
+
+    steps = [
+        Step("vpc", fail, outputs=["vpc_id"]),
+        Step("subnets", slow, ["vpc_id"], ["subnet_ids"]),
+        Step("cluster", slow, outputs=["cluster_arn"]),
+        Step("ingress", slow, after=["subnets"]),
+    ]
+    scheduler = StepScheduler(steps)
+
+    failures = scheduler.run(StackContext())
+
+    assert list(failures) == ["vpc"]
+    statuses = {name: step.status for name, step in scheduler.steps.items()}
+    assert statuses == {
+        "vpc": FAILED,
+        "subnets": BLOCKED,
+        "cluster": SUCCEEDED,
+        "ingress": BLOCKED,
+    }
+
+
+def test_resume_skips_the_steps_already_created():
+    calls = []
+    steps = [
+        Step("vpc", lambda context: calls.append("vpc"), outputs=["vpc_id"]),
+        Step("ingress", lambda context: calls.append("ingress"), after=["vpc"]),
+        Step(
+            "cluster", lambda context: calls.append("cluster"), outputs=["cluster_arn"]
+        ),
+        Step(
+            "record", lambda context: calls.append("record"), after=["vpc"], always=True
+        ),
+    ]
+
+    StepScheduler(steps).run(StackContext(vpc_id="vpc-1"), resume=True)
+
+    assert sorted(calls) == ["cluster", "record"]
+
+
+def test_cycles_are_rejected():
+    steps = [
+        Step("a", print, ["vpc_id"], ["subnet_ids"]),
+        Step("b", print, ["subnet_ids"], ["vpc_id"]),
+    ]
+    with pytest.raises(ValueError, match="Cycle"):
+        StepScheduler(steps)
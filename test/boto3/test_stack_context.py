@@ -0,0 +1,99 @@
+import libs.boto3.ecs_fargate_infra as ecs_fargate
+from conftest import FakeClient
+from libs.boto3.ec2 import BotoEc2
+from libs.boto3.stack_context import StackContext
+from libs.jinja.jinja_utils import JinjaTemplate
+
+
+def create_elbv2(subnet_ids, sg_id, context):
+    context.load_balancer_arn = "arn:lb"
+    context.load_balancer_dns = "lb.example.com"
+    return context.load_balancer_arn
+
+
+RESULTS = {
+    "create_vpc": "vpc-1",
+    "create_subnets_for_vpc": ["subnet-1", "subnet-2"],
+    "create_internet_gateway_route": ("igw-1", "rtb-1"),
+    "create_security_group": "sg-1",
+    "create_elbv2": create_elbv2,
+    "create_elbv2_target_group": "arn:tg",
+    "create_elbv2_listeners": ["arn:listener"],
+    "create_ecs_fargate_cluster": "arn:cluster",
+}
+
+
+def test_create_passes_the_ids_between_the_steps(fake_stack, capsys):
+    stack = fake_stack(RESULTS)
+
+    context = ecs_fargate.create("values.yaml", "qa", "templates", max_parallel=3)
+
+    calls = [(name,) + args for name, args, _ in stack.calls]
+    assert sorted(calls, key=str) == sorted(
+        [
+            ("create_vpc",),
+            ("create_subnets_for_vpc", "vpc-1"),
+            ("create_internet_gateway_route", "vpc-1"),
+            ("associate_subnets_with_route_table", "rtb-1", ["subnet-1", "subnet-2"]),
+            ("create_security_group", "vpc-1"),
+            ("create_security_group_ingress", "sg-1"),
+            ("create_elbv2", ["subnet-1", "subnet-2"], "sg-1"),
+            ("create_elbv2_target_group", "vpc-1"),
+            ("create_elbv2_listeners", "arn:lb", "arn:tg"),
+            ("create_ecs_fargate_cluster",),
+            ("change_record_set_elbv2", "CREATE"),
+        ],
+        key=str,
+    )
+    assert not any(name.startswith("find_") for name in stack.names())
+    assert context == StackContext(
+        vpc_id="vpc-1",
+        subnet_ids=["subnet-1", "subnet-2"],
+        internet_gateway_id="igw-1",
+        route_table_id="rtb-1",
+        security_group_id="sg-1",
+        load_balancer_arn="arn:lb",
+        load_balancer_dns="lb.example.com",
+        target_group_arn="arn:tg",
+        listener_arns=["arn:listener"],
+        cluster_arn="arn:cluster",
+    )
+    assert "Critical path (*): ec2.vpc -> " in capsys.readouterr().out
+
+
+def test_refused_create_changes_nothing(fake_stack):
+    def create_vpc():
+        raise Exception("VPC already exists")
+
+    stack = fake_stack(dict(RESULTS, create_vpc=create_vpc))
+
+    assert ecs_fargate.create("values.yaml", "qa", "templates") is None
+    assert stack.names() == ["create_vpc"]
+
+
+def test_templates_see_the_ids_of_all_the_resources_created_so_far(
+    tmp_path, boto_instance
+):
+    values_file = tmp_path / "values.yaml"
+    values_file.write_text(
+        "common:\n"
+        "  vpc: '%%AWS_ENV_VARS_VPC_ID'\n"
+        "  subnet: '%%AWS_ENV_VARS_SUBNET_ID_2'\n"
+    )
+    template_file = tmp_path / "security_group_ingress.yaml.jinja2"
+    template_file.write_text(
+        "GroupId: sg-1\n"
+        "IpPermissions: [{IpProtocol: tcp, FromPort: 80, ToPort: 80, "
+        "IpRanges: [{CidrIp: 0.0.0.0/0, Description: '{{ inputs.vpc }} {{ inputs.subnet }}'}]}]\n"
+    )
+    client = FakeClient()
+    ec2 = boto_instance(BotoEc2, client)
+    ec2.jinja_template = JinjaTemplate(str(values_file), "qa")
+    ec2.stack_context = StackContext(
+        vpc_id="vpc-1", subnet_ids=["subnet-1", "subnet-2"]
+    )
+
+    ec2.create_security_group_ingress("sg-1", str(template_file))
+
+    [(_, request)] = client.calls
+    assert request["IpPermissions"][0]["IpRanges"][0]["Description"] == "vpc-1 subnet-2"
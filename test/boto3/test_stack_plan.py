@@ -0,0 +1,303 @@
+import libs.boto3.ecs_fargate_infra as ecs_fargate
+from conftest import FakeBoto, FakeClient
+from libs.boto3.scheduler import StepScheduler
+from libs.boto3.stack_context import StackContext
+from libs.boto3.stack_plan import StackPlan
+
+CONTEXT = StackContext(
+    vpc_id="vpc-1",
+    subnet_ids=["subnet-a", "subnet-b"],
+    internet_gateway_id="igw-1",
+    route_table_id="rtb-1",
+    security_group_id="sg-1",
+    load_balancer_arn="arn:lb",
+    load_balancer_dns="lb.example.com",
+    target_group_arn="arn:tg",
+    listener_arns=["arn:listener-80"],
+    cluster_arn="arn:cluster",
+)
+FORWARD = [{"Type": "forward", "TargetGroupArn": "arn:tg"}]
+PUBLIC = [{"CidrIp": "0.0.0.0/0"}]
+VPC = [{"CidrIp": "10.0.0.0/16"}]
+
+
+class FakeTemplate:
+    """
+    Renders the requests of the templates, the subnets of the load balancer from the dynamic vars
+    """
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def render_to_object(self, template_file, dynamic_vars=None):
+        if template_file == "elbv2.yaml.jinja2":
+            return {
+                "Subnets": [
+                    dynamic_vars[f"AWS_ENV_VARS_SUBNET_ID_{i + 1}"]
+                    for i in range(len(dynamic_vars) - 1)
+                ]
+            }
+        return self.requests[template_file]
+
+
+def fake_boto(requests, **live):
+    """
+    Boto* instance rendering the requests of the templates and describing the live resources
+    """
+    jinja_template = FakeTemplate(requests)
+
+    def render_elbv2_request(subnet_ids, sg_id):
+        dynamic_vars = {"AWS_ENV_VARS_SG_ID": sg_id}
+        for index, subnet_id in enumerate(subnet_ids):
+            dynamic_vars[f"AWS_ENV_VARS_SUBNET_ID_{index + 1}"] = subnet_id
+        return jinja_template.render_to_object("elbv2.yaml.jinja2", dynamic_vars)
+
+    return FakeBoto(
+        dict(
+            live,
+            get_template=lambda template_file, template_name: template_name,
+            render_elbv2_request=render_elbv2_request,
+        ),
+        FakeClient({"create_subnet": {"Subnet": {"SubnetId": "subnet-c"}}}),
+        jinja_template,
+    )
+
+
+def subnet(cidr, zone, subnet_id=None):
+    return dict(
+        CidrBlock=cidr,
+        AvailabilityZone=zone,
+        **({"SubnetId": subnet_id} if subnet_id else {}),
+    )
+
+
+def ingress(*ports):
+    return {
+        "GroupId": "sg-1",
+        "IpPermissions": [
+            {
+                "IpProtocol": "tcp",
+                "FromPort": port,
+                "ToPort": port,
+                "IpRanges": [{"CidrIp": "0.0.0.0/0", "Description": "public"}],
+            }
+            for port in ports
+        ],
+    }
+
+
+def listener(port, actions=FORWARD):
+    return {
+        "LoadBalancerArn": "arn:lb",
+        "Protocol": "HTTP",
+        "Port": port,
+        "DefaultActions": actions,
+    }
+
+
+def live_stack():
+    ec2 = fake_boto(
+        {
+            "subnets.yaml.jinja2": [
+                subnet("10.0.1.0/24", "a"),
+                subnet("10.0.2.0/24", "b"),
+            ],
+            "security_group_ingress.yaml.jinja2": ingress(80),
+        },
+        get_subnet_details_by_vpc_id=[
+            subnet("10.0.1.0/24", "a", "subnet-a"),
+            subnet("10.0.2.0/24", "b", "subnet-b"),
+        ],
+        get_security_group_ingress=ingress(80)["IpPermissions"],
+    )
+    elbv2 = fake_boto(
+        {"elbv2_listeners.yaml.jinja2": [listener(80)]},
+        get_elbv2_subnets_by_arn=["subnet-b", "subnet-a"],
+        get_listener_details_by_elbv2_arn=[
+            dict(
+                listener(80),
+                ListenerArn="arn:listener-80",
+                DefaultActions=[dict(FORWARD[0], ForwardConfig={"TargetGroups": []})],
+            )
+        ],
+    )
+    return ec2, elbv2
+
+
+def test_unchanged_stack_has_an_empty_plan():
+    ec2, elbv2 = live_stack()
+
+    stack_plan = StackPlan(ec2, elbv2, CONTEXT, [])
+    stack_plan.apply_changes()
+
+    assert stack_plan.is_empty()
+    assert ec2.client.calls == elbv2.client.calls == []
+
+
+def test_only_the_changed_resources_are_applied(capsys):
+    ec2, elbv2 = live_stack()
+    ec2.jinja_template.requests["subnets.yaml.jinja2"].append(
+        subnet("10.0.3.0/24", "c")
+    )
+    ec2.jinja_template.requests["security_group_ingress.yaml.jinja2"] = ingress(80, 443)
+    elbv2.jinja_template.requests["elbv2_listeners.yaml.jinja2"] = [
+        listener(80, [{"Type": "fixed-response"}]),
+        listener(8080),
+    ]
+
+    stack_plan = StackPlan(ec2, elbv2, CONTEXT, [])
+    stack_plan.print()
+    stack_plan.apply_changes()
+
+    assert capsys.readouterr().out.splitlines() == [
+        "Plan: 3 to create, 2 to modify, 0 to delete",
+        "+ ec2.subnet 10.0.3.0/24 c",
+        "~ elbv2.load_balancer arn:lb: subnets ['subnet-a', 'subnet-b'] -> "
+        "['subnet-a', 'subnet-b', '10.0.3.0/24 c']",
+        "+ ec2.security_group_ingress tcp/443 from 0.0.0.0/0",
+        "~ elbv2.listener 80: DefaultActions",
+        "+ elbv2.listener 8080",
+    ]
+    assert ec2.client.names() == [
+        "create_subnet",
+        "authorize_security_group_ingress",
+    ]
+    assert [
+        args
+        for name, args, _ in ec2.calls
+        if name == "associate_subnets_with_route_table"
+    ] == [("rtb-1", ["subnet-c"])]
+    assert elbv2.client.calls == [
+        (
+            "set_subnets",
+            {
+                "LoadBalancerArn": "arn:lb",
+                "Subnets": ["subnet-a", "subnet-b", "subnet-c"],
+            },
+        ),
+        (
+            "modify_listener",
+            {
+                "ListenerArn": "arn:listener-80",
+                "DefaultActions": [{"Type": "fixed-response"}],
+            },
+        ),
+        ("create_listener", listener(8080)),
+    ]
+
+
+def test_removed_resources_are_deleted():
+    ec2, elbv2 = live_stack()
+    ec2.jinja_template.requests["subnets.yaml.jinja2"].pop()
+    ec2.jinja_template.requests["security_group_ingress.yaml.jinja2"] = ingress()
+    elbv2.jinja_template.requests["elbv2_listeners.yaml.jinja2"] = []
+
+    changes = [str(change) for change in StackPlan(ec2, elbv2, CONTEXT, []).changes]
+
+    assert changes == [
+        "~ elbv2.load_balancer arn:lb: subnets ['subnet-a', 'subnet-b'] -> ['subnet-a']",
+        "- ec2.subnet 10.0.2.0/24 b: subnet-b",
+        "- ec2.security_group_ingress tcp/80 from 0.0.0.0/0",
+        "- elbv2.listener 80",
+    ]
+
+
+def test_ingress_rules_are_compared_by_protocol_name():
+    ec2, elbv2 = live_stack()
+    ec2.jinja_template.requests["security_group_ingress.yaml.jinja2"] = {
+        "GroupId": "sg-1",
+        "IpPermissions": [
+            {"IpProtocol": "6", "FromPort": "80", "ToPort": 80, "IpRanges": PUBLIC},
+            {"IpProtocol": "all", "FromPort": 0, "ToPort": 65535, "IpRanges": VPC},
+        ],
+    }
+    ec2.results["get_security_group_ingress"] = ingress(80)["IpPermissions"] + [
+        {"IpProtocol": "-1", "IpRanges": VPC},
+    ]
+
+    assert StackPlan(ec2, elbv2, CONTEXT, []).changes == []
+
+    ec2.results["get_security_group_ingress"] = ingress(80)["IpPermissions"]
+    stack_plan = StackPlan(ec2, elbv2, CONTEXT, [])
+    stack_plan.apply_changes()
+
+    assert [str(change) for change in stack_plan.changes] == [
+        "+ ec2.security_group_ingress -1 from 10.0.0.0/16"
+    ]
+    assert ec2.client.calls == [
+        (
+            "authorize_security_group_ingress",
+            {
+                "GroupId": "sg-1",
+                "IpPermissions": [{"IpProtocol": "-1", "IpRanges": VPC}],
+            },
+        )
+    ]
+
+
+def test_only_the_steps_of_the_missing_resources_are_pending():
+    steps = ecs_fargate.create_steps(None, None, None, None, True, False)
+    scheduler = StepScheduler(steps)
+
+    assert scheduler.pending(CONTEXT) == []
+    assert scheduler.pending(StackContext(**dict(vars(CONTEXT), cluster_arn=None))) == [
+        "ecs.cluster"
+    ]
+    assert sorted(scheduler.pending(StackContext())) == sorted(
+        step.name for step in steps
+    )
+
+
+def test_subnets_are_compared_by_zone_only_when_the_template_sets_it():
+    ec2, elbv2 = live_stack()
+    ec2.results["get_subnet_details_by_vpc_id"] = [
+        dict(subnet("10.0.1.0/24", "a", "subnet-a"), AvailabilityZoneId="use1-az1"),
+        dict(subnet("10.0.2.0/24", "b", "subnet-b"), AvailabilityZoneId="use1-az2"),
+    ]
+    ec2.jinja_template.requests["subnets.yaml.jinja2"] = [
+        {"CidrBlock": "10.0.1.0/24"},
+        {"CidrBlock": "10.0.2.0/24", "AvailabilityZoneId": "use1-az2"},
+    ]
+
+    assert StackPlan(ec2, elbv2, CONTEXT, []).changes == []
+
+    ec2.jinja_template.requests["subnets.yaml.jinja2"][1][
+        "AvailabilityZoneId"
+    ] = "use1-az3"
+    assert [str(change) for change in StackPlan(ec2, elbv2, CONTEXT, []).changes] == [
+        "+ ec2.subnet 10.0.2.0/24 use1-az3",
+        "~ elbv2.load_balancer arn:lb: subnets ['subnet-a', 'subnet-b'] -> "
+        "['subnet-a', '10.0.2.0/24 use1-az3']",
+        "- ec2.subnet 10.0.2.0/24 b: subnet-b",
+    ]
+
+
+def test_ingress_rules_name_the_security_groups_by_id_or_name():
+    ec2, elbv2 = live_stack()
+    lb = {"IpProtocol": "tcp", "FromPort": 8080, "ToPort": 8080}
+    ec2.jinja_template.requests["security_group_ingress.yaml.jinja2"] = {
+        "GroupId": "sg-1",
+        "IpPermissions": ingress(80)["IpPermissions"]
+        + [dict(lb, UserIdGroupPairs=[{"GroupName": "lb"}, {"GroupName": "bastion"}])],
+    }
+    ec2.results["get_security_group_ingress"] = ingress(80)["IpPermissions"] + [
+        dict(lb, UserIdGroupPairs=[{"GroupId": "sg-lb", "GroupName": "lb"}]),
+    ]
+
+    stack_plan = StackPlan(ec2, elbv2, CONTEXT, [])
+    stack_plan.apply_changes()
+
+    assert [str(change) for change in stack_plan.changes] == [
+        "+ ec2.security_group_ingress tcp/8080 from bastion"
+    ]
+    assert ec2.client.calls == [
+        (
+            "authorize_security_group_ingress",
+            {
+                "GroupId": "sg-1",
+                "IpPermissions": [
+                    dict(lb, UserIdGroupPairs=[{"GroupName": "bastion"}])
+                ],
+            },
+        )
+    ]
@@ -0,0 +1,122 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import libs.boto3.tag_discovery as tag_discovery
+from conftest import FakeClient
+from libs.boto3.ec2 import BotoEc2
+from libs.boto3.tag_discovery import (
+    ECS_CLUSTER,
+    LOAD_BALANCER,
+    TARGET_GROUP,
+    VPC,
+    TagDiscovery,
+)
+
+TAG = {"Key": "stack", "Value": "qa"}
+ACCOUNT = "arn:aws:elasticloadbalancing:us-east-1:123456789012"
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    clients = {}
+    monkeypatch.setattr(
+        tag_discovery, "get_client", lambda service, region=None: clients[service]
+    )
+    return clients
+
+
+def test_resources_are_found_with_the_paginated_tagging_api(clients):
+    clients["resourcegroupstaggingapi"] = FakeClient(
+        pages={
+            "get_resources": [
+                {
+                    "ResourceTagMappingList": [
+                        {"ResourceARN": "arn:aws:ec2:us-east-1:1:vpc/vpc-1"},
+                        {"ResourceARN": f"{ACCOUNT}:loadbalancer/app/lb/1"},
+                    ]
+                },
+                {
+                    "ResourceTagMappingList": [
+                        {"ResourceARN": "arn:aws:ecs:us-east-1:1:cluster/qa"},
+                        {"ResourceARN": f"{ACCOUNT}:targetgroup/tg/1"},
+                    ]
+                },
+            ]
+        }
+    )
+
+    resources = TagDiscovery("stack", "qa").find_all(
+        [VPC, LOAD_BALANCER, TARGET_GROUP, ECS_CLUSTER]
+    )
+
+    assert resources == {
+        VPC: ["vpc-1"],
+        LOAD_BALANCER: [f"{ACCOUNT}:loadbalancer/app/lb/1"],
+        TARGET_GROUP: [f"{ACCOUNT}:targetgroup/tg/1"],
+        ECS_CLUSTER: ["arn:aws:ecs:us-east-1:1:cluster/qa"],
+    }
+    assert clients["resourcegroupstaggingapi"].calls == [
+        (
+            "get_resources",
+            {
+                "TagFilters": [{"Key": "stack", "Values": ["qa"]}],
+                "ResourceTypeFilters": [VPC, LOAD_BALANCER, TARGET_GROUP, ECS_CLUSTER],
+            },
+        )
+    ]
+
+
+def test_fallback_describes_the_tags_by_chunks_of_20(clients):
+    arns = [f"{ACCOUNT}:targetgroup/tg/{i}" for i in range(45)]
+    tagged = {arns[3], arns[30], arns[44]}
+
+    def describe_tags(ResourceArns):
+        assert len(ResourceArns) <= 20
+        return {
+            "TagDescriptions": [
+                {"ResourceArn": arn, "Tags": [TAG] if arn in tagged else []}
+                for arn in ResourceArns
+            ]
+        }
+
+    clients["resourcegroupstaggingapi"] = FakeClient(
+        pages={
+            "get_resources": ClientError(
+                {"Error": {"Code": "AccessDenied"}}, "GetResources"
+            )
+        }
+    )
+    clients["elbv2"] = FakeClient(
+        {"describe_tags": describe_tags},
+        pages={
+            "describe_target_groups": [
+                {"TargetGroups": [{"TargetGroupArn": arn} for arn in arns[:30]]},
+                {"TargetGroups": [{"TargetGroupArn": arn} for arn in arns[30:]]},
+            ]
+        },
+    )
+
+    assert TagDiscovery("stack", "qa").find(TARGET_GROUP) == sorted(
+        tagged, key=arns.index
+    )
+    assert clients["elbv2"].names().count("describe_tags") == 3
+
+
+def test_vpc_creation_checks_the_tag_with_describe_vpcs(clients, boto_instance):
+    # The tagging API may not list a VPC created moments ago
+    clients["resourcegroupstaggingapi"] = FakeClient(
+        pages={"get_resources": [{"ResourceTagMappingList": []}]}
+    )
+    ec2 = boto_instance(
+        BotoEc2,
+        FakeClient(pages={"describe_vpcs": [{"Vpcs": [{"VpcId": "vpc-1"}]}]}),
+        {"tags": {"key": "stack", "name": "qa"}},
+    )
+
+    with pytest.raises(Exception, match="vpc-1"):
+        ec2.create_vpc()
+
+    assert ec2.client.calls == [
+        ("describe_vpcs", {"Filters": [{"Name": "tag:stack", "Values": ["qa"]}]})
+    ]
+    assert clients["resourcegroupstaggingapi"].calls == []
@@ -0,0 +1,120 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import FakeClient
+from libs.boto3.ec2 import BotoEc2
+from libs.boto3.elbv2 import BotoElbv2
+from libs.boto3.route53 import BotoRoute53
+
+
+def test_target_groups_are_deleted_once_the_load_balancers_are_gone(
+    monkeypatch, boto_instance
+):
+    client = FakeClient(
+        concurrent_calls=["delete_load_balancer", "delete_target_group"], parties=2
+    )
+    elbv2 = boto_instance(BotoElbv2, client)
+    monkeypatch.setattr(elbv2, "find_elbv2_by_tag", lambda: ["arn:lb1", "arn:lb2"])
+    monkeypatch.setattr(
+        elbv2, "find_elbv2_target_group_by_tag", lambda: ["arn:tg1", "arn:tg2"]
+    )
+
+    elbv2.delete_elbv2_resources(dry_run=False)
+
+    names = client.names()
+    assert names.index("wait:load_balancers_deleted") == 2
+    assert sorted(names[:2]) == ["delete_load_balancer"] * 2
+    assert sorted(names[3:]) == ["delete_target_group"] * 2
+    assert client.calls[2][1]["LoadBalancerArns"] == ["arn:lb1", "arn:lb2"]
+
+
+def test_vpc_is_deleted_after_the_network_interfaces_and_its_resources(
+    monkeypatch, boto_instance
+):
+    client = FakeClient(
+        {
+            "describe_network_interfaces": [
+                {"NetworkInterfaces": [{"NetworkInterfaceId": "eni-1"}]},
+                {"NetworkInterfaces": []},
+            ]
+        },
+        concurrent_calls=[
+            "delete_subnet",
+            "delete_security_group",
+            "delete_internet_gateway",
+        ],
+        parties=4,
+    )
+    ec2 = boto_instance(BotoEc2, client)
+    monkeypatch.setattr(ec2, "find_vpcs_by_tag", lambda: ["vpc-1"])
+    monkeypatch.setattr(
+        ec2, "get_subnets_by_vpc_id", lambda _: ["subnet-1", "subnet-2"]
+    )
+    monkeypatch.setattr(ec2, "get_internet_gateways_by_vpc_id", lambda _: ["igw-1"])
+    monkeypatch.setattr(ec2, "get_security_groups_by_vpc_id", lambda _: ["sg-1"])
+    monkeypatch.setattr("libs.boto3.ec2.time.sleep", lambda _: None)
+
+    # The 4 deletes of the subnets, the security group and the gateway run at the same time
+    ec2.delete_vpc(dry_run=False)
+
+    names = client.names()
+    assert names[:2] == ["describe_network_interfaces"] * 2
+    assert client.calls[0][1]["Filters"][1] == {
+        "Name": "description",
+        "Values": ["ELB *", "arn:aws:ecs:*"],
+    }
+    assert names[-1] == "delete_vpc"
+    assert names.index("delete_internet_gateway") > names.index(
+        "detach_internet_gateway"
+    )
+
+
+def test_unreleased_network_interfaces_fail_the_delete(boto_instance):
+    eni = {"NetworkInterfaceId": "eni-1", "Description": "ELB app/lb/1"}
+    client = FakeClient({"describe_network_interfaces": {"NetworkInterfaces": [eni]}})
+
+    with pytest.raises(Exception, match="still in use after 0 seconds.*eni-1"):
+        boto_instance(BotoEc2, client).wait_for_network_interfaces_released(
+            "vpc-1", delay=1, timeout=0
+        )
+
+    assert client.names() == ["describe_network_interfaces"]
+
+
+def test_internet_gateway_detach_is_retried_until_the_addresses_are_released(
+    monkeypatch,
+    boto_instance,
+):
+    client = FakeClient(
+        {
+            "detach_internet_gateway": [
+                ClientError(
+                    {"Error": {"Code": "DependencyViolation"}}, "DetachInternetGateway"
+                ),
+                {},
+            ]
+        }
+    )
+    monkeypatch.setattr("libs.boto3.retry_policy.time.sleep", lambda _: None)
+
+    boto_instance(BotoEc2, client).detach_and_delete_internet_gateway("igw-1", "vpc-1")
+
+    assert client.names() == [
+        "detach_internet_gateway",
+        "detach_internet_gateway",
+        "delete_internet_gateway",
+    ]
+
+
+def test_dry_run_does_not_change_the_record_set(boto_instance):
+    client = FakeClient()
+    route53 = boto_instance(BotoRoute53, client)
+    route53.input_values_dict = {
+        "fargate_route_53": {
+            "change_batch": {"changes": [{"resource_record_set": {"name": "a.b"}}]}
+        }
+    }
+
+    route53.change_record_set_elbv2("DELETE", elb_dns="lb", dry_run=True)
+
+    assert client.calls == []
@@ -0,0 +1,198 @@
+import threading
+import time
+
+import pytest
+
+import libs.boto3.ecs_fargate_infra as ecs_fargate
+from libs import get_logger
+
+
+class SecretsClient:
+    """
+    In-memory stand-in of the Secrets Manager client answering get_secret_value, thread safe
+    """
+
+    def __init__(self, delay=0):
+        """
+        :param delay: Seconds taken by every call, so that concurrent renders overlap
+        """
+        self.delay = delay
+        self.secret_ids = []
+        self.lock = threading.Lock()
+
+    @property
+    def calls(self):
+        return len(self.secret_ids)
+
+    def get_secret_value(self, SecretId, **kwargs):
+        with self.lock:
+            self.secret_ids.append(SecretId)
+        time.sleep(self.delay)
+        return secret_value(SecretId)
+
+
+class BatchSecretsClient(SecretsClient):
+    """
+    Secrets Manager stand-in which also answers BatchGetSecretValue, every secret of a batch
+    counting as a call
+    """
+
+    def __init__(self, delay=0):
+        super().__init__(delay)
+        self.batches = []
+
+    def batch_get_secret_value(self, SecretIdList):
+        with self.lock:
+            self.batches.append(list(SecretIdList))
+            self.secret_ids.extend(SecretIdList)
+        return {
+            "SecretValues": [secret_value(secret_id) for secret_id in SecretIdList],
+            "Errors": [],
+        }
+
+
+def secret_value(secret_id):
+    return {
+        "ARN": f"arn:aws:secretsmanager:us-east-2:123456789012:secret:{secret_id}",
+        "Name": secret_id,
+        "SecretString": f"value-of-{secret_id}",
+    }
+
+
+@pytest.fixture
+def secrets_client():
+    """
+    Factory of the Secrets Manager stand-ins, answering BatchGetSecretValue when batch is set
+    """
+
+    def create(batch=False, delay=0):
+        return BatchSecretsClient(delay) if batch else SecretsClient(delay)
+
+    return create
+
+
+class FakeClient:
+    """
+    Stand-in of a boto3 client recording its calls as (operation, kwargs). The response of an
+    operation is a dictionary, a list of responses returned one per call, an exception raised or a
+    function called with the kwargs. A paginator returns the pages given for the operation, or its
+    response as a single page. The concurrent operations block until all the parties called them.
+    """
+
+    def __init__(self, responses=None, pages=None, concurrent_calls=(), parties=1):
+        self.responses = responses or {}
+        self.pages = pages or {}
+        self.calls = []
+        self.lock = threading.Lock()
+        self.concurrent_calls = set(concurrent_calls)
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def record(self, name, kwargs):
+        with self.lock:
+            self.calls.append((name, kwargs))
+
+    def names(self):
+        with self.lock:
+            return [name for name, _ in self.calls]
+
+    def call(self, name, kwargs):
+        self.record(name, kwargs)
+        if name in self.concurrent_calls:
+            self.barrier.wait()
+        with self.lock:
+            response = self.responses.get(name, {})
+            if isinstance(response, list):
+                response = response.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if callable(response):
+            return response(**kwargs)
+        return dict(response, ResponseMetadata={"HTTPStatusCode": 200})
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                if name not in client.pages:
+                    return iter([client.call(name, kwargs)])
+                client.record(name, kwargs)
+                if isinstance(client.pages[name], Exception):
+                    raise client.pages[name]
+                return iter(client.pages[name])
+
+        return Paginator()
+
+    def get_waiter(self, name):
+        client = self
+
+        class Waiter:
+            def wait(self, **kwargs):
+                client.record(f"wait:{name}", kwargs)
+
+        return Waiter()
+
+    def __getattr__(self, name):
+        return lambda **kwargs: self.call(name, kwargs)
+
+
+@pytest.fixture
+def boto_instance():
+    """
+    Factory of the Boto* classes talking to a FakeClient, without rendering any template
+    """
+
+    def create(cls, client, input_values_dict=None):
+        instance = object.__new__(cls)
+        instance.client = client
+        instance.input_values_dict = input_values_dict or {}
+        instance.logger = get_logger(__name__)
+        instance.stack_context = None
+        return instance
+
+    return create
+
+
+class FakeBoto:
+    """
+    Stand-in of the Boto* classes recording the calls of their methods as (method, args, kwargs).
+    A method returns its result given in results, called with the arguments when it is a function.
+    """
+
+    input_values_dict = {"tags": {"key": "stack", "name": "qa"}}
+
+    def __init__(self, results=None, client=None, jinja_template=None):
+        self.results = {} if results is None else results
+        self.client = client or FakeClient()
+        self.jinja_template = jinja_template
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def names(self):
+        with self.lock:
+            return [name for name, _, _ in self.calls]
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            with self.lock:
+                self.calls.append((name, args, kwargs))
+            result = self.results.get(name)
+            return result(*args, **kwargs) if callable(result) else result
+
+        return call
+
+
+@pytest.fixture
+def fake_stack(monkeypatch):
+    """
+    Factory of a FakeBoto standing in for all the Boto* classes and the JinjaTemplate of the
+    provisioning steps, so that their calls are recorded in one list
+    """
+
+    def create(results=None):
+        stack = FakeBoto(results)
+        for name in ["JinjaTemplate", "BotoEc2", "BotoEcs", "BotoElbv2", "BotoRoute53"]:
+            monkeypatch.setattr(ecs_fargate, name, lambda *args, **kwargs: stack)
+        return stack
+
+    return create
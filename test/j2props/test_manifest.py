@@ -0,0 +1,71 @@
+from libs.j2props.j2props_utils import J2PropsTemplate
+from libs.j2props.manifest import ManifestRenderer, load_manifest
+
+
+def test_manifest_files_share_the_secret_cache(tmp_path, secrets_client):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "application.properties").write_text(
+        "name={{ name }}\npassword={{ db.password | awssecret }}\n"
+    )
+    (templates / "bootstrap.yml").write_text(
+        "password-arn: {{ db.password | awssecretarn }}\n"
+    )
+    lines = ["files:"]
+    for service in ["a", "b", "c"]:
+        (tmp_path / f"{service}.yml").write_text(
+            f"name: service-{service}\ndb:\n  password: app/{service}/db\n"
+        )
+        for template in ["application.properties", "bootstrap.yml"]:
+            lines += [
+                f"  - values: {service}.yml",
+                f"    template: templates/{template}",
+                f"    output: out/{service}/{template}",
+            ]
+    (tmp_path / "manifest.yml").write_text("\n".join(lines) + "\n")
+
+    client = secrets_client()
+    j2props_template = J2PropsTemplate()
+    j2props_template._aws_client = client
+    entries = load_manifest(str(tmp_path / "manifest.yml"))
+    results = ManifestRenderer(j2props_template, jobs=4).render(entries)
+
+    assert [result.error for result in results] == [None] * 6
+    assert client.calls == 3
+    assert (tmp_path / "out/b/application.properties").read_text() == (
+        "name=service-b\npassword=value-of-app/b/db\n"
+    )
+    assert (
+        (tmp_path / "out/c/bootstrap.yml")
+        .read_text()
+        .startswith("password-arn: arn:aws:secretsmanager:")
+    )
+
+
+def test_an_entry_which_cannot_be_loaded_fails_alone(tmp_path, secrets_client):
+    (tmp_path / "application.properties").write_text(
+        "password={{ db.password | awssecret }}\n"
+    )
+    (tmp_path / "a.yml").write_text("db:\n  password: app/a/db\n")
+    (tmp_path / "manifest.yml").write_text(
+        "files:\n"
+        "  - values: a.yml\n"
+        "    template: application.properties\n"
+        "    output: out/a.properties\n"
+        "  - values: missing.yml\n"
+        "    template: application.properties\n"
+        "    output: out/missing.properties\n"
+    )
+
+    client = secrets_client()
+    j2props_template = J2PropsTemplate()
+    j2props_template._aws_client = client
+    entries = load_manifest(str(tmp_path / "manifest.yml"))
+    results = ManifestRenderer(j2props_template, jobs=2).render(entries)
+
+    assert results[0].error is None
+    assert results[1].error.startswith("FileExistsError: Not a valid file: ")
+    assert results[1].error.endswith("missing.yml")
+    assert (tmp_path / "out/a.properties").read_text() == "password=value-of-app/a/db\n"
+    assert not (tmp_path / "out/missing.properties").exists()
+    assert client.calls == 1
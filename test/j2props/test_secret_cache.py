@@ -0,0 +1,94 @@
+import pytest
+from cryptography.fernet import Fernet
+
+from conftest import FakeClient
+from libs.j2props.j2props_utils import J2PropsTemplate
+from libs.j2props.secret_cache import (
+    CACHE_KEY_ENV_VAR,
+    EncryptedDiskCache,
+    SecretCache,
+    caller_identity,
+    open_disk_cache,
+)
+
+
+@pytest.fixture
+def j2props_inputs(tmp_path):
+    values_file = tmp_path / "input.yml"
+    values_file.write_text("db:\n  password: app/db/password\n")
+    template_file = tmp_path / "application.properties"
+    template_file.write_text(
+        "password={{ db.password | awssecret }}\n"
+        "password.arn={{ db.password | awssecretarn }}\n"
+        "password.again={{ db.password | awssecret }}\n"
+        "password.previous={{ db.password | awssecret('AWSPREVIOUS') }}\n"
+    )
+    return str(values_file), str(template_file)
+
+
+def test_one_lookup_per_secret_and_version_stage(j2props_inputs, secrets_client):
+    client = secrets_client()
+    j2props_template = J2PropsTemplate()
+    j2props_template._aws_client = client
+
+    output = j2props_template.render_from_template(*j2props_inputs)
+
+    assert "password=value-of-app/db/password" in output
+    assert "password.arn=arn:aws:secretsmanager:" in output
+    assert client.calls == 2
+    assert j2props_template.secret_cache.stats() == (4, 0, 2)
+
+
+def test_disk_cache_serves_the_next_runs(tmp_path, secrets_client):
+    key = Fernet.generate_key()
+    client = secrets_client()
+
+    def fetch(secret_id, version_stage):
+        return client.get_secret_value(SecretId=secret_id, VersionStage=version_stage)
+
+    for _ in range(3):
+        disk_cache = EncryptedDiskCache(str(tmp_path / "secrets"), key, ttl=60)
+        secret = SecretCache(fetch, disk_cache).get("app/db/password")
+        assert secret["SecretString"] == "value-of-app/db/password"
+    assert client.calls == 1
+    for path in (tmp_path / "secrets").iterdir():
+        assert b"value-of" not in path.read_bytes()
+
+    expired = EncryptedDiskCache(str(tmp_path / "secrets"), key, ttl=-1)
+    SecretCache(fetch, expired).get("app/db/password")
+    assert client.calls == 2
+
+
+def test_disk_cache_is_not_shared_between_identities(
+    tmp_path, monkeypatch, secrets_client
+):
+    monkeypatch.setenv(CACHE_KEY_ENV_VAR, Fernet.generate_key().decode())
+    client = secrets_client()
+
+    def fetch(secret_id, version_stage):
+        return client.get_secret_value(SecretId=secret_id, VersionStage=version_stage)
+
+    for identity in [
+        "arn:aws:iam::111111111111:role/a",
+        "arn:aws:iam::222222222222:role/a",
+    ]:
+        for _ in range(2):
+            disk_cache = open_disk_cache(str(tmp_path), 60, "us-east-2", identity)
+            SecretCache(fetch, disk_cache).get("app/db/password")
+    assert client.calls == 2
+
+
+def test_caller_identity_leaves_the_session_name_out(monkeypatch):
+    sts = FakeClient(
+        {
+            "get_caller_identity": {
+                "Account": "123456789012",
+                "Arn": "arn:aws:sts::123456789012:assumed-role/deployer/run-42",
+            }
+        }
+    )
+    monkeypatch.setattr(
+        "libs.boto3.clients.get_client", lambda service, region=None: sts
+    )
+
+    assert caller_identity() == "arn:aws:sts::123456789012:assumed-role/deployer"
@@ -0,0 +1,74 @@
+import logging
+
+from libs.j2props.j2props_utils import J2PropsTemplate
+
+
+def write_inputs(tmp_path, num_secrets):
+    values = ["secrets:"] + [
+        f"  s{index}: app/secret/{index}" for index in range(num_secrets)
+    ]
+    values += ["names:", "  - app/dynamic/0", "  - app/dynamic/1"]
+    (tmp_path / "input.yml").write_text("\n".join(values) + "\n")
+    (tmp_path / "secrets.properties").write_text(
+        "".join(
+            f"s{index}={{{{ secrets.s{index} | awssecret }}}}\n"
+            for index in range(num_secrets)
+        )
+    )
+    (tmp_path / "application.properties").write_text(
+        '{% include "secrets.properties" %}\n'
+        "arn={{ secrets['s0'] | awssecretarn }}\n"
+        "previous={{ secrets.s1 | awssecret('AWSPREVIOUS') }}\n"
+        "{% for name in names %}{{ name | awssecret }}\n{% endfor %}"
+    )
+    return str(tmp_path / "input.yml"), str(tmp_path / "application.properties")
+
+
+def test_secrets_are_prefetched_in_batches(tmp_path, secrets_client):
+    client = secrets_client(batch=True)
+    j2props_template = J2PropsTemplate()
+    j2props_template._aws_client = client
+
+    output = j2props_template.render_from_template(*write_inputs(tmp_path, 45))
+
+    assert "s44=value-of-app/secret/44" in output
+    assert "value-of-app/dynamic/1" in output
+    assert sorted(len(batch) for batch in client.batches) == [5, 20, 20]
+    # the previous version and the names computed in the loop are looked up one by one
+    assert client.calls == 45 + 3
+
+
+def test_secrets_are_prefetched_without_the_batch_api(tmp_path, secrets_client):
+    client = secrets_client()
+    j2props_template = J2PropsTemplate()
+    j2props_template._aws_client = client
+
+    j2props_template.render_from_template(*write_inputs(tmp_path, 30))
+    stats = j2props_template.secret_cache.stats()
+
+    assert client.calls == 33
+    # only the two names computed in the loop miss the cache during the render
+    assert stats.misses == 33
+    assert stats.hits == 30 + 2
+
+
+def test_failed_prefetches_are_logged(tmp_path, secrets_client, caplog):
+    client = secrets_client(batch=True)
+    client.batch_get_secret_value = lambda SecretIdList: {
+        "SecretValues": [],
+        "Errors": [
+            {"SecretId": secret_id, "ErrorCode": "AccessDeniedException"}
+            for secret_id in SecretIdList
+        ],
+    }
+    j2props_template = J2PropsTemplate()
+    j2props_template._aws_client = client
+
+    with caplog.at_level(logging.DEBUG, logger="libs.j2props.secret_prefetch"):
+        output = j2props_template.render_from_template(*write_inputs(tmp_path, 2))
+
+    assert "s1=value-of-app/secret/1" in output
+    assert (
+        "Failed to prefetch the secret app/secret/0: AccessDeniedException"
+        in caplog.text
+    )
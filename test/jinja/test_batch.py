@@ -0,0 +1,160 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+from libs.jinja.batch import BatchRenderer
+from libs.jinja.jinja_utils import find_environments
+from libs.jinja.template_files import find_templates
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    values_file = tmp_path / "values.yaml.jinja2"
+    values_file.write_text(
+        "common:\n"
+        "  env: {{ env }}\n"
+        "{% if env == 'qa' %}\n"
+        "  size: 1\n"
+        "{% elif env in ['uat', 'prod'] %}\n"
+        "  size: 3\n"
+        "{% endif %}\n"
+    )
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "_tags.jinja2").write_text("Tags: [{Key: env, Value: {{ env }}}]\n")
+    for index in range(6):
+        (templates / f"service_{index}.yaml.jinja2").write_text(
+            f"Name: service-{index}-{{{{ inputs.env }}}}\n"
+            "DesiredCount: {{ inputs.size }}\n"
+            "{% set env = inputs.env %}{% include '_tags.jinja2' %}\n"
+        )
+    return str(values_file), str(templates)
+
+
+def magicdust(*args):
+    result = subprocess.run(
+        [sys.executable, "helpers.py", "jinja", "sprinkle", *args],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def read_dir(directory):
+    return {
+        os.path.relpath(os.path.join(root, name), directory): open(
+            os.path.join(root, name)
+        ).read()
+        for root, _, files in os.walk(directory)
+        for name in files
+    }
+
+
+def test_process_pool_renders_the_same_files(inputs, tmp_path):
+    values_file, templates = inputs
+    templates_list = find_templates([templates])
+
+    serial = BatchRenderer(values_file, ["qa"]).render_to_dir(
+        templates_list, str(tmp_path / "serial")
+    )
+    magicdust(
+        "-f",
+        values_file,
+        "--environment-type",
+        "qa",
+        "-t",
+        templates,
+        "--output-dir",
+        str(tmp_path / "pool"),
+        "-j",
+        "3",
+    )
+
+    assert [os.path.basename(path) for path, _ in serial] == [
+        f"service_{index}.yaml" for index in range(6)
+    ]
+    assert read_dir(tmp_path / "pool") == read_dir(tmp_path / "serial")
+    assert read_dir(tmp_path / "pool")["service_4.yaml"] == (
+        "Name: service-4-qa\nDesiredCount: 1\nTags: [{Key: env, Value: qa}]\n"
+    )
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_templates_are_streamed_as_ndjson_or_yaml(inputs, jobs):
+    values_file, templates = inputs
+    arguments = ["-f", values_file, "--environment-type", "uat", "-t", templates]
+
+    ndjson = magicdust(*arguments, "--stream", "ndjson", "-j", jobs)
+    documents = list(
+        yaml.safe_load_all(magicdust(*arguments, "--stream", "yaml", "-j", jobs))
+    )
+
+    assert [json.loads(line) for line in ndjson.splitlines()] == documents
+    assert [document["Name"] for document in documents] == [
+        f"service-{index}-uat" for index in range(6)
+    ]
+    assert documents[0]["Tags"] == [{"Key": "env", "Value": "uat"}]
+
+
+def test_environment_matrix_is_found_in_the_values_file(inputs, tmp_path):
+    values_file, templates = inputs
+
+    assert find_environments(values_file) == ["qa", "uat", "prod"]
+
+    magicdust(
+        "-f",
+        values_file,
+        "--environment-type",
+        "all-from-file",
+        "-t",
+        templates,
+        "--output-dir",
+        str(tmp_path / "out"),
+    )
+
+    outputs = read_dir(tmp_path / "out")
+    assert len(outputs) == 3 * 6
+    assert outputs[os.path.join("qa", "service_0.yaml")].startswith(
+        "Name: service-0-qa\nDesiredCount: 1\n"
+    )
+    assert outputs[os.path.join("prod", "service_5.yaml")].startswith(
+        "Name: service-5-prod\nDesiredCount: 3\n"
+    )
+
+
+def test_glob_matches_keep_their_relative_path(inputs, tmp_path):
+    values_file, _ = inputs
+    for directory in ["a", "b"]:
+        (tmp_path / "tpl" / directory).mkdir(parents=True)
+        (tmp_path / "tpl" / directory / "service.yaml.jinja2").write_text(
+            f"Name: {directory}-{{{{ inputs.env }}}}\n"
+        )
+
+    templates_list = find_templates([str(tmp_path / "tpl" / "**" / "*.jinja2")])
+    BatchRenderer(values_file, ["qa"], jobs=2).render_to_dir(
+        templates_list, str(tmp_path / "out")
+    )
+
+    assert read_dir(tmp_path / "out") == {
+        os.path.join("a", "service.yaml"): "Name: a-qa\n",
+        os.path.join("b", "service.yaml"): "Name: b-qa\n",
+    }
+    # Files given one by one are rendered under their own name
+    with pytest.raises(ValueError, match="both rendered into service.yaml"):
+        BatchRenderer(values_file, ["qa"]).render_to_dir(
+            find_templates(
+                [
+                    str(tmp_path / "tpl" / directory / "service.yaml.jinja2")
+                    for directory in ["a", "b"]
+                ]
+            ),
+            str(tmp_path / "out"),
+        )
@@ -0,0 +1,66 @@
+import pytest
+
+from libs.jinja.dynamic_vars import DynamicVarsText
+
+PREFIX = "AWS_ENV_VARS_"
+
+
+@pytest.fixture
+def values_text():
+    return (
+        "vpc_id: %%AWS_ENV_VARS_VPC_ID\n"
+        "subnet_1: %%AWS_ENV_VARS_SUBNET_ID_1\n"
+        "subnet_10: %%AWS_ENV_VARS_SUBNET_ID_10\n"
+        "other: %%OTHER_VAR\n"
+    )
+
+
+def test_substitutes_placeholders_without_matching_name_prefixes(values_text):
+    result = DynamicVarsText(values_text).substitute(
+        PREFIX,
+        {
+            "AWS_ENV_VARS_SUBNET_ID_1": "subnet-1",
+            "AWS_ENV_VARS_SUBNET_ID_10": "subnet-10",
+        },
+    )
+    assert "subnet_1: subnet-1\n" in result
+    assert "subnet_10: subnet-10\n" in result
+
+
+def test_keeps_variable_name_when_value_is_missing(values_text, monkeypatch):
+    monkeypatch.delenv("AWS_ENV_VARS_VPC_ID", raising=False)
+    result = DynamicVarsText(values_text).substitute(PREFIX, {})
+    assert "vpc_id: AWS_ENV_VARS_VPC_ID\n" in result
+    assert "%%" not in result
+
+
+def test_ignores_variables_without_the_prefix(values_text, monkeypatch):
+    monkeypatch.setenv("OTHER_VAR", "value")
+    result = DynamicVarsText(values_text).substitute(PREFIX, {"OTHER_VAR": "value"})
+    assert "other: OTHER_VAR\n" in result
+
+
+def test_explicit_values_take_precedence_over_environment(values_text, monkeypatch):
+    monkeypatch.setenv("AWS_ENV_VARS_VPC_ID", "vpc-env")
+    text = DynamicVarsText(values_text)
+    assert "vpc_id: vpc-env\n" in text.substitute(PREFIX)
+    assert "vpc_id: vpc-1\n" in text.substitute(
+        PREFIX, {"AWS_ENV_VARS_VPC_ID": "vpc-1"}
+    )
+
+
+def test_explicit_environment_replaces_the_one_of_the_os(values_text, monkeypatch):
+    monkeypatch.setenv("AWS_ENV_VARS_VPC_ID", "vpc-env")
+    text = DynamicVarsText(values_text)
+    assert "vpc_id: AWS_ENV_VARS_VPC_ID\n" in text.substitute(PREFIX, environ={})
+    assert "vpc_id: vpc-2\n" in text.substitute(
+        PREFIX, environ={"AWS_ENV_VARS_VPC_ID": "vpc-2"}
+    )
+
+
+def test_lists_referenced_variables(values_text):
+    assert DynamicVarsText(values_text).variables(PREFIX) == (
+        "AWS_ENV_VARS_SUBNET_ID_1",
+        "AWS_ENV_VARS_SUBNET_ID_10",
+        "AWS_ENV_VARS_VPC_ID",
+    )
@@ -0,0 +1,113 @@
+import pytest
+import yaml
+
+from libs.jinja.jinja_utils import JinjaTemplate, _ChunkReader
+
+
+@pytest.fixture
+def values_file(tmp_path):
+    path = tmp_path / "values.yaml.jinja2"
+    path.write_text(
+        "common:\n"
+        "  env: {{ env }}\n"
+        "  vpc_id: %%AWS_ENV_VARS_VPC_ID\n"
+        "  sg_id: %%AWS_ENV_VARS_SG_ID\n"
+    )
+    return str(path)
+
+
+def test_values_are_parsed_once_per_set_of_referenced_variables(
+    values_file, monkeypatch
+):
+    monkeypatch.delenv("AWS_ENV_VARS_VPC_ID", raising=False)
+    monkeypatch.delenv("AWS_ENV_VARS_SG_ID", raising=False)
+    jinja_template = JinjaTemplate(values_file, "qa")
+
+    first = jinja_template.process_input_yaml({"AWS_ENV_VARS_VPC_ID": "vpc-1"})
+    # The variables not referenced by the values file are not part of the key
+    again = jinja_template.process_input_yaml(
+        {"AWS_ENV_VARS_VPC_ID": "vpc-1", "AWS_ENV_VARS_SUBNET_ID_1": "subnet-1"}
+    )
+    other = jinja_template.process_input_yaml({"AWS_ENV_VARS_VPC_ID": "vpc-2"})
+
+    assert again is first
+    assert first["vpc_id"] == "vpc-1" and other["vpc_id"] == "vpc-2"
+    assert jinja_template.values_cache_info() == (1, 2, 2)
+
+
+def test_least_recently_used_values_are_evicted(values_file, monkeypatch):
+    monkeypatch.setattr("libs.jinja.jinja_utils.VALUES_CACHE_SIZE", 2)
+    jinja_template = JinjaTemplate(values_file, "qa")
+
+    for vpc_id in ["vpc-1", "vpc-2", "vpc-1", "vpc-3", "vpc-1", "vpc-2"]:
+        jinja_template.process_input_yaml({"AWS_ENV_VARS_VPC_ID": vpc_id})
+
+    # vpc-2 was evicted by vpc-3, vpc-1 being used more recently
+    assert jinja_template.values_cache_info() == (2, 4, 2)
+
+
+def test_requests_are_rendered_straight_to_objects(values_file, tmp_path):
+    template = tmp_path / "subnets.yaml.jinja2"
+    template.write_text(
+        "{% for zone in ['a', 'b', 'c'] %}\n"
+        "- VpcId: {{ inputs.vpc_id }}\n"
+        "  CidrBlock: 10.0.{{ loop.index }}.0/24\n"
+        "  AvailabilityZone: us-east-1{{ zone }}\n"
+        "  TagSpecifications:\n"
+        "    - Tags: [{Key: env, Value: {{ inputs.env }}}]\n"
+        "{% endfor %}\n"
+    )
+    jinja_template = JinjaTemplate(values_file, "qa")
+    dynamic_vars = {"AWS_ENV_VARS_VPC_ID": "vpc-1"}
+
+    requests = jinja_template.render_to_object(str(template), dynamic_vars)
+
+    assert requests == yaml.safe_load(
+        jinja_template.render_text(str(template), dynamic_vars)
+    )
+    assert [request["CidrBlock"] for request in requests] == [
+        "10.0.1.0/24",
+        "10.0.2.0/24",
+        "10.0.3.0/24",
+    ]
+    assert requests[2]["VpcId"] == "vpc-1"
+    assert requests[0]["TagSpecifications"] == [
+        {"Tags": [{"Key": "env", "Value": "qa"}]}
+    ]
+
+
+def test_chunk_reader_serves_reads_of_any_size():
+    reader = _ChunkReader(iter(["Vpc", "Id: ", "", "vpc-1\n"]))
+
+    assert reader.read(2) == "Vp"
+    assert reader.read(6) == "cId: v"
+    assert reader.read() == "pc-1\n"
+    assert reader.read(4) == ""
+
+
+class RecordingOut:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+
+
+@pytest.mark.parametrize("output_format", ["yaml", "json"])
+def test_templates_are_streamed_chunk_by_chunk(values_file, tmp_path, output_format):
+    template = tmp_path / "subnets.yaml.jinja2"
+    template.write_text(
+        "{% for index in range(200) %}\n"
+        "- CidrBlock: 10.0.{{ index }}.0/24\n"
+        "{% endfor %}\n"
+    )
+    jinja_template = JinjaTemplate(values_file, "qa")
+    out = RecordingOut()
+
+    jinja_template.stream_from_template(str(template), out, output_format)
+
+    assert len(out.writes) > 200
+    expected = jinja_template.generate_from_template(
+        str(template), output_format, print_output=False
+    )
+    assert "".join(out.writes) == expected + "\n"
@@ -0,0 +1,44 @@
+import os
+
+from libs.jinja.template_cache import TemplateCache
+
+
+def test_templates_are_compiled_again_once_their_file_changes(tmp_path):
+    path = tmp_path / "vpc.yaml.jinja2"
+    path.write_text("CidrBlock: {{ cidr }}\n")
+    cache = TemplateCache()
+
+    template = cache.get_template(str(path))
+    assert cache.get_template(str(path)) is template
+
+    # Same size, new mtime
+    path.write_text("CidrBlock: {{ vpc }}\n")
+    os.utime(path, ns=(1, 1))
+    template = cache.get_template(str(path))
+    assert template.render(vpc="10.0.0.0/16") == "CidrBlock: 10.0.0.0/16"
+
+    # Same mtime, new size
+    path.write_text("VpcCidrBlock: {{ vpc }}\n")
+    os.utime(path, ns=(1, 1))
+    assert cache.get_template(str(path)) is not template
+    assert cache.get_template(str(path)).render(vpc="10.1.0.0/16") == (
+        "VpcCidrBlock: 10.1.0.0/16"
+    )
+
+
+def test_bytecode_cache_serves_the_next_processes(tmp_path, monkeypatch):
+    path = tmp_path / "vpc.yaml.jinja2"
+    path.write_text("CidrBlock: {{ cidr }}\n")
+    bytecode_dir = tmp_path / "bytecode"
+    TemplateCache(bytecode_cache_dir=str(bytecode_dir)).get_template(str(path))
+    assert len(os.listdir(bytecode_dir)) == 1
+
+    cache = TemplateCache(bytecode_cache_dir=str(bytecode_dir))
+
+    def compile(*args, **kwargs):
+        raise AssertionError("the template was compiled again")
+
+    monkeypatch.setattr(cache.environment, "compile", compile)
+    assert cache.get_template(str(path)).render(cidr="10.0.0.0/16") == (
+        "CidrBlock: 10.0.0.0/16"
+    )
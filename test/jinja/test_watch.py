@@ -0,0 +1,52 @@
+import os
+
+from libs.jinja.jinja_utils import JinjaTemplate
+from libs.jinja.template_files import find_templates
+from libs.jinja.watch import TemplateWatcher
+
+
+def test_only_the_outputs_depending_on_the_changed_files_are_rendered(
+    tmp_path, monkeypatch
+):
+    values_file = tmp_path / "values.yaml.jinja2"
+    values_file.write_text("common:\n  env: {{ env }}\n")
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "_tags.jinja2").write_text("Tags: []\n")
+    (templates / "vpc.yaml.jinja2").write_text(
+        "Env: {{ inputs.env }}\n{% include '_tags.jinja2' %}\n"
+    )
+    (templates / "subnets.yaml.jinja2").write_text("Env: {{ inputs.env }}\n")
+    rendered = []
+    stream_from_template = JinjaTemplate.stream_from_template
+
+    def record(self, template_file, *args, **kwargs):
+        rendered.append(os.path.basename(template_file))
+        return stream_from_template(self, template_file, *args, **kwargs)
+
+    monkeypatch.setattr(JinjaTemplate, "stream_from_template", record)
+    watcher = TemplateWatcher(
+        str(values_file),
+        ["qa"],
+        find_templates([str(templates)]),
+        output_dir=str(tmp_path / "out"),
+    )
+    watcher.render(reload_values=True)
+    assert sorted(rendered) == ["subnets.yaml.jinja2", "vpc.yaml.jinja2"]
+
+    rendered.clear()
+    assert watcher.poll() == set()
+    assert rendered == []
+
+    (templates / "_tags.jinja2").write_text("Tags: [{Key: env, Value: qa}]\n")
+    assert watcher.poll() == {str(templates / "_tags.jinja2")}
+    assert rendered == ["vpc.yaml.jinja2"]
+    assert (tmp_path / "out" / "vpc.yaml").read_text() == (
+        "Env: qa\nTags: [{Key: env, Value: qa}]\n"
+    )
+
+    rendered.clear()
+    values_file.write_text("common:\n  env: qa-{{ env }}\n")
+    watcher.poll()
+    assert sorted(rendered) == ["subnets.yaml.jinja2", "vpc.yaml.jinja2"]
+    assert (tmp_path / "out" / "subnets.yaml").read_text() == "Env: qa-qa\n"
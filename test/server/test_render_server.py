@@ -0,0 +1,113 @@
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from libs.server.client import send_request
+from libs.server.render_server import RenderServer
+
+
+@pytest.fixture
+def slow_client(secrets_client):
+    # The lookups take some time, so the concurrent renders overlap
+    return secrets_client(delay=0.01)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch, slow_client):
+    monkeypatch.setattr(
+        "libs.boto3.clients.get_client",
+        lambda service, region=None: slow_client,
+    )
+    socket_path = str(tmp_path / "render.sock")
+    server = RenderServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def jinja_files(tmp_path):
+    values = tmp_path / "values.yaml.jinja2"
+    values.write_text("common:\n  env: {{ env }}\n  vpc_id: %%AWS_ENV_VARS_VPC_ID\n")
+    template = tmp_path / "vpc.yaml.jinja2"
+    template.write_text("VpcId: {{ inputs.vpc_id }}\nEnv: {{ inputs.env }}\n")
+    return str(values), str(template)
+
+
+def jinja_request(jinja_files, dynamic_vars):
+    values, template = jinja_files
+    return {
+        "command": "jinja",
+        "values": values,
+        "environment": "qa",
+        "templates": [template],
+        "dynamic_vars": dynamic_vars,
+    }
+
+
+def test_socket_is_only_accessible_by_its_owner(server):
+    assert stat.S_IMODE(os.stat(server).st_mode) == 0o600
+
+
+def test_concurrent_jinja_requests_keep_their_dynamic_vars(server, jinja_files):
+    vpc_ids = [f"vpc-{index}" for index in range(20)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        outputs = list(
+            executor.map(
+                lambda vpc_id: send_request(
+                    server,
+                    jinja_request(jinja_files, {"AWS_ENV_VARS_VPC_ID": vpc_id}),
+                ),
+                vpc_ids,
+            )
+        )
+
+    assert outputs == [f"VpcId: {vpc_id}\nEnv: qa\n" for vpc_id in vpc_ids]
+
+
+def test_jinja_requests_do_not_see_the_environment_of_the_server(
+    server, jinja_files, monkeypatch
+):
+    monkeypatch.setenv("AWS_ENV_VARS_VPC_ID", "vpc-of-the-server")
+
+    output = send_request(server, jinja_request(jinja_files, {}))
+
+    assert output.startswith("VpcId: AWS_ENV_VARS_VPC_ID\n")
+
+
+def test_concurrent_j2props_requests_keep_their_secrets(server, slow_client, tmp_path):
+    (tmp_path / "application.properties").write_text(
+        "password={{ db.password | awssecret }}\n"
+        "arn={{ db.password | awssecretarn }}\n"
+    )
+    requests = []
+    for index in range(10):
+        values = tmp_path / f"service-{index}.yml"
+        values.write_text(f"db:\n  password: app/{index}/db\n")
+        requests.append(
+            {
+                "command": "j2props",
+                "values": str(values),
+                "template": str(tmp_path / "application.properties"),
+            }
+        )
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        outputs = list(
+            executor.map(lambda request: send_request(server, request), requests)
+        )
+
+    for index, output in enumerate(outputs):
+        assert f"password=value-of-app/{index}/db\n" in output
+        assert output.endswith(f"secret:app/{index}/db\n")
+    # No request cleared the secrets of another one while it was rendering
+    assert sorted(slow_client.secret_ids) == sorted(
+        f"app/{index}/db" for index in range(10)
+    )
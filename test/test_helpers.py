@@ -0,0 +1,39 @@
+import pytest
+
+from helpers import create_parser
+
+AWS_ARGS = [
+    "aws",
+    "ecs-fargate",
+    "create",
+    "--environment-type",
+    "qa",
+    "-f",
+    "values.yaml",
+    "-d",
+    "templates",
+]
+
+
+@pytest.mark.parametrize(
+    "argv, profile, aws_profile",
+    [
+        (["--profile", "trace.json"] + AWS_ARGS, "trace.json", None),
+        (AWS_ARGS + ["--aws-profile", "deployer"], None, "deployer"),
+        (
+            ["--profile", "trace.json"] + AWS_ARGS + ["--aws-profile", "deployer"],
+            "trace.json",
+            "deployer",
+        ),
+    ],
+)
+def test_trace_profile_and_aws_profile_are_separate(argv, profile, aws_profile):
+    args = create_parser().parse_args(argv)
+
+    assert args.profile == profile
+    assert args.aws_profile == aws_profile
+
+
+def test_aws_command_does_not_accept_the_trace_profile():
+    with pytest.raises(SystemExit):
+        create_parser().parse_args(AWS_ARGS + ["--profile", "deployer"])
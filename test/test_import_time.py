@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules which only the implementations of the commands need
+HEAVY_MODULES = {"boto3", "botocore", "benedict", "jinja2", "yaml"}
+# Modules which only the aws command needs
+AWS_ONLY_MODULES = {"boto3", "botocore", "benedict", "libs.boto3.common"}
+
+# Prints the modules imported by helpers, and by its main function when arguments are given
+SCRIPT = """
+import json
+import sys
+
+import helpers
+
+if len(sys.argv) > 1:
+    try:
+        helpers.main()
+    except SystemExit:
+        pass
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def imported_modules(*cli_args):
+    """
+    Runs helpers in a clean interpreter
+    :return: The result of the process and the set of the modules it imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT, *cli_args],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result, set(json.loads(result.stderr.splitlines()[-1]))
+
+
+@pytest.fixture
+def jinja_inputs(tmp_path):
+    values_file = tmp_path / "values.yaml"
+    values_file.write_text("common:\n  env: {{ env }}\n")
+    template_file = tmp_path / "env.yaml.jinja2"
+    template_file.write_text("env: {{ inputs.env }}\n")
+    return str(values_file), str(template_file)
+
+
+def test_helpers_imports_no_implementation():
+    result, imported = imported_modules()
+    assert result.returncode == 0, result.stderr
+    assert not imported & HEAVY_MODULES
+
+
+def test_jinja_help_imports_no_implementation():
+    result, imported = imported_modules("jinja", "-h")
+    assert "usage: magicdust jinja" in result.stdout
+    assert not imported & HEAVY_MODULES
+
+
+def test_jinja_render_imports_no_aws_modules(jinja_inputs):
+    values_file, template_file = jinja_inputs
+    result, imported = imported_modules(
+        "jinja",
+        "sprinkle",
+        "-f",
+        values_file,
+        "--environment-type",
+        "qa",
+        "-t",
+        template_file,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "env: qa" in result.stdout
+    assert "jinja2" in imported
+    assert not imported & AWS_ONLY_MODULES
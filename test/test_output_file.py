@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+import libs.output_file as output_file
+from libs.output_file import AtomicOutput, write_if_changed
+
+
+def test_unchanged_content_keeps_the_file(tmp_path):
+    path = tmp_path / "out" / "application.properties"
+    assert write_if_changed(str(path), "a=1\n")
+    os.utime(path, ns=(1, 1))
+
+    assert not write_if_changed(str(path), "a=1\n")
+    assert path.stat().st_mtime_ns == 1
+    assert write_if_changed(str(path), "a=2\n")
+    assert path.read_text() == "a=2\n"
+    assert os.listdir(path.parent) == ["application.properties"]
+
+
+def test_failed_render_leaves_the_file_untouched(tmp_path):
+    path = tmp_path / "subnets.yaml"
+    path.write_text("old\n")
+    path.chmod(0o640)
+
+    with pytest.raises(RuntimeError):
+        with AtomicOutput(str(path)) as out:
+            out.write("partial")
+            raise RuntimeError("render failed")
+    assert path.read_text() == "old\n"
+    assert os.listdir(tmp_path) == ["subnets.yaml"]
+
+    with AtomicOutput(str(path)) as out:
+        out.write("new\n")
+    assert out.changed
+    assert path.stat().st_mode & 0o777 == 0o640
+
+
+@pytest.fixture
+def umask():
+    previous = os.umask(0o027)
+    yield 0o027
+    os.umask(previous)
+
+
+def test_new_files_are_created_with_the_umask(tmp_path, umask):
+    write_if_changed(str(tmp_path / "a.properties"), "a=1\n")
+
+    assert (tmp_path / "a.properties").stat().st_mode & 0o777 == 0o640
+
+
+def test_umask_is_probed_without_proc(tmp_path, umask, monkeypatch):
+    real_open = open
+
+    def open_without_proc(path, *args, **kwargs):
+        if path == "/proc/self/status":
+            raise FileNotFoundError(path)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(output_file, "open", open_without_proc, raising=False)
+
+    write_if_changed(str(tmp_path / "a.properties"), "a=1\n")
+
+    assert (tmp_path / "a.properties").stat().st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["a.properties"]
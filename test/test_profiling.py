@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from libs import profiling
+from libs.jinja.jinja_utils import JinjaTemplate
+
+
+@pytest.fixture
+def profiler():
+    yield profiling.enable_profiling()
+    profiling.disable_profiling()
+
+
+def test_span_is_a_no_op_when_profiling_is_disabled():
+    profiling.disable_profiling()
+    with profiling.span("jinja.render") as recorded:
+        pass
+    assert recorded is profiling.span("anything")
+    assert not profiling.is_profiling_enabled()
+
+
+def test_jinja_phases_are_recorded(profiler, tmp_path):
+    values_file = tmp_path / "values.yaml"
+    values_file.write_text(
+        "common:\n  env: {{ env }}\n  vpc: '%%AWS_ENV_VARS_VPC_ID'\n"
+    )
+    template_file = tmp_path / "env.yaml.jinja2"
+    template_file.write_text("env: {{ inputs.env }}\nvpc: {{ inputs.vpc }}\n")
+
+    jinja_template = JinjaTemplate(str(values_file), "qa")
+    jinja_template.generate_from_template(
+        str(template_file),
+        "json",
+        print_output=False,
+        dynamic_vars={"AWS_ENV_VARS_VPC_ID": "vpc-1"},
+    )
+
+    names = {event["name"] for event in profiler.events}
+    assert {
+        "jinja.values.render",
+        "jinja.values.substitute",
+        "jinja.values.parse",
+        "jinja.template.load",
+        "jinja.render_parse",
+        "jinja.serialize",
+    } <= names
+
+
+def test_write_trace_and_summary(profiler, tmp_path):
+    with profiling.span("step.one", "step", resource="vpc"):
+        pass
+    with profiling.span("step.one", "step"):
+        pass
+    trace_file = tmp_path / "trace.json"
+    profiler.write_trace(str(trace_file))
+
+    trace = json.loads(trace_file.read_text())
+    events = trace["traceEvents"]
+    assert [event["name"] for event in events] == ["step.one", "step.one"]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    assert events[0]["args"] == {"resource": "vpc"}
+    summary = profiler.summary().splitlines()
+    assert summary[1].split()[:2] == ["step.one", "2"]